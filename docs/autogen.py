@@ -9,6 +9,7 @@ from keras.layers import convolutional
 from keras.layers import recurrent
 from keras.layers import core
 from keras.layers import noise
+from keras.layers import augmentation
 from keras.layers import normalization
 from keras.layers import advanced_activations
 from keras.layers import containers
@@ -20,6 +21,7 @@ from keras import models
 MODULES = [(convolutional, 'keras.layers.convolutional'),
            (recurrent, 'keras.layers.recurrent'),
            (noise, 'keras.layers.noise'),
+           (augmentation, 'keras.layers.augmentation'),
            (normalization, 'keras.layers.normalization'),
            (advanced_activations, 'keras.layers.advanced_activations'),
            (containers, 'keras.layers.containers'),
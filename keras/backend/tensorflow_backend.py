@@ -32,13 +32,25 @@ def variable(value, dtype=_FLOATX, name=None):
     return v
 
 
-def placeholder(shape=None, ndim=None, dtype=_FLOATX, name=None):
+def placeholder(shape=None, ndim=None, dtype=_FLOATX, name=None,
+                sparse=False):
+    '''Instantiate an input data placeholder variable.
+
+    If `sparse` is True, the placeholder is a sparse tensor,
+    to be fed with scipy.sparse matrices.
+    '''
+    if sparse:
+        return tf.sparse_placeholder(dtype, name=name)
     if not shape:
         if ndim:
             shape = [None for _ in range(ndim)]
     return tf.placeholder(dtype, shape=shape, name=name)
 
 
+def is_sparse(x):
+    return isinstance(x, tf.SparseTensor)
+
+
 def shape(x):
     return x.get_shape()
 
@@ -47,6 +59,12 @@ def ndim(x):
     return len(x.get_shape())
 
 
+def dtype(x):
+    '''Name of the dtype of a tensor or variable (e.g. 'float32').
+    '''
+    return x.dtype.name
+
+
 def eval(x):
     '''Run a graph.
     '''
@@ -83,6 +101,8 @@ def cast(x, dtype):
 # LINEAR ALGEBRA
 
 def dot(x, y):
+    if is_sparse(x):
+        return tf.sparse_tensor_dense_matmul(x, y)
     return tf.matmul(x, y)
 
 
@@ -102,6 +122,35 @@ def gather(reference, indices):
     return tf.gather(reference, indices)
 
 
+def unique(x):
+    '''
+    # Arguments
+        x: an int tensor.
+
+    # Returns
+        a tuple `(values, inverse)` where `values` is the 1D tensor
+        of the unique values of x, and `inverse` a tensor of the same
+        shape as x such that `gather(values, inverse) == x`.
+    '''
+    values, inverse = tf.unique(tf.reshape(x, [-1]))
+    return values, tf.reshape(inverse, tf.shape(x))
+
+
+def scatter_update(reference, indices, updates):
+    '''
+    # Arguments
+        reference: a variable.
+        indices: an int tensor of row indices.
+        updates: a tensor with the new values of `reference[indices]`.
+
+    # Returns
+        a tensor of same type as `reference`, in which
+        only the given rows have been replaced. Used as an update
+        of `reference`, this only writes the given rows.
+    '''
+    return tf.scatter_update(reference, indices, updates)
+
+
 # ELEMENT-WISE OPERATIONS
 
 def normalize_axis(axis, ndim):
@@ -332,6 +381,13 @@ def squeeze(x, axis):
     return tf.squeeze(x, [axis])
 
 
+def reverse(x, axes):
+    '''Reverse a tensor along the specified axes (list of integers).
+    '''
+    dims = [i in axes for i in range(ndim(x))]
+    return tf.reverse(x, dims)
+
+
 def temporal_padding(x, padding=1):
     '''Pad the middle dimension of a 3D tensor
     with "padding" zeros left and right.
@@ -354,6 +410,23 @@ def spatial_2d_padding(x, padding=(1, 1), dim_ordering='th'):
     return tf.pad(x, pattern)
 
 
+def spatial_2d_cropping(x, offsets, size, dim_ordering='th'):
+    '''Crop the 2 spatial dimensions of a 4D tensor to `size`
+    (rows, cols), starting at `offsets` (integers or integer scalar
+    tensors).
+    '''
+    offsets = [tf.cast(o, 'int32') for o in offsets]
+    if dim_ordering == 'th':
+        begin = tf.pack([0, 0, offsets[0], offsets[1]])
+        size = [-1, -1, size[0], size[1]]
+    elif dim_ordering == 'tf':
+        begin = tf.pack([0, offsets[0], offsets[1], 0])
+        size = [-1, size[0], size[1], -1]
+    else:
+        raise Exception('Invalid dim_ordering: ' + dim_ordering)
+    return tf.slice(x, begin, size)
+
+
 # VALUE MANIPULATION
 
 def get_value(x):
@@ -377,17 +450,35 @@ class Function(object):
         self.inputs = list(inputs)
         self.outputs = list(outputs)
         with tf.control_dependencies(self.outputs):
-            self.updates = [tf.assign(p, new_p) for (p, new_p) in updates]
+            self.updates = [_update_op(p, new_p) for (p, new_p) in updates]
 
     def __call__(self, inputs):
         assert type(inputs) in {list, tuple}
-        names = [v.name for v in self.inputs]
-        feed_dict = dict(zip(names, inputs))
+        feed_dict = {}
+        for tensor, value in zip(self.inputs, inputs):
+            if is_sparse(tensor):
+                value = value.tocoo()
+                indices = np.concatenate((np.expand_dims(value.row, 1),
+                                          np.expand_dims(value.col, 1)), 1)
+                feed_dict[tensor] = (indices, value.data, value.shape)
+            elif hasattr(value, 'tocsr'):
+                # scipy sparse matrix fed to a dense placeholder
+                feed_dict[tensor.name] = value.toarray()
+            else:
+                feed_dict[tensor.name] = value
         session = _get_session()
         updated = session.run(self.outputs + self.updates, feed_dict=feed_dict)
         return updated[:len(self.outputs)]
 
 
+def _update_op(p, new_p):
+    if new_p.op.type == 'ScatterUpdate' and new_p.op.inputs[0].op.name == p.op.name:
+        # row updates (see `scatter_update`) are applied in place,
+        # instead of assigning the whole variable
+        return tf.scatter_update(p, new_p.op.inputs[1], new_p.op.inputs[2])
+    return tf.assign(p, new_p)
+
+
 def function(inputs, outputs, updates=[]):
     return Function(inputs, outputs, updates=updates)
 
@@ -396,6 +487,54 @@ def gradients(loss, variables):
     return tf.gradients(loss, variables)
 
 
+def checkpoint(outputs, inputs):
+    '''Return tensors equal to the list of tensors `outputs`,
+    computed from the list of tensors `inputs`, whose intermediate
+    results are not stored for the backward pass.
+
+    Recomputation during backprop is not supported by
+    the TensorFlow backend: this simply returns `outputs`.
+    '''
+    return list(outputs)
+
+
+def has_random_draws(outputs, inputs=[]):
+    '''Whether computing the list of tensors `outputs` from the
+    list of tensors `inputs` draws random numbers.
+    '''
+    blockers = set(x.name for x in inputs)
+    visited = set()
+    ops = [x.op for x in outputs if x.name not in blockers]
+    while ops:
+        op = ops.pop()
+        if op.name in visited:
+            continue
+        visited.add(op.name)
+        if op.type.startswith('Random') or op.type in {'TruncatedNormal', 'Multinomial'}:
+            return True
+        ops += [x.op for x in op.inputs if x.name not in blockers]
+    return False
+
+
+def depends_on(outputs, variable, inputs=[]):
+    '''Whether computing the list of tensors `outputs` from the
+    list of tensors `inputs` reads the variable `variable`.
+    '''
+    blockers = set(x.name for x in inputs)
+    visited = set()
+    ops = [x.op for x in outputs if x.name not in blockers]
+    while ops:
+        op = ops.pop()
+        if op.name in visited:
+            continue
+        visited.add(op.name)
+        if op.name == variable.op.name:
+            return True
+        ops += [x.op for x in op.inputs if x.name not in blockers]
+    return False
+
+
+
 # CONTROL FLOW
 
 def rnn(step_function, inputs, initial_states,
@@ -422,6 +561,10 @@ def rnn(step_function, inputs, initial_states,
             the time dimension in reverse order.
         mask: binary tensor with shape (samples, time, 1),
             with a zero for every element that is masked.
+            The mask can also contain segment ids (as output by
+            `Embedding(packed=True)`): the states are then reset to
+            `initial_states` at the start of each segment, i.e. whenever
+            two successive non-zero mask values are different.
 
     # Returns
         A tuple (last_output, outputs, new_states).
@@ -445,15 +588,28 @@ def rnn(step_function, inputs, initial_states,
         input_list.reverse()
 
     if mask is not None:
-        # Transpose not supported by bool tensor types, hence round-trip to uint8.
-        mask = tf.cast(mask, tf.uint8)
+        # Transpose not supported by bool tensor types, hence round-trip
+        # to int32 (which also keeps segment ids).
+        mask = tf.cast(mask, tf.int32)
         if len(mask.get_shape()) == ndim-1:
             mask = expand_dims(mask)
-        mask = tf.cast(tf.transpose(mask, axes), tf.bool)
-        mask_list = tf.unpack(mask)
-
-        for input, mask_t in zip(input_list, mask_list):
-            output, new_states = step_function(input, states)
+        mask_values = tf.unpack(tf.transpose(mask, axes))
+        if go_backwards:
+            mask_values.reverse()
+        mask_list = [tf.not_equal(mask_t, 0) for mask_t in mask_values]
+
+        for t, (input, mask_t) in enumerate(zip(input_list, mask_list)):
+            if t > 0:
+                # reset the states at segment boundaries
+                reset_t = tf.logical_and(tf.not_equal(mask_values[t], mask_values[t - 1]),
+                                         tf.logical_and(mask_t, mask_list[t - 1]))
+                step_states = []
+                for initial_state, state in zip(initial_states, states):
+                    tiled_reset_t = tf.tile(reset_t, tf.pack([1, tf.shape(state)[1]]))
+                    step_states.append(tf.select(tiled_reset_t, initial_state, state))
+            else:
+                step_states = states
+            output, new_states = step_function(input, step_states)
 
             # tf.select needs its condition tensor to be the same shape as its two
             # result tensors, but in our case the condition (mask) tensor is
@@ -704,3 +860,11 @@ def random_uniform(shape, low=0.0, high=1.0, dtype=_FLOATX, seed=None):
         seed = np.random.randint(10e6)
     return tf.random_uniform(shape, minval=low, maxval=high,
                              dtype=dtype, seed=seed)
+
+
+def random_binomial(shape, p=0.0, dtype=_FLOATX, seed=None):
+    if seed is None:
+        seed = np.random.randint(10e6)
+    return tf.select(tf.random_uniform(shape, dtype=dtype, seed=seed) <= p,
+                     tf.ones(shape, dtype=dtype),
+                     tf.zeros(shape, dtype=dtype))
@@ -3,6 +3,10 @@ from theano import tensor as T
 from theano.sandbox.rng_mrg import MRG_RandomStreams as RandomStreams
 from theano.tensor.signal import downsample
 from theano.tensor.nnet import conv3d2d
+try:
+    from theano import sparse as th_sparse_module
+except ImportError:
+    th_sparse_module = None
 import numpy as np
 from .common import _FLOATX, _EPSILON
 
@@ -35,17 +39,30 @@ def variable(value, dtype=_FLOATX, name=None):
     return theano.shared(value=value, name=name, strict=False)
 
 
-def placeholder(shape=None, ndim=None, dtype=_FLOATX, name=None):
+def placeholder(shape=None, ndim=None, dtype=_FLOATX, name=None,
+                sparse=False):
     '''Instantiate an input data placeholder variable.
+
+    If `sparse` is True, the placeholder is a 2D sparse (CSR) matrix,
+    to be fed with scipy.sparse matrices.
     '''
     if shape is None and ndim is None:
         raise Exception('Specify either a shape or ndim value.')
     if shape is not None:
         ndim = len(shape)
+    if sparse:
+        if ndim != 2:
+            raise Exception('Sparse placeholders must be 2D.')
+        return th_sparse_module.csr_matrix(name=name, dtype=dtype)
     broadcast = (False,) * ndim
     return T.TensorType(dtype, broadcast)(name)
 
 
+def is_sparse(x):
+    return (th_sparse_module is not None and
+            isinstance(x.type, th_sparse_module.SparseType))
+
+
 def shape(x):
     '''Return the shape of a tensor.
 
@@ -59,6 +76,12 @@ def ndim(x):
     return x.ndim
 
 
+def dtype(x):
+    '''Name of the dtype of a tensor or variable (e.g. 'float32').
+    '''
+    return x.dtype
+
+
 def eval(x):
     '''Run a graph.
     '''
@@ -106,6 +129,8 @@ Assumed overridden:
 
 
 def dot(x, y):
+    if is_sparse(x):
+        return th_sparse_module.basic.structured_dot(x, y)
     return T.dot(x, y)
 
 
@@ -122,6 +147,27 @@ def gather(reference, indices):
     return reference[indices]
 
 
+def unique(x):
+    '''x: an int tensor.
+
+    Return: a tuple `(values, inverse)` where `values` is the
+    1D tensor of the unique values of x, and `inverse` a tensor
+    of the same shape as x such that `values[inverse] == x`.
+    '''
+    from theano.tensor.extra_ops import Unique
+    values, inverse = Unique(return_inverse=True)(x)
+    return values, T.reshape(inverse, x.shape)
+
+
+def scatter_update(reference, indices, updates):
+    '''Return a copy of reference in which the rows
+    `reference[indices]` are replaced by `updates`.
+
+    Used as an update, this only writes the given rows.
+    '''
+    return T.set_subtensor(reference[indices], updates)
+
+
 # ELEMENT-WISE OPERATIONS
 
 
@@ -359,6 +405,14 @@ def squeeze(x, axis):
     return T.squeeze(x)
 
 
+def reverse(x, axes):
+    '''Reverse a tensor along the specified axes (list of integers).
+    '''
+    indices = [slice(None, None, -1) if i in axes else slice(None)
+               for i in range(x.ndim)]
+    return x[tuple(indices)]
+
+
 def temporal_padding(x, padding=1):
     '''Pad the middle dimension of a 3D tensor
     with "padding" zeros left and right.
@@ -405,6 +459,21 @@ def spatial_2d_padding(x, padding=(1, 1), dim_ordering='th'):
     return T.set_subtensor(output[indices], x)
 
 
+def spatial_2d_cropping(x, offsets, size, dim_ordering='th'):
+    '''Crop the 2 spatial dimensions of a 4D tensor to `size`
+    (rows, cols), starting at `offsets` (integers or integer scalar
+    tensors).
+    '''
+    rows = slice(offsets[0], offsets[0] + size[0])
+    cols = slice(offsets[1], offsets[1] + size[1])
+    if dim_ordering == 'th':
+        return x[:, :, rows, cols]
+    elif dim_ordering == 'tf':
+        return x[:, rows, cols, :]
+    else:
+        raise Exception('Invalid dim_ordering: ' + dim_ordering)
+
+
 def spatial_3d_padding(x, padding=(1, 1, 1), dim_ordering='th'):
     '''Pad the 2nd, 3rd and 4th dimensions of a 5D tensor
     with "padding[0]", "padding[1]" and "padding[1]" (resp.) zeros left and right.
@@ -459,14 +528,26 @@ def set_value(x, value):
 class Function(object):
 
     def __init__(self, inputs, outputs, updates=[], **kwargs):
+        self.inputs = list(inputs)
         self.function = theano.function(inputs, outputs, updates=updates,
                                         allow_input_downcast=True, on_unused_input='warn',**kwargs)
 
     def __call__(self, inputs):
         assert type(inputs) in {list, tuple}
+        inputs = [_to_input_value(x, value) for x, value in zip(self.inputs, inputs)]
         return self.function(*inputs)
 
 
+def _to_input_value(x, value):
+    # scipy sparse matrices are only densified
+    # when fed to a dense placeholder
+    if hasattr(value, 'tocsr'):
+        if is_sparse(x):
+            return value.tocsr()
+        return value.toarray()
+    return value
+
+
 def function(inputs, outputs, updates=[]):
     return Function(inputs, outputs, updates=updates)
 
@@ -475,6 +556,51 @@ def gradients(loss, variables):
     return T.grad(loss, variables)
 
 
+def checkpoint(outputs, inputs):
+    '''Return tensors equal to the list of tensors `outputs`,
+    computed from the list of tensors `inputs`, whose intermediate
+    results are not stored for the backward pass: they are recomputed
+    from `inputs` when gradients are computed.
+
+    The updates of the random number generators used between
+    `inputs` and `outputs` would be lost, as well as any update
+    computed from the intermediate results: such computations should
+    be kept out of the checkpointed graph (see `has_random_draws`).
+    '''
+    fresh_inputs = [x.type() for x in inputs]
+    fresh_outputs = theano.clone(outputs, replace=dict(zip(inputs, fresh_inputs)))
+    # tensors of the enclosing graph the segment depends on (e.g. masks)
+    # become explicit inputs; shared variables are handled by OpFromGraph
+    free_inputs = [v for v in theano.gof.graph.inputs(fresh_outputs)
+                   if v not in fresh_inputs and
+                   not isinstance(v, (theano.gof.Constant,
+                                      theano.compile.SharedVariable))]
+    op = theano.OpFromGraph(fresh_inputs + free_inputs, fresh_outputs)
+    outputs = op(*(list(inputs) + free_inputs))
+    if not isinstance(outputs, (list, tuple)):
+        outputs = [outputs]
+    return list(outputs)
+
+
+def has_random_draws(outputs, inputs=[]):
+    '''Whether computing the list of tensors `outputs` from the
+    list of tensors `inputs` draws random numbers.
+    '''
+    for v in theano.gof.graph.inputs(outputs, blockers=inputs):
+        if (isinstance(v, theano.compile.SharedVariable) and
+                getattr(v, 'default_update', None) is not None):
+            return True
+    return False
+
+
+def depends_on(outputs, variable, inputs=[]):
+    '''Whether computing the list of tensors `outputs` from the
+    list of tensors `inputs` reads the variable `variable`.
+    '''
+    return variable in theano.gof.graph.inputs(outputs, blockers=inputs)
+
+
+
 # CONTROL FLOW
 
 def rnn(step_function, inputs, initial_states,
@@ -502,6 +628,10 @@ def rnn(step_function, inputs, initial_states,
         the time dimension in reverse order.
     mask: binary tensor with shape (samples, time),
         with a zero for every element that is masked.
+        The mask can also contain segment ids (as output by
+        `Embedding(packed=True)`): the states are then reset to
+        `initial_states` at the start of each segment, i.e. whenever
+        two successive non-zero mask values are different.
 
     Returns
     -------
@@ -525,13 +655,23 @@ def rnn(step_function, inputs, initial_states,
         assert mask.ndim == ndim
         mask = mask.dimshuffle(axes)
 
+        # mask of the previous step in the order of iteration
+        if go_backwards:
+            prev_mask = T.concatenate([mask[1:], mask[-1:]], axis=0)
+        else:
+            prev_mask = T.concatenate([mask[:1], mask[:-1]], axis=0)
+
         # build an all-zero tensor of shape (samples, output_dim)
         initial_output = step_function(inputs[0], initial_states)[0] * 0
         # Theano gets confused by broadcasting patterns in the scan op
         initial_output = T.unbroadcast(initial_output, 0, 1)
 
-        def _step(input, mask, output_tm1, *states):
-            output, new_states = step_function(input, states)
+        def _step(input, mask, mask_tm1, output_tm1, *states):
+            # reset the states at segment boundaries
+            reset = T.neq(mask, mask_tm1) * T.neq(mask, 0) * T.neq(mask_tm1, 0)
+            step_states = [T.switch(reset, initial_state, state)
+                           for initial_state, state in zip(initial_states, states)]
+            output, new_states = step_function(input, step_states)
             # output previous output if masked.
             output = T.switch(mask, output, output_tm1)
             return_states = []
@@ -541,7 +681,7 @@ def rnn(step_function, inputs, initial_states,
 
         results, _ = theano.scan(
             _step,
-            sequences=[inputs, mask],
+            sequences=[inputs, mask, prev_mask],
             outputs_info=[initial_output] + initial_states,
             go_backwards=go_backwards)
     else:
@@ -895,6 +1035,13 @@ def random_uniform(shape, low=0.0, high=1.0, dtype=_FLOATX, seed=None):
     rng = RandomStreams(seed=seed)
     return rng.uniform(shape, low=low, high=high, dtype=dtype)
 
+
+def random_binomial(shape, p=0.0, dtype=_FLOATX, seed=None):
+    if seed is None:
+        seed = np.random.randint(10e6)
+    rng = RandomStreams(seed=seed)
+    return rng.binomial(shape, p=p, dtype=dtype)
+
 '''
 more TODO:
 
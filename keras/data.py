@@ -0,0 +1,340 @@
+from __future__ import absolute_import
+import struct
+import threading
+import zipfile
+import numpy as np
+import six
+
+
+class Dataset(object):
+    '''Base class of the out-of-core datasets, which can be used
+    instead of numpy arrays as inputs, targets or validation data
+    of `fit`, `evaluate` and `predict`.
+
+    A dataset exposes the metadata of an array (`len`, `shape`,
+    `dtype`, `ndim`) and random-access reads of rows:
+    `dataset[i]`, `dataset[start:stop]` and `dataset[indices]`
+    (index list or array, or boolean mask) return numpy arrays.
+    Index arrays are sorted before reading, so that the rows of a
+    shuffled batch are read in storage order, and returned in the
+    requested order.
+
+    The rows of the next batch can be read in a background thread
+    (see `prefetch`), which `fit` does automatically.
+
+    Subclasses implement `shape`, `dtype` and `_gather`.
+
+    # Arguments
+        shuffle_window: if not None, `fit(shuffle=True)` only shuffles
+            the samples within windows of `shuffle_window` consecutive
+            samples (and the order of the windows), so that the reads
+            of a batch stay within one or two windows of the storage.
+            See `window_shuffle`.
+    '''
+    def __init__(self, shuffle_window=None):
+        self.shuffle_window = shuffle_window
+        self._prefetched = None
+
+    @property
+    def shape(self):
+        raise NotImplementedError
+
+    @property
+    def dtype(self):
+        raise NotImplementedError
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _gather(self, indices):
+        '''Read the rows `indices` (a sorted array of non-negative
+        indices), as a numpy array.
+        '''
+        raise NotImplementedError
+
+    def _slice(self, start, stop):
+        '''Read the rows `start:stop`, as a numpy array.
+        '''
+        return self._gather(np.arange(start, stop))
+
+    def _indices(self, key):
+        '''Convert `key` to an array of non-negative row indices.
+        '''
+        n = len(self)
+        key = np.asarray(key)
+        if key.dtype == np.bool_:
+            return np.nonzero(key)[0]
+        key = key.astype('int64')
+        if key.size and (key.max() >= n or key.min() < -n):
+            raise IndexError('Index out of range for a dataset '
+                             'of %d samples.' % n)
+        return np.where(key < 0, key + n, key)
+
+    def _take(self, indices):
+        order = np.argsort(indices, kind='mergesort')
+        data = self._gather(indices[order])
+        out = np.empty_like(data)
+        out[order] = data
+        return out
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self._take(self._indices([key]))[0]
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return self._slice(start, max(start, stop))
+            return self._gather(np.arange(start, stop, step))
+        indices = self._indices(key)
+        prefetched = self._collect_prefetch()
+        if prefetched is not None and np.array_equal(prefetched[0], indices):
+            return prefetched[1]
+        return self._take(indices)
+
+    def prefetch(self, key):
+        '''Read the rows `key` in a background thread, so that
+        `self[key]` returns them without waiting for the reads.
+        '''
+        self._collect_prefetch()
+        indices = self._indices(key)
+        result = []
+        thread = threading.Thread(target=lambda: result.append(self._take(indices)))
+        thread.daemon = True
+        thread.start()
+        self._prefetched = (indices, thread, result)
+
+    def _collect_prefetch(self):
+        '''Wait for the pending prefetch (if any), and return
+        its `(indices, data)`.
+        '''
+        if getattr(self, '_prefetched', None) is None:
+            return None
+        indices, thread, result = self._prefetched
+        self._prefetched = None
+        thread.join()
+        if not result:
+            # the read failed: it will be done (and raise) again
+            return None
+        return indices, result[0]
+
+    def subset(self, start=0, stop=None):
+        '''Dataset of the rows `start:stop`, without reading them.
+        '''
+        return SubsetDataset(self, start, stop)
+
+    def map(self, function, shape=None, dtype=None):
+        '''Dataset of the rows of this dataset transformed by
+        `function` when they are read. See `MappedDataset`.
+        '''
+        return MappedDataset(self, function, shape=shape, dtype=dtype)
+
+    def close(self):
+        self._collect_prefetch()
+
+
+class ArrayDataset(Dataset):
+    '''Dataset of a numpy array or memory-mapped array.
+
+    # Arguments
+        data: numpy array (or `np.memmap`), or path of a `.npy` file,
+            which is memory-mapped.
+        mmap_mode: mode used to memory-map a `.npy` file.
+        shuffle_window: see `Dataset`.
+    '''
+    def __init__(self, data, mmap_mode='r', shuffle_window=None):
+        super(ArrayDataset, self).__init__(shuffle_window=shuffle_window)
+        if isinstance(data, six.string_types):
+            data = np.load(data, mmap_mode=mmap_mode)
+        self.data = data
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    def _gather(self, indices):
+        return np.asarray(self.data[indices])
+
+    def _slice(self, start, stop):
+        return np.asarray(self.data[start:stop])
+
+
+def _npz_memmap(path, name, mode='r'):
+    '''Memory-map the member `name` of the npz file `path`,
+    which must be stored without compression (`np.savez`).
+    '''
+    with zipfile.ZipFile(path) as f:
+        info = f.getinfo(name + '.npy')
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise Exception('Array "%s" of %s is compressed and cannot be '
+                        'memory-mapped: save it with `np.savez` '
+                        'instead of `np.savez_compressed`.' % (name, path))
+    with open(path, 'rb') as f:
+        # the data follows the local header of the member, whose
+        # extra field can differ from the one of the central directory
+        f.seek(info.header_offset)
+        header = f.read(30)
+        name_length, extra_length = struct.unpack('<HH', header[26:30])
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    order = 'F' if fortran_order else 'C'
+    if not shape or not int(np.prod(shape)):
+        return np.zeros(shape, dtype=dtype, order=order)
+    return np.memmap(path, dtype=dtype, mode=mode, offset=offset,
+                     shape=shape, order=order)
+
+
+class NPZDataset(ArrayDataset):
+    '''Dataset of an array stored in an `.npz` file.
+
+    The array is memory-mapped, so it must have been saved without
+    compression (`np.savez`, not `np.savez_compressed`).
+
+    # Arguments
+        path: path of the `.npz` file.
+        name: name of the array in the file (e.g. `'arr_0'`).
+        shuffle_window: see `Dataset`.
+    '''
+    def __init__(self, path, name='arr_0', shuffle_window=None):
+        super(NPZDataset, self).__init__(_npz_memmap(path, name),
+                                         shuffle_window=shuffle_window)
+
+
+class HDF5Dataset(Dataset):
+    '''Dataset of an HDF5 dataset, read through
+    `keras.utils.io_utils.HDF5Matrix` (chunk-aligned reads,
+    block cache and block read-ahead).
+
+    # Arguments
+        datapath: path of the HDF5 file.
+        dataset: name of the dataset in the file.
+        shuffle_window: see `Dataset`. Using the number of rows
+            of a few HDF5 chunks keeps the reads of a batch in the cache.
+        kwargs: passed to `HDF5Matrix` (`start`, `end`,
+            `normalizer`, `cache_size`, `read_ahead`).
+    '''
+    def __init__(self, datapath, dataset, shuffle_window=None, **kwargs):
+        from .utils.io_utils import HDF5Matrix
+        super(HDF5Dataset, self).__init__(shuffle_window=shuffle_window)
+        self.matrix = HDF5Matrix(datapath, dataset, **kwargs)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def dtype(self):
+        return self.matrix.dtype
+
+    def _gather(self, indices):
+        return self.matrix[indices]
+
+    def _slice(self, start, stop):
+        return self.matrix[start:stop]
+
+    def _take(self, indices):
+        # HDF5Matrix sorts the indices itself
+        return self.matrix[indices]
+
+    def prefetch(self, key):
+        self.matrix.prefetch(self._indices(key))
+
+    def close(self):
+        self.matrix.close()
+
+
+class SubsetDataset(Dataset):
+    '''Dataset of the rows `start:stop` of another dataset.
+    '''
+    def __init__(self, dataset, start=0, stop=None):
+        super(SubsetDataset, self).__init__(
+            shuffle_window=getattr(dataset, 'shuffle_window', None))
+        start, stop, _ = slice(start, stop).indices(len(dataset))
+        self.dataset = dataset
+        self.start = start
+        self.stop = max(start, stop)
+
+    @property
+    def shape(self):
+        return (self.stop - self.start,) + tuple(self.dataset.shape[1:])
+
+    @property
+    def dtype(self):
+        return self.dataset.dtype
+
+    def _gather(self, indices):
+        return self.dataset._gather(indices + self.start)
+
+    def _slice(self, start, stop):
+        return self.dataset._slice(start + self.start, stop + self.start)
+
+
+class MappedDataset(Dataset):
+    '''Dataset of the rows of another dataset, transformed by
+    a function when they are read (e.g. decoding or normalization).
+
+    The function is applied to batches of rows, and must
+    transform each row independently.
+
+    # Arguments
+        dataset: `Dataset`.
+        function: function mapping an array of rows of `dataset`
+            to an array with the same number of rows.
+        shape: shape of the transformed dataset. By default it is
+            inferred by applying `function` to the first row.
+        dtype: dtype of the transformed dataset (inferred likewise).
+    '''
+    def __init__(self, dataset, function, shape=None, dtype=None):
+        super(MappedDataset, self).__init__(
+            shuffle_window=getattr(dataset, 'shuffle_window', None))
+        self.dataset = dataset
+        self.function = function
+        if shape is None or dtype is None:
+            sample = function(dataset[:1])
+            if shape is None:
+                shape = (len(dataset),) + sample.shape[1:]
+            if dtype is None:
+                dtype = sample.dtype
+        self._shape = tuple(shape)
+        self._dtype = np.dtype(dtype)
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    def _gather(self, indices):
+        return self.function(self.dataset._gather(indices))
+
+    def _slice(self, start, stop):
+        return self.function(self.dataset._slice(start, stop))
+
+
+def window_shuffle(index_array, window_size):
+    '''Shuffle `index_array` locally: the array is cut in windows of
+    `window_size` consecutive indices, the windows are shuffled, and
+    the indices are shuffled within each window.
+
+    With a window much larger than the batch size, the samples of a
+    batch are still drawn from across the window, while the reads of
+    an epoch sweep the storage window by window (out-of-core data).
+    '''
+    nb_window = int(np.ceil(len(index_array) / float(window_size)))
+    window_rank = np.random.permutation(nb_window)
+    keys = window_rank[np.arange(len(index_array)) // window_size] + np.random.random(len(index_array))
+    return index_array[np.argsort(keys)]
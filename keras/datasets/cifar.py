@@ -11,9 +11,7 @@ def load_batch(fpath, label_key='labels'):
     else:
         d = cPickle.load(f, encoding="bytes")
         # decode utf8
-        for k, v in d.items():
-            del(d[k])
-            d[k.decode("utf8")] = v
+        d = dict((k.decode("utf8"), v) for k, v in d.items())
     f.close()
     data = d["data"]
     labels = d[label_key]
@@ -1,30 +1,40 @@
 from __future__ import absolute_import
 from .cifar import load_batch
-from .data_utils import get_file
+from .data_utils import get_file, cache_arrays
 import numpy as np
 import os
 
 
-def load_data():
+def load_data(mmap_mode=None):
+    '''The dataset is converted once to `.npy` files cached next to
+    the downloaded files, which are then loaded with `np.load(mmap_mode)`.
+    By default the arrays are loaded in memory; use `mmap_mode='r'` to get
+    read-only memory-mapped arrays instead, so that processes loading
+    the dataset share the same memory.
+    '''
     dirname = "cifar-10-batches-py"
     origin = "http://www.cs.toronto.edu/~kriz/cifar-10-python.tar.gz"
     path = get_file(dirname, origin=origin, untar=True)
 
-    nb_train_samples = 50000
+    def build():
+        nb_train_samples = 50000
 
-    X_train = np.zeros((nb_train_samples, 3, 32, 32), dtype="uint8")
-    y_train = np.zeros((nb_train_samples,), dtype="uint8")
+        X_train = np.zeros((nb_train_samples, 3, 32, 32), dtype="uint8")
+        y_train = np.zeros((nb_train_samples,), dtype="uint8")
 
-    for i in range(1, 6):
-        fpath = os.path.join(path, 'data_batch_' + str(i))
-        data, labels = load_batch(fpath)
-        X_train[(i-1)*10000:i*10000, :, :, :] = data
-        y_train[(i-1)*10000:i*10000] = labels
+        for i in range(1, 6):
+            fpath = os.path.join(path, 'data_batch_' + str(i))
+            data, labels = load_batch(fpath)
+            X_train[(i-1)*10000:i*10000, :, :, :] = data
+            y_train[(i-1)*10000:i*10000] = labels
 
-    fpath = os.path.join(path, 'test_batch')
-    X_test, y_test = load_batch(fpath)
+        fpath = os.path.join(path, 'test_batch')
+        X_test, y_test = load_batch(fpath)
 
-    y_train = np.reshape(y_train, (len(y_train), 1))
-    y_test = np.reshape(y_test, (len(y_test), 1))
+        y_train = np.reshape(y_train, (len(y_train), 1))
+        y_test = np.reshape(y_test, (len(y_test), 1))
+        return {'X_train': X_train, 'y_train': y_train,
+                'X_test': X_test.astype('uint8'), 'y_test': y_test}
 
-    return (X_train, y_train), (X_test, y_test)
+    arrays = cache_arrays(dirname + '.npy', build, mmap_mode=mmap_mode)
+    return (arrays['X_train'], arrays['y_train']), (arrays['X_test'], arrays['y_test'])
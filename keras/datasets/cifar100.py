@@ -1,11 +1,17 @@
 from __future__ import absolute_import
 from .cifar import load_batch
-from .data_utils import get_file
+from .data_utils import get_file, cache_arrays
 import numpy as np
 import os
 
 
-def load_data(label_mode='fine'):
+def load_data(label_mode='fine', mmap_mode=None):
+    '''The dataset is converted once to `.npy` files cached next to
+    the downloaded files, which are then loaded with `np.load(mmap_mode)`.
+    By default the arrays are loaded in memory; use `mmap_mode='r'` to get
+    read-only memory-mapped arrays instead, so that processes loading
+    the dataset share the same memory.
+    '''
     if label_mode not in ['fine', 'coarse']:
         raise Exception('label_mode must be one of "fine" "coarse".')
 
@@ -13,16 +19,16 @@ def load_data(label_mode='fine'):
     origin = "http://www.cs.toronto.edu/~kriz/cifar-100-python.tar.gz"
     path = get_file(dirname, origin=origin, untar=True)
 
-    nb_test_samples = 10000
-    nb_train_samples = 50000
-
-    fpath = os.path.join(path, 'train')
-    X_train, y_train = load_batch(fpath, label_key=label_mode+'_labels')
-
-    fpath = os.path.join(path, 'test')
-    X_test, y_test = load_batch(fpath, label_key=label_mode+'_labels')
-
-    y_train = np.reshape(y_train, (len(y_train), 1))
-    y_test = np.reshape(y_test, (len(y_test), 1))
-
-    return (X_train, y_train), (X_test, y_test)
+    def build():
+        arrays = {}
+        for subset in ['train', 'test']:
+            fpath = os.path.join(path, subset)
+            for mode in ['fine', 'coarse']:
+                X, y = load_batch(fpath, label_key=mode+'_labels')
+                arrays['y_%s_%s' % (subset, mode)] = np.reshape(y, (len(y), 1))
+            arrays['X_' + subset] = X.astype('uint8')
+        return arrays
+
+    arrays = cache_arrays(dirname + '.npy', build, mmap_mode=mmap_mode)
+    return ((arrays['X_train'], arrays['y_train_' + label_mode]),
+            (arrays['X_test'], arrays['y_test_' + label_mode]))
@@ -3,6 +3,8 @@ from __future__ import print_function
 
 import tarfile
 import os
+import shutil
+import numpy as np
 from six.moves.urllib.request import FancyURLopener
 
 from ..utils.generic_utils import Progbar
@@ -13,13 +15,18 @@ class ParanoidURLopener(FancyURLopener):
         raise Exception('URL fetch failure on {}: {} -- {}'.format(url, errcode, errmsg))
 
 
-def get_file(fname, origin, untar=False):
+def get_datadir():
     datadir_base = os.path.expanduser(os.path.join('~', '.keras'))
     if not os.access(datadir_base, os.W_OK):
         datadir_base = os.path.join('/tmp', '.keras')
     datadir = os.path.join(datadir_base, 'datasets')
     if not os.path.exists(datadir):
         os.makedirs(datadir)
+    return datadir
+
+
+def get_file(fname, origin, untar=False):
+    datadir = get_datadir()
 
     if untar:
         untar_fpath = os.path.join(datadir, fname)
@@ -51,3 +58,116 @@ def get_file(fname, origin, untar=False):
         return untar_fpath
 
     return fpath
+
+
+def cache_arrays(name, build, mmap_mode='r'):
+    '''Return a dictionary of numpy arrays cached as `.npy` files in
+    the directory `name` of the datasets directory.
+    The first time, the arrays are returned by `build()` and saved;
+    afterwards they are loaded (memory-mapped, with the default `mmap_mode`),
+    which is much faster than decoding the original dataset files.
+    '''
+    cachedir = os.path.join(get_datadir(), name)
+    if not os.path.exists(cachedir):
+        arrays = build()
+        # write to a temporary directory renamed at the end, so that
+        # an interrupted conversion never leaves an incomplete cache
+        tmpdir = cachedir + '.tmp.' + str(os.getpid())
+        if os.path.exists(tmpdir):
+            shutil.rmtree(tmpdir)
+        os.makedirs(tmpdir)
+        for key, array in arrays.items():
+            np.save(os.path.join(tmpdir, key + '.npy'), array)
+        try:
+            os.rename(tmpdir, cachedir)
+        except OSError:
+            # another process created the cache in the meantime
+            shutil.rmtree(tmpdir)
+    arrays = {}
+    for fname in os.listdir(cachedir):
+        if fname.endswith('.npy'):
+            arrays[fname[:-4]] = np.load(os.path.join(cachedir, fname), mmap_mode=mmap_mode)
+    return arrays
+
+
+def sequences_to_arrays(X, labels):
+    '''Convert a list of sequences and their labels to the arrays
+    expected by `load_sequence_data` (and cached by `cache_arrays`).
+    '''
+    lengths = np.array([len(x) for x in X], dtype='int64')
+    offsets = np.zeros((len(X) + 1,), dtype='int64')
+    np.cumsum(lengths, out=offsets[1:])
+    values = np.fromiter((w for x in X for w in x), dtype='int32', count=offsets[-1])
+    return {'values': values, 'offsets': offsets,
+            'labels': np.asarray(labels, dtype='int64')}
+
+
+def load_sequence_data(values, offsets, labels, nb_words=None, skip_top=0,
+                       maxlen=None, test_split=0.2, seed=113,
+                       start_char=1, oov_char=2, index_from=3, ragged=False):
+    '''Shuffle, filter and split a text dataset stored as flat word
+    indexes (`values`) and sequence `offsets` (see `RaggedSequences`),
+    as done by `imdb.load_data` and `reuters.load_data`.
+    All the operations are vectorized.
+    '''
+    from ..preprocessing.sequence import RaggedSequences
+
+    X = RaggedSequences(values, offsets)
+    labels = np.asarray(labels)
+
+    # same order as shuffling the lists of sequences and of labels
+    # after seeding with `seed`
+    np.random.seed(seed)
+    index_array = np.random.permutation(len(X))
+    X = X.take(index_array)
+    labels = labels[index_array]
+
+    values = X.values.astype('int32')
+    lengths = X.lengths
+    if index_from:
+        values += index_from
+    if start_char is not None:
+        # insert the start char at the beginning of each sequence
+        starts = np.zeros((len(values) + len(lengths),), dtype='bool')
+        starts[X.offsets[:-1] + np.arange(len(lengths))] = True
+        new_values = np.empty((len(starts),), dtype='int32')
+        new_values[starts] = start_char
+        new_values[~starts] = values
+        values = new_values
+        lengths = lengths + 1
+    offsets = np.zeros((len(lengths) + 1,), dtype='int64')
+    np.cumsum(lengths, out=offsets[1:])
+    X = RaggedSequences(values, offsets)
+
+    if maxlen:
+        keep = X.lengths < maxlen
+        X = X[keep]
+        labels = labels[keep]
+        if not len(X):
+            raise Exception('After filtering for sequences shorter than maxlen=' +
+                            str(maxlen) + ', no sequence was kept. '
+                            'Increase maxlen.')
+    if not nb_words:
+        nb_words = X.values.max()
+
+    # by convention, use 2 as OOV word
+    # reserve 'index_from' (=3 by default) characters: 0 (padding), 1 (start), 2 (OOV)
+    oov = (X.values >= nb_words) | (X.values < skip_top)
+    if oov_char is not None:
+        values = np.where(oov, oov_char, X.values).astype('int32')
+        X = RaggedSequences(values, X.offsets)
+    else:
+        # drop out-of-vocabulary words
+        rows = np.repeat(np.arange(len(X)), X.lengths)
+        lengths = np.bincount(rows[~oov], minlength=len(X))
+        offsets = np.zeros((len(X) + 1,), dtype='int64')
+        np.cumsum(lengths, out=offsets[1:])
+        X = RaggedSequences(X.values[~oov], offsets)
+
+    split = int(len(X) * (1 - test_split))
+    X_train, y_train = X[:split], labels[:split]
+    X_test, y_test = X[split:], labels[split:]
+    if not ragged:
+        X_train, y_train = X_train.tolist(), y_train.tolist()
+        X_test, y_test = X_test.tolist(), y_test.tolist()
+    return (X_train, y_train), (X_test, y_test)
@@ -1,22 +1,35 @@
 # -*- coding: utf-8 -*-
 import gzip
-from .data_utils import get_file
+import os
+from .data_utils import get_file, cache_arrays
 from six.moves import cPickle
 import sys
 
 
-def load_data(path="mnist.pkl.gz"):
+def load_data(path="mnist.pkl.gz", mmap_mode=None):
+    '''The dataset is converted once to `.npy` files cached next to
+    the downloaded file, which are then loaded with `np.load(mmap_mode)`.
+    By default the arrays are loaded in memory; use `mmap_mode='r'` to get
+    read-only memory-mapped arrays instead, so that processes loading
+    the dataset share the same memory.
+    '''
     path = get_file(path, origin="https://s3.amazonaws.com/img-datasets/mnist.pkl.gz")
 
-    if path.endswith(".gz"):
-        f = gzip.open(path, 'rb')
-    else:
-        f = open(path, 'rb')
+    def build():
+        if path.endswith(".gz"):
+            f = gzip.open(path, 'rb')
+        else:
+            f = open(path, 'rb')
 
-    if sys.version_info < (3,):
-        data = cPickle.load(f)
-    else:
-        data = cPickle.load(f, encoding="bytes")
+        if sys.version_info < (3,):
+            data = cPickle.load(f)
+        else:
+            data = cPickle.load(f, encoding="bytes")
 
-    f.close()
-    return data  # (X_train, y_train), (X_test, y_test)
+        f.close()
+        (X_train, y_train), (X_test, y_test) = data
+        return {'X_train': X_train.astype('uint8'), 'y_train': y_train,
+                'X_test': X_test.astype('uint8'), 'y_test': y_test}
+
+    arrays = cache_arrays(os.path.basename(path) + '.npy', build, mmap_mode=mmap_mode)
+    return (arrays['X_train'], arrays['y_train']), (arrays['X_test'], arrays['y_test'])
@@ -1,64 +1,32 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
-from .data_utils import get_file
+import os
+from .data_utils import get_file, cache_arrays, sequences_to_arrays, load_sequence_data
 from six.moves import cPickle
-from six.moves import zip
-import numpy as np
 
 
 def load_data(path="reuters.pkl", nb_words=None, skip_top=0,
               maxlen=None, test_split=0.2, seed=113,
-              start_char=1, oov_char=2, index_from=3):
-
+              start_char=1, oov_char=2, index_from=3, ragged=False):
+    '''The dataset is converted once to numpy arrays cached next to
+    the downloaded file, which are memory-mapped on later calls.
+    If `ragged` is True, sequences are returned as `RaggedSequences`
+    and labels as numpy arrays, instead of lists.
+    If `oov_char` is None, out-of-vocabulary words are dropped.
+    '''
     path = get_file(path, origin="https://s3.amazonaws.com/text-datasets/reuters.pkl")
-    f = open(path, 'rb')
-    X, labels = cPickle.load(f)
-    f.close()
-
-    np.random.seed(seed)
-    np.random.shuffle(X)
-    np.random.seed(seed)
-    np.random.shuffle(labels)
-
-    if start_char is not None:
-        X = [[start_char] + [w + index_from for w in x] for x in X]
-    elif index_from:
-        X = [[w + index_from for w in x] for x in X]
-
-    if maxlen:
-        new_X = []
-        new_labels = []
-        for x, y in zip(X, labels):
-            if len(x) < maxlen:
-                new_X.append(x)
-                new_labels.append(y)
-        X = new_X
-        labels = new_labels
-
-    if not nb_words:
-        nb_words = max([max(x) for x in X])
-
-    # by convention, use 2 as OOV word
-    # reserve 'index_from' (=3 by default) characters: 0 (padding), 1 (start), 2 (OOV)
-    if oov_char is not None:
-        X = [[oov_char if (w >= nb_words or w < skip_top) else w for w in x] for x in X]
-    else:
-        nX = []
-        for x in X:
-            nx = []
-            for w in x:
-                if (w >= nb_words or w < skip_top):
-                    nx.append(w)
-            nX.append(nx)
-        X = nX
-
-    X_train = X[:int(len(X) * (1 - test_split))]
-    y_train = labels[:int(len(X) * (1 - test_split))]
-
-    X_test = X[int(len(X) * (1 - test_split)):]
-    y_test = labels[int(len(X) * (1 - test_split)):]
 
-    return (X_train, y_train), (X_test, y_test)
+    def build():
+        f = open(path, 'rb')
+        X, labels = cPickle.load(f)
+        f.close()
+        return sequences_to_arrays(X, labels)
+
+    arrays = cache_arrays(os.path.basename(path) + '.npy', build)
+    return load_sequence_data(arrays['values'], arrays['offsets'], arrays['labels'],
+                              nb_words=nb_words, skip_top=skip_top, maxlen=maxlen,
+                              test_split=test_split, seed=seed, start_char=start_char,
+                              oov_char=oov_char, index_from=index_from, ragged=ragged)
 
 
 def get_word_index(path="reuters_word_index.pkl"):
@@ -5,4 +5,5 @@ from .recurrent import *
 from .normalization import *
 from .embeddings import *
 from .noise import *
+from .augmentation import *
 from .advanced_activations import *
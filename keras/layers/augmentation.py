@@ -0,0 +1,198 @@
+from __future__ import absolute_import
+from .core import Layer
+from .. import backend as K
+
+
+def _spatial_axes(dim_ordering):
+    if dim_ordering == 'th':
+        return 2, 3
+    elif dim_ordering == 'tf':
+        return 1, 2
+    else:
+        raise Exception('Invalid dim_ordering: ' + dim_ordering)
+
+
+def _random_offset(max_offset):
+    '''Integer scalar tensor drawn uniformly in [0, max_offset].
+    '''
+    offset = K.cast(K.random_uniform((), low=0., high=max_offset + 1.), 'int32')
+    # guard against high being reached by float rounding
+    return K.minimum(offset, max_offset)
+
+
+class RandomFlip(Layer):
+    '''Randomly flip images horizontally and/or vertically,
+    independently for each sample (with probability 0.5).
+
+    As a data augmentation layer, it is only active at training time:
+    the flips are done by the compiled training function, on whole
+    batches, instead of image by image on the host
+    (as `keras.preprocessing.image.ImageDataGenerator` does).
+
+    # Input shape
+        4D tensor with shape:
+        `(samples, channels, rows, cols)` if dim_ordering='th'
+        or 4D tensor with shape:
+        `(samples, rows, cols, channels)` if dim_ordering='tf'.
+
+    # Output shape
+        Same shape as input.
+
+    # Arguments
+        horizontal: whether to randomly flip the images horizontally
+            (left to right).
+        vertical: whether to randomly flip the images vertically
+            (upside down).
+        dim_ordering: 'th' or 'tf'. In 'th' mode, the channels dimension
+            (the depth) is at index 1, in 'tf' mode is it at index 3.
+    '''
+    input_ndim = 4
+
+    def __init__(self, horizontal=True, vertical=False,
+                 dim_ordering='th', **kwargs):
+        super(RandomFlip, self).__init__(**kwargs)
+        self.horizontal = horizontal
+        self.vertical = vertical
+        assert dim_ordering in {'tf', 'th'}, 'dim_ordering must be in {tf, th}'
+        self.dim_ordering = dim_ordering
+
+    def get_output(self, train=False):
+        X = self.get_input(train)
+        if not train:
+            return X
+        row_axis, col_axis = _spatial_axes(self.dim_ordering)
+        for flip, axis in [(self.horizontal, col_axis),
+                           (self.vertical, row_axis)]:
+            if flip:
+                mask = K.random_binomial((K.shape(X)[0],), p=0.5)
+                mask = K.reshape(mask, (-1, 1, 1, 1))
+                X = mask * K.reverse(X, [axis]) + (1 - mask) * X
+        return X
+
+    def get_config(self):
+        config = {'name': self.__class__.__name__,
+                  'horizontal': self.horizontal,
+                  'vertical': self.vertical,
+                  'dim_ordering': self.dim_ordering}
+        base_config = super(RandomFlip, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
+
+class RandomCrop(Layer):
+    '''Crop images to `crop_size` at a random position at training time,
+    and at their center at test time.
+
+    The position of the crop is drawn once per batch (it is the same
+    for all the samples of a batch).
+
+    # Input shape
+        4D tensor with shape:
+        `(samples, channels, rows, cols)` if dim_ordering='th'
+        or 4D tensor with shape:
+        `(samples, rows, cols, channels)` if dim_ordering='tf'.
+
+    # Output shape
+        4D tensor with shape:
+        `(samples, channels, crop_rows, crop_cols)` if dim_ordering='th'
+        or 4D tensor with shape:
+        `(samples, crop_rows, crop_cols, channels)` if dim_ordering='tf'.
+
+    # Arguments
+        crop_size: tuple of 2 integers, (crop_rows, crop_cols).
+        dim_ordering: 'th' or 'tf'.
+    '''
+    input_ndim = 4
+
+    def __init__(self, crop_size, dim_ordering='th', **kwargs):
+        super(RandomCrop, self).__init__(**kwargs)
+        self.crop_size = tuple(crop_size)
+        assert dim_ordering in {'tf', 'th'}, 'dim_ordering must be in {tf, th}'
+        self.dim_ordering = dim_ordering
+
+    @property
+    def output_shape(self):
+        input_shape = list(self.input_shape)
+        row_axis, col_axis = _spatial_axes(self.dim_ordering)
+        input_shape[row_axis] = self.crop_size[0]
+        input_shape[col_axis] = self.crop_size[1]
+        return tuple(input_shape)
+
+    def get_output(self, train=False):
+        X = self.get_input(train)
+        row_axis, col_axis = _spatial_axes(self.dim_ordering)
+        max_offsets = (self.input_shape[row_axis] - self.crop_size[0],
+                       self.input_shape[col_axis] - self.crop_size[1])
+        if max_offsets[0] < 0 or max_offsets[1] < 0:
+            raise Exception('crop_size ' + str(self.crop_size) +
+                            ' is larger than the input images.')
+        if train:
+            offsets = [_random_offset(m) for m in max_offsets]
+        else:
+            offsets = [m // 2 for m in max_offsets]
+        return K.spatial_2d_cropping(X, offsets, self.crop_size,
+                                     dim_ordering=self.dim_ordering)
+
+    def get_config(self):
+        config = {'name': self.__class__.__name__,
+                  'crop_size': self.crop_size,
+                  'dim_ordering': self.dim_ordering}
+        base_config = super(RandomCrop, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
+
+class RandomTranslation(Layer):
+    '''Randomly translate images at training time, filling the
+    uncovered areas with zeros.
+
+    The translation is drawn once per batch (it is the same for all
+    the samples of a batch).
+
+    # Input shape
+        4D tensor with shape:
+        `(samples, channels, rows, cols)` if dim_ordering='th'
+        or 4D tensor with shape:
+        `(samples, rows, cols, channels)` if dim_ordering='tf'.
+
+    # Output shape
+        Same shape as input.
+
+    # Arguments
+        width_range: float (fraction of the width). Range of the
+            horizontal translations.
+        height_range: float (fraction of the height). Range of the
+            vertical translations.
+        dim_ordering: 'th' or 'tf'.
+    '''
+    input_ndim = 4
+
+    def __init__(self, width_range=0., height_range=0.,
+                 dim_ordering='th', **kwargs):
+        super(RandomTranslation, self).__init__(**kwargs)
+        self.width_range = width_range
+        self.height_range = height_range
+        assert dim_ordering in {'tf', 'th'}, 'dim_ordering must be in {tf, th}'
+        self.dim_ordering = dim_ordering
+
+    def get_output(self, train=False):
+        X = self.get_input(train)
+        row_axis, col_axis = _spatial_axes(self.dim_ordering)
+        rows = self.input_shape[row_axis]
+        cols = self.input_shape[col_axis]
+        padding = (int(round(self.height_range * rows)),
+                   int(round(self.width_range * cols)))
+        if not train or padding == (0, 0):
+            return X
+        # pad by the largest translation, and crop at a random offset
+        X = K.spatial_2d_padding(X, padding=padding,
+                                 dim_ordering=self.dim_ordering)
+        offsets = [_random_offset(2 * p) for p in padding]
+        return K.spatial_2d_cropping(X, offsets, (rows, cols),
+                                     dim_ordering=self.dim_ordering)
+
+    def get_config(self):
+        config = {'name': self.__class__.__name__,
+                  'width_range': self.width_range,
+                  'height_range': self.height_range,
+                  'dim_ordering': self.dim_ordering}
+        base_config = super(RandomTranslation, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
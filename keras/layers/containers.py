@@ -2,12 +2,23 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
+import warnings
 from collections import OrderedDict
 from .. import backend as K
 from ..layers.core import Layer, Merge, Siamese, SiameseHead
 from six.moves import range
 
 
+def _restore_attribute(obj, name, value):
+    # `value` is the instance attribute that was overridden, if any:
+    # otherwise the override is removed, so that the class attribute
+    # (e.g. a layer method) is visible again
+    if value is None:
+        delattr(obj, name)
+    else:
+        setattr(obj, name, value)
+
+
 class Sequential(Layer):
     '''The Sequential container is a linear stack of layers.
     Apart from the `add` methods and the `layers` constructor argument,
@@ -17,11 +28,30 @@ class Sequential(Layer):
 
     # Arguments
         layers: list of layers to be added to the container.
+        checkpoint_every: integer or None. If set, the training
+            forward pass is split into segments of `checkpoint_every`
+            layers, and only the outputs of the segments are stored for
+            the backward pass: everything else is recomputed during
+            backprop. `checkpoint_every` close to the square root of
+            the number of layers trades about one extra forward pass
+            for O(sqrt(depth)) activation memory. Layers that cannot
+            be recomputed (layers with updates, such as
+            BatchNormalization or stateful recurrent layers, and layers
+            drawing random numbers, such as Dropout, and embeddings
+            with `sparse_updates`) end the current segment and are
+            run outside of any segment.
+            Only effective with the Theano backend: a warning is
+            issued with other backends.
     '''
-    def __init__(self, layers=[]):
+    def __init__(self, layers=[], checkpoint_every=None):
         self.layers = []
         self.layer_cache = {}
         self.shape_cache = {}
+        self.checkpoint_every = checkpoint_every
+        if checkpoint_every and K._BACKEND != 'theano':
+            warnings.warn('checkpoint_every is only supported by the '
+                          'Theano backend: all activations will be '
+                          'stored for the backward pass.')
         for layer in layers:
             self.add(layer)
         self._cache_enabled = True
@@ -35,17 +65,16 @@ class Sequential(Layer):
         while issubclass(layer.__class__, Sequential):
             layer = layer.layers[0]
         # set temporary input to first layer
-        tmp_input = layer.get_input
-        tmp_mask = None
+        tmp_input = layer.__dict__.get('get_input')
+        tmp_mask = layer.__dict__.get('get_input_mask')
         layer.get_input = lambda _: X
         if hasattr(layer, 'get_input_mask'):
-            tmp_mask = layer.get_input_mask
             layer.get_input_mask = lambda _: mask
         Y = self.get_output(train=train)
         # return input from first layer to what it was
-        layer.get_input = tmp_input
+        _restore_attribute(layer, 'get_input', tmp_input)
         if hasattr(layer, 'get_input_mask'):
-            layer.get_input_mask = tmp_mask
+            _restore_attribute(layer, 'get_input_mask', tmp_mask)
         self.cache_enabled = tmp_cache_enabled
         return Y
 
@@ -127,8 +156,52 @@ class Sequential(Layer):
         return self.layers[-1].output_shape
 
     def get_output(self, train=False):
+        if train and self.checkpoint_every:
+            return self._get_checkpointed_output()
         return self.layers[-1].get_output(train)
 
+    def _get_checkpointed_output(self):
+        X = self.get_input(train=True)
+        # input of the current segment, and number of layers in it
+        segment_input = X
+        nb_layers = 0
+        for layer in self.layers:
+            Y = self._get_layer_output(layer, X)
+            if (layer.get_params()[3] or getattr(layer, 'sparse_updates', False) or
+                    K.has_random_draws([Y], [X])):
+                # its updates (or random number generator updates, or
+                # the rows looked up for row-sparse updates) would be
+                # lost inside a segment: run it outside
+                if nb_layers:
+                    X = K.checkpoint([X], [segment_input])[0]
+                    Y = self._get_layer_output(layer, X)
+                segment_input = Y
+                nb_layers = 0
+            else:
+                nb_layers += 1
+                if nb_layers == self.checkpoint_every:
+                    Y = K.checkpoint([Y], [segment_input])[0]
+                    segment_input = Y
+                    nb_layers = 0
+            X = Y
+        if nb_layers:
+            X = K.checkpoint([X], [segment_input])[0]
+        return X
+
+    def _get_layer_output(self, layer, X):
+        # build the training output of `layer` on top of X
+        tmp_cache_enabled = self.cache_enabled
+        self.cache_enabled = False
+        first_layer = layer
+        while issubclass(first_layer.__class__, Sequential):
+            first_layer = first_layer.layers[0]
+        tmp_input = first_layer.__dict__.get('get_input')
+        first_layer.get_input = lambda _: X
+        Y = layer.get_output(train=True)
+        _restore_attribute(first_layer, 'get_input', tmp_input)
+        self.cache_enabled = tmp_cache_enabled
+        return Y
+
     def set_input(self):
         for l in self.layers:
             if hasattr(l, 'input'):
@@ -162,8 +235,11 @@ class Sequential(Layer):
             weights = weights[nb_param:]
 
     def get_config(self):
-        return {'name': self.__class__.__name__,
-                'layers': [layer.get_config() for layer in self.layers]}
+        config = {'name': self.__class__.__name__,
+                  'layers': [layer.get_config() for layer in self.layers]}
+        if self.checkpoint_every:
+            config['checkpoint_every'] = self.checkpoint_every
+        return config
 
     def count_params(self):
         return sum([layer.count_params() for layer in self.layers])
@@ -302,7 +378,9 @@ class Graph(Layer):
                 Does not include the batch size.
             batch_input_shape: a tuple of integers, the expected shape of the
                 whole input batch, including the batch size.
-            dtype: 'float' or 'int'.
+            dtype: 'float', 'int' (int32 indices, for Embedding inputs),
+                or the name of a numpy dtype, e.g. 'uint8' to feed images as
+                bytes (followed by a `Rescale` or `Normalize` node).
         '''
         if name in self.namespace:
             raise Exception('Duplicate node identifier: ' + name)
@@ -315,13 +393,17 @@ class Graph(Layer):
             layer.set_input_shape(batch_input_shape)
         if dtype == 'float':
             layer.input = K.placeholder(shape=layer.input_shape, name=name)
-        else:
+        elif dtype == 'int':
             if (input_shape and len(input_shape) == 1) or (batch_input_shape and len(batch_input_shape) == 2):
                 layer.input = K.placeholder(shape=layer.input_shape,
                                             dtype='int32',
                                             name=name)
             else:
                 raise Exception('Type "int" can only be used with ndim==2 (Embedding).')
+        else:
+            layer.input = K.placeholder(shape=layer.input_shape,
+                                        dtype=dtype,
+                                        name=name)
         self.inputs[name] = layer
         config = {'name': name, 'dtype': dtype}
         if batch_input_shape:
@@ -31,6 +31,10 @@ class Layer(object):
         batch_input_shape: a tuple of integers specifying the expected
             shape of a batch of input samples. Includes the batch size
             (e.g. `(32, 100)` for a batch of 32 100-dimensional inputs).
+        input_dtype: dtype of the input placeholder created by
+            `input_shape` or `batch_input_shape` (default: floatX).
+            E.g. 'uint8' to feed images as bytes, followed by
+            a `Rescale` or `Normalize` layer.
     '''
     def __init__(self, **kwargs):
         if not hasattr(self, 'trainable_weights'):
@@ -41,10 +45,13 @@ class Layer(object):
         allowed_kwargs = {'input_shape',
                           'trainable',
                           'batch_input_shape',
+                          'input_dtype',
                           'cache_enabled',
                           'name'}
         for kwarg in kwargs:
             assert kwarg in allowed_kwargs, 'Keyword argument not understood: ' + kwarg
+        if 'input_dtype' in kwargs:
+            self.input_dtype = kwargs['input_dtype']
         if 'batch_input_shape' in kwargs:
             self.set_input_shape(tuple(kwargs['batch_input_shape']))
         elif 'input_shape' in kwargs:
@@ -161,7 +168,9 @@ class Layer(object):
                                 str(self.input_ndim) +
                                 ', was provided with input shape ' + str(input_shape))
         self._input_shape = input_shape
-        self.input = K.placeholder(shape=self._input_shape)
+        self.input = K.placeholder(shape=self._input_shape,
+                                   dtype=getattr(self, 'input_dtype', K.floatx()),
+                                   sparse=getattr(self, 'sparse_input', False))
         self.build()
 
     @property
@@ -261,6 +270,8 @@ class Layer(object):
                 config['batch_input_shape'] = input_shape[:]
             else:
                 config['input_shape'] = input_shape[1:]
+        if hasattr(self, 'input_dtype'):
+            config['input_dtype'] = self.input_dtype
         if hasattr(self, '_trainable'):
             config['trainable'] = self._trainable
         config['cache_enabled'] = self.cache_enabled
@@ -695,6 +706,93 @@ class Activation(MaskedLayer):
         return dict(list(base_config.items()) + list(config.items()))
 
 
+class Rescale(MaskedLayer):
+    '''Cast the input to floatX and compute `input * scale + offset`.
+
+    Used as the first layer of a model with an integer input
+    (see the `input_dtype` argument of layers), it lets data such as
+    images be kept and fed as uint8 arrays (4 times smaller than float32),
+    the conversion being done by the compiled function.
+
+    # Input shape
+        Arbitrary. Use the keyword argument `input_shape`
+        (tuple of integers, does not include the samples axis)
+        when using this layer as the first layer in a model.
+
+    # Output shape
+        Same shape as input.
+
+    # Arguments
+        scale: float.
+        offset: float.
+
+    # Example
+
+    ```python
+        model = Sequential()
+        model.add(Rescale(1. / 255, input_shape=(3, 32, 32),
+                          input_dtype='uint8'))
+        model.add(Convolution2D(32, 3, 3))
+    ```
+    '''
+    def __init__(self, scale, offset=0., **kwargs):
+        super(Rescale, self).__init__(**kwargs)
+        self.scale = scale
+        self.offset = offset
+
+    def get_output(self, train=False):
+        X = K.cast(self.get_input(train), K.floatx())
+        X = X * self.scale
+        if self.offset:
+            X = X + self.offset
+        return X
+
+    def get_config(self):
+        config = {'name': self.__class__.__name__,
+                  'scale': self.scale,
+                  'offset': self.offset}
+        base_config = super(Rescale, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
+
+class Normalize(MaskedLayer):
+    '''Cast the input to floatX and compute `(input - mean) / std`.
+
+    Like `Rescale`, it lets the input data be fed with an integer dtype.
+
+    # Input shape
+        Arbitrary. Use the keyword argument `input_shape`
+        (tuple of integers, does not include the samples axis)
+        when using this layer as the first layer in a model.
+
+    # Output shape
+        Same shape as input.
+
+    # Arguments
+        mean: float, or numpy array broadcastable to the shape of
+            an input sample (e.g. the featurewise mean of the training
+            data, or `(channels, 1, 1)` for a mean per channel).
+        std: float, or numpy array broadcastable to the shape of
+            an input sample.
+    '''
+    def __init__(self, mean=0., std=1., **kwargs):
+        super(Normalize, self).__init__(**kwargs)
+        self.mean = np.asarray(mean, dtype=K.floatx())
+        self.std = np.asarray(std, dtype=K.floatx())
+
+    def get_output(self, train=False):
+        X = K.cast(self.get_input(train), K.floatx())
+        # one multiplication instead of a division per element
+        return (X - self.mean) * (1. / self.std)
+
+    def get_config(self):
+        config = {'name': self.__class__.__name__,
+                  'mean': self.mean.tolist(),
+                  'std': self.std.tolist()}
+        base_config = super(Normalize, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
+
 class Reshape(Layer):
     '''Reshape an output to a certain shape.
 
@@ -920,12 +1018,17 @@ class Dense(Layer):
         input_dim: dimensionality of the input (integer).
             This argument (or alternatively, the keyword argument `input_shape`)
             is required when using this layer as the first layer in a model.
+        sparse_input: if True, and this layer is the first layer of a model,
+            the model input is a sparse matrix and should be fed with
+            scipy.sparse matrices (e.g. CSR bag-of-words vectors),
+            which are never densified.
     '''
     input_ndim = 2
 
     def __init__(self, output_dim, init='glorot_uniform', activation='linear', weights=None,
                  W_regularizer=None, b_regularizer=None, activity_regularizer=None,
-                 W_constraint=None, b_constraint=None, input_dim=None, **kwargs):
+                 W_constraint=None, b_constraint=None, input_dim=None,
+                 sparse_input=False, **kwargs):
         self.init = initializations.get(init)
         self.activation = activations.get(activation)
         self.output_dim = output_dim
@@ -941,9 +1044,10 @@ class Dense(Layer):
         self.initial_weights = weights
 
         self.input_dim = input_dim
+        self.sparse_input = sparse_input
         if self.input_dim:
             kwargs['input_shape'] = (self.input_dim,)
-        self.input = K.placeholder(ndim=2)
+        self.input = K.placeholder(ndim=2, sparse=sparse_input)
         super(Dense, self).__init__(**kwargs)
 
     def build(self):
@@ -990,11 +1094,189 @@ class Dense(Layer):
                   'activity_regularizer': self.activity_regularizer.get_config() if self.activity_regularizer else None,
                   'W_constraint': self.W_constraint.get_config() if self.W_constraint else None,
                   'b_constraint': self.b_constraint.get_config() if self.b_constraint else None,
-                  'input_dim': self.input_dim}
+                  'input_dim': self.input_dim,
+                  'sparse_input': self.sparse_input}
         base_config = super(Dense, self).get_config()
         return dict(list(base_config.items()) + list(config.items()))
 
 
+class SampledSoftmax(Layer):
+    '''Softmax output layer over a large number of classes,
+    trained with a sampled softmax loss.
+
+    At prediction time the layer computes the exact softmax over
+    all `output_dim` classes, like `Dense(output_dim, activation='softmax')`.
+    During training, the loss is only computed over the target class
+    and `nb_sampled` classes sampled for the whole batch, so a training
+    step costs O(nb_sampled * input_dim) instead of O(output_dim * input_dim),
+    and only the weights of these classes are updated.
+
+    The layer must be the last layer of the model, trained with the
+    objective `'sampled_softmax'` (which calls `layer.loss`), taking
+    integer class indices of shape `(nb_samples, 1)` as targets instead
+    of one-hot vectors. During training, the output of the layer is
+    its input, from which the objective computes the sampled loss:
+    it cannot be fed to another layer. Training accuracy reported by
+    `fit(show_accuracy=True)` is meaningless with this layer.
+
+    ```python
+        model.add(SampledSoftmax(500000, nb_sampled=512))
+        model.compile(loss='sampled_softmax', optimizer='adam')
+        model.fit(X, y)  # y: class indices, shape (nb_samples, 1)
+    ```
+
+    # Input shape
+        2D tensor with shape: `(nb_samples, input_dim)`.
+
+    # Output shape
+        2D tensor with shape: `(nb_samples, output_dim)`
+        (`(nb_samples, input_dim)` during training).
+
+    # Arguments
+        output_dim: int > 0. Number of classes.
+        nb_sampled: int > 0. Number of classes sampled at each
+            training step.
+        sampler: one of "log_uniform" (classes are assumed to be sorted
+            by decreasing frequency, e.g. word indices produced by
+            `Tokenizer`) or "uniform".
+        init: name of initialization function for the weights of the layer
+            (see [initializations](../initializations.md)).
+        weights: list of numpy arrays to set as initial weights.
+            The list should have 2 elements, of shape `(output_dim, input_dim)`
+            and `(output_dim,)`.
+        input_dim: dimensionality of the input (integer).
+    '''
+    input_ndim = 2
+
+    def __init__(self, output_dim, nb_sampled=64, sampler='log_uniform',
+                 init='glorot_uniform', weights=None, input_dim=None,
+                 **kwargs):
+        if sampler not in {'log_uniform', 'uniform'}:
+            raise Exception('Invalid sampler: ' + str(sampler))
+        self.init = initializations.get(init)
+        self.output_dim = output_dim
+        self.nb_sampled = nb_sampled
+        self.sampler = sampler
+        self.initial_weights = weights
+        # latest output and input, for train and test
+        self._outputs = {}
+
+        self.input_dim = input_dim
+        if self.input_dim:
+            kwargs['input_shape'] = (self.input_dim,)
+        self.input = K.placeholder(ndim=2)
+        super(SampledSoftmax, self).__init__(**kwargs)
+
+    def build(self):
+        input_dim = self.input_shape[1]
+
+        # one row per class, so that sampled classes are gathered by row
+        self.W = self.init((self.output_dim, input_dim))
+        self.b = K.zeros((self.output_dim,))
+        self.trainable_weights = [self.W, self.b]
+
+        if self.initial_weights is not None:
+            self.set_weights(self.initial_weights)
+            del self.initial_weights
+
+    @property
+    def output_shape(self):
+        return (self.input_shape[0], self.output_dim)
+
+    def get_output(self, train=False):
+        X = self.get_input(train)
+        if train:
+            # the sampled loss is computed by `loss`, from the input
+            output = X
+        else:
+            output = K.softmax(K.dot(X, K.transpose(self.W)) + self.b)
+        self._outputs[train] = (output, X)
+        # lets the 'sampled_softmax' objective find the layer
+        output._sampled_softmax = self
+        return output
+
+    def sample(self):
+        '''Return the indices of `nb_sampled` classes drawn
+        (with replacement) from the sampling distribution.
+        '''
+        u = K.random_uniform((self.nb_sampled,))
+        if self.sampler == 'uniform':
+            sampled = K.cast(u * self.output_dim, 'int32')
+        else:
+            log_range = np.log(self.output_dim + 1.)
+            sampled = K.cast(K.exp(u * log_range), 'int32') - 1
+        sampled = K.clip(sampled, 0, self.output_dim - 1)
+        return sampled
+
+    def expected_count(self, classes):
+        '''Return the expected number of times each of `classes`
+        is drawn by `sample`.
+        '''
+        classes = K.cast(classes, K.floatx())
+        if self.sampler == 'uniform':
+            return K.ones_like(classes) * (self.nb_sampled / float(self.output_dim))
+        log_range = np.log(self.output_dim + 1.)
+        return self.nb_sampled * K.log((classes + 2.) / (classes + 1.)) / log_range
+
+    def loss(self, y_true, y_pred):
+        '''Objective to use with this layer.
+
+        y_true: integer class indices, shape `(nb_samples, 1)`.
+        y_pred: an output of this layer.
+        '''
+        for train, (output, X) in self._outputs.items():
+            if output is y_pred:
+                break
+        else:
+            raise Exception('SampledSoftmax.loss can only be applied '
+                            'to the output of its own layer.')
+        targets = K.cast(K.flatten(y_true), 'int32')
+        if not train:
+            logits = K.dot(X, K.transpose(self.W)) + self.b
+            true_logits = (K.sum(X * K.gather(self.W, targets), axis=-1) +
+                           K.gather(self.b, targets))
+            return _logsumexp(logits) - true_logits
+
+        sampled = self.sample()
+        # only the rows of the sampled and target classes are used,
+        # and updated (see `Optimizer.get_rows`)
+        classes, inverse = K.unique(K.concatenate([sampled, targets], axis=0))
+        W_rows = K.gather(self.W, classes)
+        b_rows = K.gather(self.b, classes)
+        self.W.row_slice = (classes, W_rows)
+        self.b.row_slice = (classes, b_rows)
+        sampled_rows = inverse[:self.nb_sampled]
+        target_rows = inverse[self.nb_sampled:]
+
+        true_logits = (K.sum(X * K.gather(W_rows, target_rows), axis=-1) +
+                       K.gather(b_rows, target_rows) -
+                       K.log(self.expected_count(targets)))
+        sampled_logits = (K.dot(X, K.transpose(K.gather(W_rows, sampled_rows))) +
+                          K.gather(b_rows, sampled_rows) -
+                          K.log(self.expected_count(sampled)))
+        # remove sampled classes that are the target class
+        hits = K.equal(K.expand_dims(targets, 1), K.expand_dims(sampled, 0))
+        sampled_logits -= 1e6 * K.cast(hits, K.floatx())
+        logits = K.concatenate([K.expand_dims(true_logits, 1), sampled_logits],
+                               axis=1)
+        return _logsumexp(logits) - true_logits
+
+    def get_config(self):
+        config = {'name': self.__class__.__name__,
+                  'output_dim': self.output_dim,
+                  'nb_sampled': self.nb_sampled,
+                  'sampler': self.sampler,
+                  'init': self.init.__name__,
+                  'input_dim': self.input_dim}
+        base_config = super(SampledSoftmax, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
+
+def _logsumexp(x):
+    x_max = K.max(x, axis=-1, keepdims=True)
+    return K.log(K.sum(K.exp(x - x_max), axis=-1)) + K.max(x, axis=-1)
+
+
 class TimeDistributedDense(MaskedLayer):
     '''Apply a same Dense layer for each dimension[1] (time_dimension) input.
     Especially useful after a recurrent network with 'return_sequence=True'.
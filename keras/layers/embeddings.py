@@ -1,4 +1,6 @@
 from __future__ import absolute_import
+import numpy as np
+
 from .. import backend as K
 
 from .. import activations, initializations, regularizers, constraints
@@ -14,7 +16,9 @@ class Embedding(Layer):
     This layer can only be used as the first layer in a model.
 
     # Input shape
-        2D tensor with shape: `(nb_samples, sequence_length)`.
+        2D tensor with shape: `(nb_samples, sequence_length)`,
+        or 3D tensor with shape `(nb_samples, 2, sequence_length)`
+        if `packed` is True.
 
     # Output shape
         3D tensor with shape: `(nb_samples, sequence_length, output_dim)`.
@@ -42,6 +46,25 @@ class Embedding(Layer):
           This argument is required if you are going to connect
           `Flatten` then `Dense` layers upstream
           (without it, the shape of the dense outputs cannot be computed).
+      sparse_updates: Whether the optimizer should only update the rows
+          of the embedding matrix (and of its optimizer slots, e.g.
+          momentum or Adam moments) that are used in the current batch,
+          instead of the whole matrix. The cost of an update then scales
+          with the batch rather than with the vocabulary. Slots of unused
+          rows are not decayed ("lazy" updates), and `W_constraint` is
+          applied to the updated rows only. Not compatible with
+          `W_regularizer` or `activity_regularizer`. The layer must
+          then be looked up only once by the model: it cannot be
+          shared between several inputs (e.g. Siamese branches or
+          Graph nodes). In a `Sequential` model with
+          `checkpoint_every`, it is run outside of the segments.
+      packed: Whether the input holds several sequences per row,
+          as returned by `keras.preprocessing.sequence.pack_sequences`:
+          `X[:, 0]` are the indexes and `X[:, 1]` the segment ids
+          (1, 2, ... for the successive sequences of a row, 0 for padding).
+          The segment ids are used as output mask: recurrent layers
+          reset their states at the start of each segment, and padding
+          is masked out of the loss.
     '''
     input_ndim = 2
 
@@ -50,12 +73,26 @@ class Embedding(Layer):
                  W_regularizer=None, activity_regularizer=None,
                  W_constraint=None,
                  mask_zero=False,
-                 weights=None, **kwargs):
+                 weights=None, sparse_updates=False, packed=False, **kwargs):
         self.input_dim = input_dim
         self.output_dim = output_dim
         self.init = initializations.get(init)
         self.input_length = input_length
         self.mask_zero = mask_zero
+        self.sparse_updates = sparse_updates
+        self.packed = packed
+        if packed:
+            self.input_ndim = 3
+        if sparse_updates and W_regularizer:
+            raise Exception('W_regularizer cannot be used with '
+                            'sparse_updates=True, since it would update '
+                            'the whole embedding matrix at every step.')
+        if sparse_updates and activity_regularizer:
+            raise Exception('activity_regularizer cannot be used with '
+                            'sparse_updates=True, since it would look up '
+                            'the rows of the batch a second time, and the '
+                            'optimizer would only see the gradient of '
+                            'the regularization.')
 
         self.W_constraint = constraints.get(W_constraint)
         self.constraints = [self.W_constraint]
@@ -64,12 +101,19 @@ class Embedding(Layer):
         self.activity_regularizer = regularizers.get(activity_regularizer)
 
         self.initial_weights = weights
-        kwargs['input_shape'] = (self.input_dim,)
+        if packed:
+            # indexes and segment ids
+            kwargs['input_shape'] = (2, self.input_length)
+        else:
+            kwargs['input_shape'] = (self.input_dim,)
         super(Embedding, self).__init__(**kwargs)
 
     def build(self):
-        self.input = K.placeholder(shape=(self.input_shape[0], self.input_length),
-                                   dtype='int32')
+        if self.packed:
+            shape = (self.input_shape[0], 2, self.input_length)
+        else:
+            shape = (self.input_shape[0], self.input_length)
+        self.input = K.placeholder(shape=shape, dtype='int32')
         self.W = self.init((self.input_dim, self.output_dim))
         self.trainable_weights = [self.W]
         self.regularizers = []
@@ -85,19 +129,37 @@ class Embedding(Layer):
             self.set_weights(self.initial_weights)
 
     def get_output_mask(self, train=None):
+        if self.packed:
+            return self.get_input(train)[:, 1, :]
         X = self.get_input(train)
         if not self.mask_zero:
             return None
         else:
             return K.not_equal(X, 0)
 
+    def get_indices(self, train=False):
+        X = self.get_input(train)
+        if self.packed:
+            return X[:, 0, :]
+        return X
+
     @property
     def output_shape(self):
         return (self.input_shape[0], self.input_length, self.output_dim)
 
+    def lookup(self, indices, train=False):
+        if train and self.sparse_updates:
+            # look up each distinct index once, and let the optimizer
+            # differentiate with respect to these rows only
+            unique_indices, inverse = K.unique(indices)
+            rows = K.gather(self.W, unique_indices)
+            self.W.row_slice = (unique_indices, rows)
+            return K.gather(rows, inverse)
+        return K.gather(self.W, indices)
+
     def get_output(self, train=False):
-        X = self.get_input(train)
-        out = K.gather(self.W, X)
+        X = self.get_indices(train)
+        out = self.lookup(X, train)
         return out
 
     def get_config(self):
@@ -107,8 +169,75 @@ class Embedding(Layer):
                   "init": self.init.__name__,
                   "input_length": self.input_length,
                   "mask_zero": self.mask_zero,
+                  "sparse_updates": self.sparse_updates,
+                  "packed": self.packed,
                   "activity_regularizer": self.activity_regularizer.get_config() if self.activity_regularizer else None,
                   "W_regularizer": self.W_regularizer.get_config() if self.W_regularizer else None,
                   "W_constraint": self.W_constraint.get_config() if self.W_constraint else None}
         base_config = super(Embedding, self).get_config()
         return dict(list(base_config.items()) + list(config.items()))
+
+
+class HashedEmbedding(Embedding):
+    '''Turn arbitrary non-negative integer ids (e.g. string hashes
+    produced by `Tokenizer(hashing=True)`) into dense vectors of fixed size,
+    using a fixed number of hash buckets instead of a vocabulary-sized table.
+
+    Each id is hashed by `nb_hashes` independent universal hash functions
+    `((a * id + b) mod p) mod nb_buckets`, and the embedding of the id is
+    the sum of the rows of its buckets. Using several hash functions makes
+    it unlikely for two frequent ids to share all of their buckets.
+
+    This layer can only be used as the first layer in a model.
+
+    # Input shape
+        2D tensor with shape: `(nb_samples, sequence_length)`,
+        with ids in `[0, 2**31 - 1)`.
+
+    # Output shape
+        3D tensor with shape: `(nb_samples, sequence_length, output_dim)`.
+
+    # Arguments
+      nb_buckets: int > 0. Number of rows of the embedding matrix.
+      output_dim: int >= 0. Dimension of the dense embedding.
+      nb_hashes: int > 0. Number of hash functions.
+      seed: int. Seed of the hash functions. Ids are only mapped to
+          the same buckets by layers sharing the same seed.
+      Other arguments: same as `Embedding`.
+    '''
+    prime = 2 ** 31 - 1
+
+    def __init__(self, nb_buckets, output_dim, nb_hashes=2, seed=0,
+                 **kwargs):
+        self.nb_buckets = nb_buckets
+        self.nb_hashes = nb_hashes
+        self.seed = seed
+        rng = np.random.RandomState(seed)
+        self.hash_params = [(int(rng.randint(1, self.prime)),
+                             int(rng.randint(0, self.prime)))
+                            for _ in range(nb_hashes)]
+        super(HashedEmbedding, self).__init__(nb_buckets, output_dim, **kwargs)
+
+    def get_buckets(self, X):
+        '''Return the tensor of bucket indices of X,
+        of shape `X.shape + (nb_hashes,)`.
+        '''
+        X = K.cast(X, 'int64')
+        buckets = []
+        for a, b in self.hash_params:
+            h = ((a * X + b) % self.prime) % self.nb_buckets
+            buckets.append(K.expand_dims(K.cast(h, 'int32')))
+        return K.concatenate(buckets, axis=-1)
+
+    def get_output(self, train=False):
+        X = self.get_indices(train)
+        out = K.sum(self.lookup(self.get_buckets(X), train), axis=-2)
+        return out
+
+    def get_config(self):
+        config = {"nb_buckets": self.nb_buckets,
+                  "nb_hashes": self.nb_hashes,
+                  "seed": self.seed}
+        base_config = super(HashedEmbedding, self).get_config()
+        del base_config["input_dim"]
+        return dict(list(base_config.items()) + list(config.items()))
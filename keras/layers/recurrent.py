@@ -53,6 +53,10 @@ class Recurrent(MaskedLayer):
         of timesteps. To introduce masks to your data,
         use an [Embedding](embeddings.md) layer with the `mask_zero` parameter
         set to `True`.
+        Short sequences can also be packed several per row
+        (see `keras.preprocessing.sequence.pack_sequences`) and fed to an
+        [Embedding](embeddings.md) layer with `packed=True`:
+        the states are then reset at the start of each packed sequence.
 
     # TensorFlow warning
         For the time being, when using the TensorFlow backend,
@@ -459,6 +463,22 @@ class LSTM(Recurrent):
         return dict(list(base_config.items()) + list(config.items()))
 
 
+def _has_packed_input(layer):
+    '''Whether the output mask of `layer` holds the segment ids of
+    packed sequences (see `Embedding(packed=True)`).
+    '''
+    while layer is not None:
+        if getattr(layer, 'packed', False):
+            return True
+        if hasattr(layer, 'previous'):
+            layer = layer.previous
+        elif getattr(layer, 'layers', None):
+            layer = layer.layers[-1]
+        else:
+            return False
+    return False
+
+
 class Bidirectional(MaskedLayer):
     ''' Bidirectional wrapper for RNNs
 
@@ -508,6 +528,13 @@ class Bidirectional(MaskedLayer):
         self.reverse.set_weights(weights[:nw/2])
 
     def set_previous(self, layer):
+        if _has_packed_input(layer):
+            # the masks of packed inputs hold segment ids, and their
+            # padding is at the end of the rows, while the reversal
+            # below assumes binary masks padded at the start
+            raise Exception('Bidirectional does not support packed inputs '
+                            '(Embedding(packed=True)): use a forward and '
+                            'a go_backwards recurrent layer instead.')
         self.previous = layer
         self.forward.set_previous(layer)
         self.reverse.set_previous(layer)
@@ -16,6 +16,7 @@ from . import backend as K
 from . import optimizers
 from . import objectives
 from . import callbacks as cbks
+from .data import Dataset, window_shuffle
 from .utils.layer_utils import container_from_config
 from .utils.layer_utils import model_summary
 from .utils.generic_utils import Progbar
@@ -26,7 +27,11 @@ def standardize_y(y):
     if not hasattr(y, 'shape'):
         y = np.asarray(y)
     if len(y.shape) == 1:
-        y = np.expand_dims(y, 1)
+        if isinstance(y, Dataset):
+            y = y.map(lambda batch: np.expand_dims(batch, 1),
+                      shape=(len(y), 1), dtype=y.dtype)
+        else:
+            y = np.expand_dims(y, 1)
     return y
 
 
@@ -47,6 +52,16 @@ def make_batches(size, batch_size):
     return [(i * batch_size, min(size, (i + 1) * batch_size)) for i in range(0, nb_batch)]
 
 
+def get_nb_sample(X):
+    '''Number of samples of an input array, which can be
+    a numpy array, a scipy sparse matrix, an HDF5Matrix
+    or a `keras.data.Dataset`.
+    '''
+    if hasattr(X, 'shape'):
+        return X.shape[0]
+    return len(X)
+
+
 def standardize_X(X):
     if type(X) == list:
         return X
@@ -55,7 +70,10 @@ def standardize_X(X):
 
 
 def slice_X(X, start=None, stop=None):
-    '''
+    '''Select the rows `start` (an array of indices)
+    or `start:stop` of an input array or list of input arrays.
+    Works with numpy arrays, scipy sparse matrices (CSR), HDF5Matrix
+    and `keras.data.Dataset`.
     '''
     if type(X) == list:
         if hasattr(start, '__len__'):
@@ -74,6 +92,17 @@ def slice_X(X, start=None, stop=None):
             return X[start:stop]
 
 
+def split_X(X, start=None, stop=None):
+    '''Like `slice_X(X, start, stop)`, but `keras.data.Dataset` inputs
+    are split without being read (used by `validation_split`).
+    '''
+    if type(X) == list:
+        return [split_X(x, start, stop) for x in X]
+    if isinstance(X, Dataset):
+        return X.subset(start, stop)
+    return X[start:stop]
+
+
 def weighted_objective(fn):
     def weighted(y_true, y_pred, weights, mask=None):
         '''
@@ -83,6 +112,8 @@ def weighted_objective(fn):
         if mask is not None:
             # Cast the mask to floatX to avoid float64 upcasting in theano
             mask = K.cast(mask, K.floatx())
+            # masks holding segment ids (packed sequences) are binarized
+            mask = K.cast(K.not_equal(mask, 0), K.floatx())
             # mask should have the same shape as score_array
             score_array *= mask
             #  the loss per batch should be proportional
@@ -102,6 +133,17 @@ def weighted_objective(fn):
     return weighted
 
 
+def get_classes(y):
+    '''Class indices of 2D targets (one-hot or class index).
+    '''
+    if y.shape[1] > 1:
+        return y.argmax(axis=1)
+    elif y.shape[1] == 1:
+        return np.reshape(y, y.shape[0])
+    else:
+        return y
+
+
 def standardize_weights(y, sample_weight=None, class_weight=None,
                         sample_weight_mode=None):
     '''Weight input validation and standardization to a single sample-wise
@@ -134,19 +176,55 @@ def standardize_weights(y, sample_weight=None, class_weight=None,
         if len(y.shape) > 2:
             raise Exception('class_weight not supported for '
                             '3+ dimensional targets.')
-        if y.shape[1] > 1:
-            y_classes = y.argmax(axis=1)
-        elif y.shape[1] == 1:
-            y_classes = np.reshape(y, y.shape[0])
+        if isinstance(y, Dataset):
+            # read out-of-core targets by batches
+            y_classes = np.concatenate([get_classes(y[start:end])
+                                        for start, end in make_batches(len(y), 4096)])
         else:
-            y_classes = y
-        weights = np.asarray([class_weight[cls] for cls in y_classes])
+            y_classes = get_classes(y)
+        weights = np.asarray([class_weight[cls] for cls in y_classes],
+                             dtype=K.floatx())
         return weights
     else:
         if sample_weight_mode is None:
-            return np.ones((y.shape[0],))
+            return np.ones((y.shape[0],), dtype=K.floatx())
         else:
-            return np.ones((y.shape[0], y.shape[1]))
+            return np.ones((y.shape[0], y.shape[1]), dtype=K.floatx())
+
+
+def standardize_dtypes(ins, placeholders):
+    '''Convert the input arrays of a function to the dtypes of
+    its placeholders, once for all the batches (instead of once
+    per batch, by the compiled function).
+
+    Conversions that would lose information (non-integral values
+    or values out of range, fed to an integer placeholder)
+    are rejected.
+    Out-of-core inputs (datasets, memory-mapped arrays,
+    `HDF5Matrix`) and sparse matrices are left as they are:
+    their batches are converted when they are read.
+    '''
+    standardized = []
+    for x, placeholder in zip(ins, placeholders):
+        dtype = np.dtype(K.dtype(placeholder))
+        if (not isinstance(x, np.ndarray) or isinstance(x, np.memmap) or
+                x.dtype == dtype):
+            standardized.append(x)
+            continue
+        if dtype.kind in 'iu' and x.size:
+            info = np.iinfo(dtype)
+            if x.dtype.kind == 'f' and np.any(np.floor(x) != x):
+                raise Exception('An input of dtype ' + str(x.dtype) +
+                                ' with non-integral values is fed to '
+                                'a placeholder of dtype ' + str(dtype) +
+                                ': round or cast it yourself, or change '
+                                'the input_dtype of the model.')
+            if x.min() < info.min or x.max() > info.max:
+                raise Exception('An input has values out of the range '
+                                'of the dtype of its placeholder (' +
+                                str(dtype) + ').')
+        standardized.append(x.astype(dtype))
+    return standardized
 
 
 def model_from_yaml(yaml_string, custom_objects={}):
@@ -196,6 +274,7 @@ def model_from_config(config, custom_objects={}):
             loss = custom_objects[loss]
 
         class_mode = config.get('class_mode')
+        accumulate_steps = config.get('accumulate_steps', 1)
 
         optimizer_params = dict([(k, v) for k, v in config.get('optimizer').items()])
         optimizer_name = optimizer_params.pop('name')
@@ -203,9 +282,11 @@ def model_from_config(config, custom_objects={}):
 
         if model_name == 'Sequential':
             model.compile(loss=loss, optimizer=optimizer,
-                          class_mode=class_mode)
+                          class_mode=class_mode,
+                          accumulate_steps=accumulate_steps)
         elif model_name == 'Graph':
-            model.compile(loss=loss, optimizer=optimizer)
+            model.compile(loss=loss, optimizer=optimizer,
+                          accumulate_steps=accumulate_steps)
     return model
 
 
@@ -226,17 +307,35 @@ class Model(object):
             Abstract fit function for f(ins).
             Assume that f returns a list, labelled by out_labels.
         '''
+        ins = standardize_dtypes(ins, f.inputs)
         self.training_data = ins
-        self.validation_data = val_ins
         do_validation = False
         if val_f and val_ins:
             do_validation = True
+            val_ins = standardize_dtypes(val_ins, val_f.inputs)
+        self.validation_data = val_ins
+        if do_validation:
             if verbose:
                 print('Train on %d samples, validate on %d samples' %
-                      (len(ins[0]), len(val_ins[0])))
+                      (get_nb_sample(ins[0]), get_nb_sample(val_ins[0])))
 
-        nb_train_sample = len(ins[0])
+        nb_train_sample = get_nb_sample(ins[0])
         index_array = np.arange(nb_train_sample)
+        # out-of-core datasets can restrict shuffling to windows of samples
+        windows = [x.shuffle_window for x in ins
+                   if isinstance(x, Dataset) and x.shuffle_window]
+        shuffle_window = min(windows) if windows else None
+
+        accumulate_steps = self.accumulate_steps
+        if accumulate_steps > 1:
+            nb_batch = len(make_batches(nb_train_sample, batch_size))
+            if nb_batch % accumulate_steps != 0:
+                warnings.warn('The number of batches per epoch (%d) is not '
+                              'a multiple of accumulate_steps (%d): the '
+                              'gradients of the last %d batches of each '
+                              'epoch are discarded.' %
+                              (nb_batch, accumulate_steps,
+                               nb_batch % accumulate_steps))
 
         history = cbks.History()
         if verbose:
@@ -253,7 +352,10 @@ class Model(object):
             'verbose': verbose,
             'do_validation': do_validation,
             'metrics': metrics,
+            'accumulate_steps': accumulate_steps,
         })
+        # batches are counted from the start of training
+        self.optimizer.reset_accumulation()
         callbacks.on_train_begin()
 
         self.stop_training = False
@@ -261,6 +363,8 @@ class Model(object):
             callbacks.on_epoch_begin(epoch)
             if shuffle == 'batch':
                 index_array = batch_shuffle(index_array, batch_size)
+            elif shuffle and shuffle_window:
+                index_array = window_shuffle(index_array, shuffle_window)
             elif shuffle:
                 np.random.shuffle(index_array)
 
@@ -271,8 +375,15 @@ class Model(object):
                     ins_batch = slice_X(ins, batch_ids)
                 except TypeError:
                     raise Exception('TypeError while preparing batch. '
-                                    'If using HDF5 input data, '
-                                    'pass shuffle="batch".')
+                                    'If using out-of-core input data, '
+                                    'use keras.data.Dataset or '
+                                    'keras.utils.io_utils.HDF5Matrix.')
+                if batch_index + 1 < len(batches):
+                    # start reading the next batch from disk (HDF5Matrix)
+                    next_start, next_end = batches[batch_index + 1]
+                    for x in ins:
+                        if hasattr(x, 'prefetch'):
+                            x.prefetch(index_array[next_start:next_end])
                 batch_logs = {}
                 batch_logs['batch'] = batch_index
                 batch_logs['size'] = len(batch_ids)
@@ -299,6 +410,8 @@ class Model(object):
                         for l, o in zip(out_labels, val_outs):
                             epoch_logs['val_' + l] = o
 
+            # partial groups of batches do not carry over to the next epoch
+            self.optimizer.reset_accumulation()
             callbacks.on_epoch_end(epoch, epoch_logs)
             if self.stop_training:
                 break
@@ -309,7 +422,8 @@ class Model(object):
     def _predict_loop(self, f, ins, batch_size=128, verbose=0):
         '''Abstract method to loop over some data in batches.
         '''
-        nb_sample = len(ins[0])
+        ins = standardize_dtypes(ins, f.inputs)
+        nb_sample = get_nb_sample(ins[0])
         outs = []
         if verbose == 1:
             progbar = Progbar(target=nb_sample)
@@ -325,7 +439,7 @@ class Model(object):
             if batch_index == 0:
                 for batch_out in batch_outs:
                     shape = (nb_sample,) + batch_out.shape[1:]
-                    outs.append(np.zeros(shape))
+                    outs.append(np.zeros(shape, dtype=batch_out.dtype))
 
             for i, batch_out in enumerate(batch_outs):
                 outs[i][batch_start:batch_end] = batch_out
@@ -336,7 +450,8 @@ class Model(object):
     def _test_loop(self, f, ins, batch_size=128, verbose=0):
         '''Abstract method to loop over some data in batches.
         '''
-        nb_sample = len(ins[0])
+        ins = standardize_dtypes(ins, f.inputs)
+        nb_sample = get_nb_sample(ins[0])
         outs = []
         if verbose == 1:
             progbar = Progbar(target=nb_sample)
@@ -372,7 +487,7 @@ class Model(object):
         `keras.models.model_from_config(config, custom_objects={})`.
         '''
         config = super(Model, self).get_config()
-        for p in ['class_mode']:
+        for p in ['class_mode', 'accumulate_steps']:
             if hasattr(self, p):
                 config[p] = getattr(self, p)
         if hasattr(self, 'optimizer'):
@@ -439,7 +554,8 @@ class Sequential(Model, containers.Sequential):
     '''
     def compile(self, optimizer, loss,
                 class_mode="categorical",
-                sample_weight_mode=None):
+                sample_weight_mode=None,
+                accumulate_steps=1):
         '''Configure the learning process.
 
         # Arguments
@@ -453,9 +569,17 @@ class Sequential(Model, containers.Sequential):
             sample_weight_mode: if you need to do timestep-wise
                 sample weighting (2D weights), set this to "temporal".
                 "None" defaults to sample-wise weights (1D).
+            accumulate_steps: integer. Number of batches over which
+                gradients are accumulated before the optimizer
+                updates the weights. The effective batch size is then
+                `accumulate_steps * batch_size`. Gradients are
+                discarded at the end of each epoch of `fit` and
+                `fit_generator`, so a last partial group of batches
+                does not update the weights.
         '''
         self.optimizer = optimizers.get(optimizer)
         self.sample_weight_mode = sample_weight_mode
+        self.accumulate_steps = accumulate_steps
 
         self.loss = objectives.get(loss)
         weighted_loss = weighted_objective(self.loss)
@@ -497,9 +621,10 @@ class Sequential(Model, containers.Sequential):
 
         for r in self.regularizers:
             train_loss = r(train_loss)
-        updates = self.optimizer.get_updates(self.trainable_weights,
-                                             self.constraints,
-                                             train_loss)
+        updates = self.optimizer.get_accumulated_updates(self.trainable_weights,
+                                                         self.constraints,
+                                                         train_loss,
+                                                         accumulate_steps)
         updates += self.updates
 
         if type(self.X_train) == list:
@@ -520,7 +645,8 @@ class Sequential(Model, containers.Sequential):
 
     def fit(self, X, y, batch_size=128, nb_epoch=100, verbose=1, callbacks=[],
             validation_split=0., validation_data=None, shuffle=True,
-            show_accuracy=False, class_weight=None, sample_weight=None):
+            show_accuracy=False, class_weight=None, sample_weight=None,
+            bucket_by_length=False):
         '''Train the model for a fixed number of epochs.
 
         Returns a history object. Its `history` attribute is a record of
@@ -528,8 +654,8 @@ class Sequential(Model, containers.Sequential):
         as well as validation loss values (if applicable).
 
         # Arguments
-            X: data, as a numpy array.
-            y: labels, as a numpy array.
+            X: data, as a numpy array or a `keras.data.Dataset`.
+            y: labels, as a numpy array or a `keras.data.Dataset`.
             batch_size: int. Number of samples per gradient update.
             nb_epoch: int.
             verbose: 0 for no logging to stdout,
@@ -543,8 +669,10 @@ class Sequential(Model, containers.Sequential):
                 validation data. Will override validation_split.
             shuffle: boolean or str (for 'batch').
                 Whether to shuffle the samples at each epoch.
-                'batch' is a special option for dealing with the
-                limitations of HDF5 data; it shuffles in batch-sized chunks.
+                'batch' shuffles in batch-sized chunks, which makes
+                reads from HDF5 data (HDF5Matrix) more sequential.
+                Inputs given as a `keras.data.Dataset` with a
+                `shuffle_window` are shuffled within windows of samples.
             show_accuracy: boolean. Whether to display
                 class accuracy in the logs to stdout at each epoch.
             class_weight: dictionary mapping classes to a weight value,
@@ -559,17 +687,43 @@ class Sequential(Model, containers.Sequential):
                 to apply a different weight to every timestep of every sample.
                 In this case you should make sure to specify
                 sample_weight_mode="temporal" in compile().
+            bucket_by_length: boolean. If True, `X` is a list of
+                sequences (or a `RaggedSequences`) of varying lengths,
+                and each batch is only padded (with zeros, at the start)
+                to the length of its longest sequence, batching together
+                sequences of similar lengths
+                (see `keras.preprocessing.sequence.bucket_batches`).
+                The model should not fix the number of timesteps.
+                Not compatible with `validation_split`.
         '''
+        if bucket_by_length:
+            from .preprocessing.sequence import bucket_batches
+            if validation_split:
+                raise Exception('validation_split is not supported with '
+                                'bucket_by_length=True: '
+                                'pass validation_data instead.')
+            if len(X) != len(y):
+                raise Exception('X and y must have the same number of '
+                                'sequences. Found: len(X) = {}, '
+                                'len(y) = {}'.format(len(X), len(y)))
+            generator = bucket_batches(X, y=np.asarray(y), batch_size=batch_size,
+                                       shuffle=shuffle, sample_weight=sample_weight)
+            return self.fit_generator(generator, samples_per_epoch=len(X),
+                                      nb_epoch=nb_epoch, verbose=verbose,
+                                      show_accuracy=show_accuracy,
+                                      callbacks=callbacks,
+                                      validation_data=validation_data,
+                                      class_weight=class_weight)
         if type(X) == list:
-            if len(set([len(a) for a in X] + [len(y)])) != 1:
+            if len(set([get_nb_sample(a) for a in X] + [len(y)])) != 1:
                 raise Exception('All input arrays and the target array must '
                                 'have the same number of samples.')
         else:
-            if len(X) != len(y):
+            if get_nb_sample(X) != len(y):
                 raise Exception('The input data tensor (X) and '
                                 'the target tensor (y) must have '
                                 'the same number of samples. Found: '
-                                'len(X) = {}, len(y) = {}'.format(len(X), len(y)))
+                                'len(X) = {}, len(y) = {}'.format(get_nb_sample(X), len(y)))
         if sample_weight is not None:
             assert len(sample_weight) == len(y), ('"sample_weight" must have '
                                                   'the same number of samples '
@@ -588,19 +742,19 @@ class Sequential(Model, containers.Sequential):
             if len(validation_data) == 2:
                 X_val, y_val = validation_data
                 if type(X_val) == list:
-                    assert len(set([len(a) for a in X_val] + [len(y_val)])) == 1
+                    assert len(set([get_nb_sample(a) for a in X_val] + [len(y_val)])) == 1
                 else:
-                    assert len(X_val) == len(y_val)
+                    assert get_nb_sample(X_val) == len(y_val)
                 X_val = standardize_X(X_val)
                 y_val = standardize_y(y_val)
                 sample_weight_val = standardize_weights(y_val)
             elif len(validation_data) == 3:
                 X_val, y_val, sample_weight_val = validation_data
                 if type(X_val) == list:
-                    assert len(set([len(a) for a in X_val] +
+                    assert len(set([get_nb_sample(a) for a in X_val] +
                                    [len(y_val), len(sample_weight_val)])) == 1
                 else:
-                    assert len(X_val) == len(y_val) == len(sample_weight_val)
+                    assert get_nb_sample(X_val) == len(y_val) == len(sample_weight_val)
                 X_val = standardize_X(X_val)
                 y_val = standardize_y(y_val)
                 sample_weight_val = standardize_weights(y_val,
@@ -615,9 +769,9 @@ class Sequential(Model, containers.Sequential):
             val_ins = X_val + [y_val, sample_weight_val]
 
         elif 0 < validation_split < 1:
-            split_at = int(len(X[0]) * (1 - validation_split))
-            X, X_val = (slice_X(X, 0, split_at), slice_X(X, split_at))
-            y, y_val = (slice_X(y, 0, split_at), slice_X(y, split_at))
+            split_at = int(get_nb_sample(X[0]) * (1 - validation_split))
+            X, X_val = (split_X(X, 0, split_at), split_X(X, split_at))
+            y, y_val = (split_X(y, 0, split_at), split_X(y, split_at))
             if sample_weight is not None:
                 sample_weight, sample_weight_val = (slice_X(sample_weight, 0, split_at), slice_X(sample_weight, split_at))
                 sample_weight_val = standardize_weights(y_val,
@@ -700,23 +854,23 @@ class Sequential(Model, containers.Sequential):
         '''Compute the loss on some input data, batch by batch.
 
         # Arguments
-            X: input data, as a numpy array.
-            y: labels, as a numpy array.
+            X: input data, as a numpy array or a `keras.data.Dataset`.
+            y: labels, as a numpy array or a `keras.data.Dataset`.
             batch_size: integer.
             show_accuracy: boolean.
             verbose: verbosity mode, 0 or 1.
             sample_weight: sample weights, as a numpy array.
         '''
         if type(X) == list:
-            if len(set([len(a) for a in X] + [len(y)])) != 1:
+            if len(set([get_nb_sample(a) for a in X] + [len(y)])) != 1:
                 raise Exception('All input arrays and the target array must '
                                 'have the same number of samples.')
         else:
-            if len(X) != len(y):
+            if get_nb_sample(X) != len(y):
                 raise Exception('The input data tensor (X) and '
                                 'the target tensor (y) must have '
                                 'the same number of samples. Found: '
-                                'len(X) = {}, len(y) = {}'.format(len(X), len(y)))
+                                'len(X) = {}, len(y) = {}'.format(get_nb_sample(X), len(y)))
         if sample_weight is not None:
             assert len(sample_weight) == len(y), ('"sample_weight" must have '
                                                   'the same number of samples '
@@ -747,15 +901,15 @@ class Sequential(Model, containers.Sequential):
         Arguments: see `fit` method.
         '''
         if type(X) == list:
-            if len(set([len(a) for a in X] + [len(y)])) != 1:
+            if len(set([get_nb_sample(a) for a in X] + [len(y)])) != 1:
                 raise Exception('All input arrays and the target array must '
                                 'have the same number of samples.')
         else:
-            if len(X) != len(y):
+            if get_nb_sample(X) != len(y):
                 raise Exception('The input data tensor (X) and '
                                 'the target tensor (y) must have '
                                 'the same number of samples. Found: '
-                                'len(X) = {}, len(y) = {}'.format(len(X), len(y)))
+                                'len(X) = {}, len(y) = {}'.format(get_nb_sample(X), len(y)))
         if sample_weight is not None:
             assert len(sample_weight) == len(y), ('"sample_weight" must have '
                                                   'the same number of samples '
@@ -778,15 +932,15 @@ class Sequential(Model, containers.Sequential):
         Arguments: see `fit` method.
         '''
         if type(X) == list:
-            if len(set([len(a) for a in X] + [len(y)])) != 1:
+            if len(set([get_nb_sample(a) for a in X] + [len(y)])) != 1:
                 raise Exception('All input arrays and the target array must '
                                 'have the same number of samples.')
         else:
-            if len(X) != len(y):
+            if get_nb_sample(X) != len(y):
                 raise Exception('The input data tensor (X) and '
                                 'the target tensor (y) must have '
                                 'the same number of samples. Found: '
-                                'len(X) = {}, len(y) = {}'.format(len(X), len(y)))
+                                'len(X) = {}, len(y) = {}'.format(get_nb_sample(X), len(y)))
         if sample_weight is not None:
             assert len(sample_weight) == len(y), ('"sample_weight" must have '
                                                   'the same number of samples '
@@ -943,7 +1097,10 @@ class Sequential(Model, containers.Sequential):
             'verbose': verbose,
             'do_validation': do_validation,
             'metrics': metrics,
+            'accumulate_steps': self.accumulate_steps,
         })
+        # batches are counted from the start of training
+        self.optimizer.reset_accumulation()
         callbacks.on_train_begin()
 
         # util function to validate the batches produced
@@ -955,17 +1112,17 @@ class Sequential(Model, containers.Sequential):
             if len(generator_output) == 2:
                 X, y = generator_output
                 if type(X) == list:
-                    assert len(set([len(a) for a in X] + [len(y)])) == 1
+                    assert len(set([get_nb_sample(a) for a in X] + [len(y)])) == 1
                 else:
-                    assert len(X) == len(y)
+                    assert get_nb_sample(X) == len(y)
                     X = [X]
                 sample_weight = None
             elif len(generator_output) == 3:
                 X, y, sample_weight = generator_output
                 if type(X) == list:
-                    assert len(set([len(a) for a in X] + [len(y), len(sample_weight)])) == 1
+                    assert len(set([get_nb_sample(a) for a in X] + [len(y), len(sample_weight)])) == 1
                 else:
-                    assert len(X) == len(y) == len(sample_weight)
+                    assert get_nb_sample(X) == len(y) == len(sample_weight)
                     X = [X]
             else:
                 _stop.set()
@@ -1025,7 +1182,7 @@ class Sequential(Model, containers.Sequential):
                 X, y, sample_weight = input_validation(generator_output)
 
                 batch_logs = {}
-                batch_size = len(X[0])
+                batch_size = get_nb_sample(X[0])
                 batch_logs['batch'] = batch_index
                 batch_logs['size'] = batch_size
                 callbacks.on_batch_begin(batch_index, batch_logs)
@@ -1063,6 +1220,8 @@ class Sequential(Model, containers.Sequential):
                         for l, o in zip(out_labels, val_outs):
                             epoch_logs['val_' + l] = o
 
+            # partial groups of batches do not carry over to the next epoch
+            self.optimizer.reset_accumulation()
             callbacks.on_epoch_end(epoch, epoch_logs)
             epoch += 1
             if self.stop_training:
@@ -1081,7 +1240,8 @@ class Graph(Model, containers.Graph):
 
     Inherits from `containers.Graph`.
     '''
-    def compile(self, optimizer, loss, sample_weight_modes={}):
+    def compile(self, optimizer, loss, sample_weight_modes={},
+                accumulate_steps=1):
         '''Configure the learning process.
 
         # Arguments
@@ -1096,6 +1256,13 @@ class Graph(Model, containers.Graph):
                 timestep-wise loss weighting on one of your graph outputs,
                 you will need to set the sample weight mode for this output
                 to "temporal".
+            accumulate_steps: integer. Number of batches over which
+                gradients are accumulated before the optimizer
+                updates the weights. The effective batch size is then
+                `accumulate_steps * batch_size`. Gradients are
+                discarded at the end of each epoch of `fit` and
+                `fit_generator`, so a last partial group of batches
+                does not update the weights.
         '''
         assert type(loss) is dict, 'The "loss" argument should be a dictionary.'
         assert type(sample_weight_modes) is dict, 'The "sample_weight_modes" argument should be a dictionary.'
@@ -1138,9 +1305,11 @@ class Graph(Model, containers.Graph):
         for r in self.regularizers:
             train_loss = r(train_loss)
         self.optimizer = optimizers.get(optimizer)
-        updates = self.optimizer.get_updates(self.trainable_weights,
-                                             self.constraints,
-                                             train_loss)
+        self.accumulate_steps = accumulate_steps
+        updates = self.optimizer.get_accumulated_updates(self.trainable_weights,
+                                                         self.constraints,
+                                                         train_loss,
+                                                         accumulate_steps)
         updates += self.updates
         self.loss = loss
 
@@ -1160,8 +1329,8 @@ class Graph(Model, containers.Graph):
 
         # Arguments
             data: dictionary mapping input names and outputs names to
-                appropriate numpy arrays. All arrays should contain
-                the same number of samples.
+                appropriate numpy arrays (or `keras.data.Dataset`).
+                All arrays should contain the same number of samples.
             batch_size: int. Number of samples per gradient update.
             nb_epoch: int.
             verbose: 0 for no logging to stdout,
@@ -1183,7 +1352,7 @@ class Graph(Model, containers.Graph):
         '''
         X = [data[name] for name in self.input_order]
         y = [standardize_y(data[name]) for name in self.output_order]
-        if len(set([len(a) for a in X] + [len(a) for a in y])) != 1:
+        if len(set([get_nb_sample(a) for a in X] + [get_nb_sample(a) for a in y])) != 1:
             raise Exception('All input arrays and target arrays must have '
                             'the same number of samples.')
 
@@ -1203,9 +1372,9 @@ class Graph(Model, containers.Graph):
             val_ins = [validation_data[name] for name in self.input_order] + [standardize_y(validation_data[name]) for name in self.output_order] + sample_weight
 
         elif 0 < validation_split < 1:
-            split_at = int(len(X[0]) * (1 - validation_split))
-            X, X_val = (slice_X(X, 0, split_at), slice_X(X, split_at))
-            y, y_val = (slice_X(y, 0, split_at), slice_X(y, split_at))
+            split_at = int(get_nb_sample(X[0]) * (1 - validation_split))
+            X, X_val = (split_X(X, 0, split_at), split_X(X, split_at))
+            y, y_val = (split_X(y, 0, split_at), split_X(y, split_at))
             sample_weight_list, sample_weight_list_val = (slice_X(sample_weight_list, 0, split_at), slice_X(sample_weight_list, split_at))
             val_ins = X_val + y_val + sample_weight_list_val
 
@@ -1234,7 +1403,7 @@ class Graph(Model, containers.Graph):
                                              sample_weight=sample_weight.get(name),
                                              sample_weight_mode=self.sample_weight_modes.get(name)) for name in self.output_order]
         ins = [data[name] for name in self.input_order] + [standardize_y(data[name]) for name in self.output_order] + sample_weight
-        if len(set([len(a) for a in ins])) != 1:
+        if len(set([get_nb_sample(a) for a in ins])) != 1:
             raise Exception('All input arrays and target arrays must have '
                             'the same number of samples.')
         outs = self._test_loop(self._test, ins, batch_size, verbose)
@@ -1247,7 +1416,7 @@ class Graph(Model, containers.Graph):
         Arguments: see `fit` method.
         '''
         ins = [data[name] for name in self.input_order]
-        if len(set([len(a) for a in ins])) != 1:
+        if len(set([get_nb_sample(a) for a in ins])) != 1:
             raise Exception('All input arrays and target arrays must have '
                             'the same number of samples.')
         outs = self._predict_loop(self._predict, ins, batch_size, verbose)
@@ -1263,7 +1432,7 @@ class Graph(Model, containers.Graph):
                                              class_weight=class_weight.get(name),
                                              sample_weight_mode=self.sample_weight_modes.get(name)) for name in self.output_order]
         ins = [data[name] for name in self.input_order] + [standardize_y(data[name]) for name in self.output_order] + sample_weight
-        if len(set([len(a) for a in ins])) != 1:
+        if len(set([get_nb_sample(a) for a in ins])) != 1:
             raise Exception('All input arrays and target arrays must have '
                             'the same number of samples.')
         return self._train(ins)
@@ -1277,7 +1446,7 @@ class Graph(Model, containers.Graph):
                                              sample_weight=sample_weight.get(name),
                                              sample_weight_mode=self.sample_weight_modes.get(name)) for name in self.output_order]
         ins = [data[name] for name in self.input_order] + [standardize_y(data[name]) for name in self.output_order] + sample_weight
-        if len(set([len(a) for a in ins])) != 1:
+        if len(set([get_nb_sample(a) for a in ins])) != 1:
             raise Exception('All input arrays and target arrays must have '
                             'the same number of samples.')
         return self._test(ins)
@@ -1286,7 +1455,7 @@ class Graph(Model, containers.Graph):
         '''Generate predictions for a single batch of samples.
         '''
         ins = [data[name] for name in self.input_order]
-        if len(set([len(a) for a in ins])) != 1:
+        if len(set([get_nb_sample(a) for a in ins])) != 1:
             raise Exception('All input arrays and target arrays must have '
                             'the same number of samples.')
         outs = self._predict(ins)
@@ -1415,7 +1584,10 @@ class Graph(Model, containers.Graph):
             'verbose': verbose,
             'do_validation': do_validation,
             'metrics': metrics,
+            'accumulate_steps': self.accumulate_steps,
         })
+        # batches are counted from the start of training
+        self.optimizer.reset_accumulation()
         callbacks.on_train_begin()
 
         # util function to validate the batches produced
@@ -1439,7 +1611,7 @@ class Graph(Model, containers.Graph):
                                 '(data, sample_weight).')
             assert type(data) == dict
             assert type(sample_weight) == dict
-            if len(set([len(data[name]) for name in data.keys()] +
+            if len(set([get_nb_sample(data[name]) for name in data.keys()] +
                        [len(sample_weight[name]) for name in sample_weight.keys()])) != 1:
                 raise Exception('All input arrays and target arrays must have '
                                 'the same number of samples.')
@@ -1495,7 +1667,7 @@ class Graph(Model, containers.Graph):
                 data, sample_weight = input_validation(generator_output)
 
                 batch_logs = {}
-                batch_size = len(data[list(data.keys())[0]])
+                batch_size = get_nb_sample(data[list(data.keys())[0]])
                 batch_logs['batch'] = batch_index
                 batch_logs['size'] = batch_size
                 callbacks.on_batch_begin(batch_index, batch_logs)
@@ -1530,6 +1702,8 @@ class Graph(Model, containers.Graph):
                         for l, o in zip(out_labels, val_outs):
                             epoch_logs['val_' + l] = o
 
+            # partial groups of batches do not carry over to the next epoch
+            self.optimizer.reset_accumulation()
             callbacks.on_epoch_end(epoch, epoch_logs)
             epoch += 1
             if self.stop_training:
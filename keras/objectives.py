@@ -50,6 +50,17 @@ def cosine_proximity(y_true, y_pred):
     return -K.mean(y_true * y_pred, axis=-1)
 
 
+def sampled_softmax(y_true, y_pred):
+    '''Objective of the `SampledSoftmax` layer whose output is `y_pred`.
+    Expects integer class indices of shape `(nb_samples, 1)`.
+    '''
+    layer = getattr(y_pred, '_sampled_softmax', None)
+    if layer is None:
+        raise Exception('The sampled_softmax objective can only be used '
+                        'with the output of a SampledSoftmax layer.')
+    return layer.loss(y_true, y_pred)
+
+
 # aliases
 mse = MSE = mean_squared_error
 mae = MAE = mean_absolute_error
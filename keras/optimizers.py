@@ -27,6 +27,16 @@ class Optimizer(object):
             when their L2 norm exceeds this value.
         clipvalue: float >= 0. Gradients will be clipped
             when their absolute value exceeds this value.
+
+    Gradient accumulation over several batches is configured
+    through the `accumulate_steps` argument of `model.compile`.
+
+    Parameters with a `row_slice` attribute, a tuple `(indices, rows)`
+    where `rows` is the tensor `gather(p, indices)` used by the model
+    (see `Embedding(sparse_updates=True)`), are differentiated with
+    respect to `rows`, and only these rows of the parameter and of
+    its optimizer slots are updated. The loss must then depend on
+    the parameter through `rows` only.
     '''
     def __init__(self, **kwargs):
         self.__dict__.update(kwargs)
@@ -43,8 +53,91 @@ class Optimizer(object):
     def get_updates(self, params, constraints, loss):
         raise NotImplementedError
 
+    def get_accumulated_updates(self, params, constraints, loss,
+                                accumulate_steps=1):
+        '''Same as `get_updates`, but gradients are summed over
+        `accumulate_steps` successive calls of the training function
+        and the parameter update is only applied on the last of them,
+        using the average of the accumulated gradients.
+
+        Clipping and constraints are applied to the accumulated
+        gradients and the updated parameters, respectively,
+        exactly as for a single large batch.
+        '''
+        self.accumulate_steps = accumulate_steps
+        updates = self.get_updates(params, constraints, loss)
+        if accumulate_steps <= 1:
+            return updates
+        # every optimizer state update, including the parameters
+        # themselves, only takes effect on the k-th call
+        self.updates = [(v, K.switch(self.apply_accumulated, new_v, v))
+                        for v, new_v in updates]
+        self.updates += self.accumulation_updates
+        return self.updates
+
+    def reset_accumulation(self):
+        '''Discard the gradients accumulated so far, if any.
+        '''
+        if not hasattr(self, 'accumulators'):
+            return
+        K.set_value(self.accumulated_steps, 0.)
+        for a in self.accumulators:
+            K.set_value(a, np.zeros(K.get_value(a).shape))
+
+    def get_rows(self, x, p):
+        '''Return the part of `x` (the parameter `p` or one of its
+        slots) that is updated at each step: `x` itself, or only the
+        rows used in the current batch if `p` has row-sparse updates.
+        '''
+        row_slice = getattr(p, 'row_slice', None)
+        if row_slice is None:
+            return x
+        return K.gather(x, row_slice[0])
+
+    def update_rows(self, x, new_x, p):
+        '''Return the update tuple setting `get_rows(x, p)` to `new_x`.
+        '''
+        row_slice = getattr(p, 'row_slice', None)
+        if row_slice is None:
+            return (x, new_x)
+        return (x, K.scatter_update(x, row_slice[0], new_x))
+
+    def accumulate_gradients(self, grads, params):
+        if any([hasattr(p, 'row_slice') for p in params]):
+            raise Exception('Gradient accumulation is not supported '
+                            'with row-sparse updates.')
+        k = float(self.accumulate_steps)
+        self.accumulated_steps = K.variable(0.)
+        self.accumulators = [K.variable(np.zeros(K.get_value(p).shape))
+                             for p in params]
+        self.apply_accumulated = K.equal(self.accumulated_steps + 1., k)
+        self.accumulation_updates = [(self.accumulated_steps,
+                                      K.switch(self.apply_accumulated,
+                                               K.zeros_like(self.accumulated_steps),
+                                               self.accumulated_steps + 1.))]
+        new_grads = []
+        for g, a in zip(grads, self.accumulators):
+            new_a = a + g
+            self.accumulation_updates.append((a, K.switch(self.apply_accumulated,
+                                                          K.zeros_like(a), new_a)))
+            new_grads.append(new_a / k)
+        return new_grads
+
     def get_gradients(self, loss, params):
-        grads = K.gradients(loss, params)
+        for p in params:
+            if hasattr(p, 'row_slice') and K.depends_on([loss], p, [p.row_slice[1]]):
+                # only the rows of the last lookup would be updated
+                raise Exception('A parameter with row-sparse updates '
+                                'is used by the loss other than through '
+                                'its last lookup: row-sparse embeddings '
+                                'cannot be shared between several '
+                                'inputs, nor be recomputed in a '
+                                'checkpointed segment.')
+        wrt = [p.row_slice[1] if hasattr(p, 'row_slice') else p
+               for p in params]
+        grads = K.gradients(loss, wrt)
+        if getattr(self, 'accumulate_steps', 1) > 1:
+            grads = self.accumulate_gradients(grads, params)
         if hasattr(self, 'clipnorm') and self.clipnorm > 0:
             norm = K.sqrt(sum([K.sum(K.square(g)) for g in grads]))
             grads = [clip_norm(g, self.clipnorm, norm) for g in grads]
@@ -82,15 +175,15 @@ class SGD(Optimizer):
 
         for p, g, c in zip(params, grads, constraints):
             m = K.variable(np.zeros(K.get_value(p).shape))  # momentum
-            v = self.momentum * m - lr * g  # velocity
-            self.updates.append((m, v))
+            v = self.momentum * self.get_rows(m, p) - lr * g  # velocity
+            self.updates.append(self.update_rows(m, v, p))
 
             if self.nesterov:
-                new_p = p + self.momentum * v - lr * g
+                new_p = self.get_rows(p, p) + self.momentum * v - lr * g
             else:
-                new_p = p + v
+                new_p = self.get_rows(p, p) + v
 
-            self.updates.append((p, c(new_p)))  # apply constraints
+            self.updates.append(self.update_rows(p, c(new_p), p))  # apply constraints
         return self.updates
 
     def get_config(self):
@@ -128,11 +221,11 @@ class RMSprop(Optimizer):
 
         for p, g, a, c in zip(params, grads, accumulators, constraints):
             # update accumulator
-            new_a = self.rho * a + (1 - self.rho) * K.square(g)
-            self.updates.append((a, new_a))
+            new_a = self.rho * self.get_rows(a, p) + (1 - self.rho) * K.square(g)
+            self.updates.append(self.update_rows(a, new_a, p))
 
-            new_p = p - self.lr * g / K.sqrt(new_a + self.epsilon)
-            self.updates.append((p, c(new_p)))  # apply constraints
+            new_p = self.get_rows(p, p) - self.lr * g / K.sqrt(new_a + self.epsilon)
+            self.updates.append(self.update_rows(p, c(new_p), p))  # apply constraints
         return self.updates
 
     def get_config(self):
@@ -163,10 +256,10 @@ class Adagrad(Optimizer):
         self.updates = []
 
         for p, g, a, c in zip(params, grads, accumulators, constraints):
-            new_a = a + K.square(g)  # update accumulator
-            self.updates.append((a, new_a))
-            new_p = p - self.lr * g / K.sqrt(new_a + self.epsilon)
-            self.updates.append((p, c(new_p)))  # apply constraints
+            new_a = self.get_rows(a, p) + K.square(g)  # update accumulator
+            self.updates.append(self.update_rows(a, new_a, p))
+            new_p = self.get_rows(p, p) - self.lr * g / K.sqrt(new_a + self.epsilon)
+            self.updates.append(self.update_rows(p, c(new_p), p))  # apply constraints
         return self.updates
 
     def get_config(self):
@@ -203,18 +296,19 @@ class Adadelta(Optimizer):
         for p, g, a, d_a, c in zip(params, grads, accumulators,
                                    delta_accumulators, constraints):
             # update accumulator
-            new_a = self.rho * a + (1 - self.rho) * K.square(g)
-            self.updates.append((a, new_a))
+            new_a = self.rho * self.get_rows(a, p) + (1 - self.rho) * K.square(g)
+            self.updates.append(self.update_rows(a, new_a, p))
 
             # use the new accumulator and the *old* delta_accumulator
-            update = g * K.sqrt(d_a + self.epsilon) / K.sqrt(new_a + self.epsilon)
+            d_a_t = self.get_rows(d_a, p)
+            update = g * K.sqrt(d_a_t + self.epsilon) / K.sqrt(new_a + self.epsilon)
 
-            new_p = p - self.lr * update
-            self.updates.append((p, c(new_p)))  # apply constraints
+            new_p = self.get_rows(p, p) - self.lr * update
+            self.updates.append(self.update_rows(p, c(new_p), p))  # apply constraints
 
             # update delta_accumulator
-            new_d_a = self.rho * d_a + (1 - self.rho) * K.square(update)
-            self.updates.append((d_a, new_d_a))
+            new_d_a = self.rho * d_a_t + (1 - self.rho) * K.square(update)
+            self.updates.append(self.update_rows(d_a, new_d_a, p))
         return self.updates
 
     def get_config(self):
@@ -259,13 +353,13 @@ class Adam(Optimizer):
             # zero init of velocity
             v = K.variable(np.zeros(K.get_value(p).shape))
 
-            m_t = (self.beta_1 * m) + (1 - self.beta_1) * g
-            v_t = (self.beta_2 * v) + (1 - self.beta_2) * K.square(g)
-            p_t = p - lr_t * m_t / (K.sqrt(v_t) + self.epsilon)
+            m_t = (self.beta_1 * self.get_rows(m, p)) + (1 - self.beta_1) * g
+            v_t = (self.beta_2 * self.get_rows(v, p)) + (1 - self.beta_2) * K.square(g)
+            p_t = self.get_rows(p, p) - lr_t * m_t / (K.sqrt(v_t) + self.epsilon)
 
-            self.updates.append((m, m_t))
-            self.updates.append((v, v_t))
-            self.updates.append((p, c(p_t)))  # apply constraints
+            self.updates.append(self.update_rows(m, m_t, p))
+            self.updates.append(self.update_rows(v, v_t, p))
+            self.updates.append(self.update_rows(p, c(p_t), p))  # apply constraints
         return self.updates
 
     def get_config(self):
@@ -312,13 +406,13 @@ class Adamax(Optimizer):
             # zero init of exponentially weighted infinity norm
             u = K.variable(np.zeros(K.get_value(p).shape))
 
-            m_t = (self.beta_1 * m) + (1 - self.beta_1) * g
-            u_t = K.maximum(self.beta_2 * u, K.abs(g))
-            p_t = p - lr_t * m_t / (u_t + self.epsilon)
+            m_t = (self.beta_1 * self.get_rows(m, p)) + (1 - self.beta_1) * g
+            u_t = K.maximum(self.beta_2 * self.get_rows(u, p), K.abs(g))
+            p_t = self.get_rows(p, p) - lr_t * m_t / (u_t + self.epsilon)
 
-            self.updates.append((m, m_t))
-            self.updates.append((u, u_t))
-            self.updates.append((p, c(p_t)))  # apply constraints
+            self.updates.append(self.update_rows(m, m_t, p))
+            self.updates.append(self.update_rows(u, u_t, p))
+            self.updates.append(self.update_rows(p, c(p_t), p))  # apply constraints
         return self.updates
 
     def get_config(self):
@@ -6,40 +6,87 @@ from scipy import ndimage
 from scipy import linalg
 
 from os import listdir
-from os.path import isfile, join
+from os.path import isfile, isdir, join
 import random
 import math
 from six.moves import range
 import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
 '''Fairly basic set of tools for realtime data augmentation on image data.
 Can easily be extended to include new transformations, new preprocessing methods, etc...
 '''
 
 
+def transform_matrix_offset_center(matrix, x, y):
+    '''Apply the 3x3 (homogeneous) transform `matrix` of 2D coordinates
+    around the center of an image of `x` rows and `y` columns,
+    instead of around its corner.
+    '''
+    o_x = float(x) / 2 - 0.5
+    o_y = float(y) / 2 - 0.5
+    offset_matrix = np.array([[1, 0, o_x], [0, 1, o_y], [0, 0, 1]])
+    reset_matrix = np.array([[1, 0, -o_x], [0, 1, -o_y], [0, 0, 1]])
+    return np.dot(np.dot(offset_matrix, matrix), reset_matrix)
+
+
+def apply_transform(x, transform_matrix, fill_mode="nearest", cval=0., order=1):
+    '''Resample the image `x` (channels, rows, cols) with the 3x3 transform
+    `transform_matrix`, mapping output coordinates (row, col, 1) to input
+    coordinates. All the channels are resampled by a single interpolation.
+    '''
+    matrix = np.eye(4)
+    matrix[1:, 1:] = transform_matrix
+    return ndimage.affine_transform(x, matrix,
+                                    order=order,
+                                    mode=fill_mode,
+                                    cval=cval)
+
+
+def rotation_matrix(angle):
+    theta = np.pi / 180 * angle
+    return np.array([[math.cos(theta), -math.sin(theta), 0],
+                     [math.sin(theta), math.cos(theta), 0],
+                     [0, 0, 1]])
+
+
+def shift_matrix(shift_x, shift_y):
+    # the image content moves by (shift_y, shift_x) (rows, columns)
+    return np.array([[1, 0, -shift_y],
+                     [0, 1, -shift_x],
+                     [0, 0, 1]])
+
+
+def shear_matrix(shear):
+    return np.array([[1, -math.sin(shear), 0],
+                     [0, math.cos(shear), 0],
+                     [0, 0, 1]])
+
+
+def zoom_matrix(zoom_w, zoom_h):
+    # a zoom factor larger than 1 enlarges the content of the image
+    return np.array([[1. / zoom_h, 0, 0],
+                     [0, 1. / zoom_w, 0],
+                     [0, 0, 1]])
+
+
 def random_rotation(x, rg, fill_mode="nearest", cval=0.):
     angle = random.uniform(-rg, rg)
-    x = ndimage.interpolation.rotate(x, angle,
-                                     axes=(1, 2),
-                                     reshape=False,
-                                     mode=fill_mode,
-                                     cval=cval)
-    return x
+    matrix = transform_matrix_offset_center(rotation_matrix(angle),
+                                            x.shape[1], x.shape[2])
+    return apply_transform(x, matrix, fill_mode, cval)
 
 
 def random_shift(x, wrg, hrg, fill_mode="nearest", cval=0.):
     shift_x = shift_y = 0
-    
+
     if wrg:
         shift_x = random.uniform(-wrg, wrg) * x.shape[2]
     if hrg:
         shift_y = random.uniform(-hrg, hrg) * x.shape[1]
-        
-    x = ndimage.interpolation.shift(x, (0, shift_y, shift_x),
-                                    order=0,
-                                    mode=fill_mode,
-                                    cval=cval)
-    return x
+
+    return apply_transform(x, shift_matrix(shift_x, shift_y), fill_mode, cval)
 
 
 def horizontal_flip(x):
@@ -61,28 +108,27 @@ def random_barrel_transform(x, intensity):
 
 def random_shear(x, intensity, fill_mode="nearest", cval=0.):
     shear = random.uniform(-intensity, intensity)
-    shear_matrix = np.array([[1.0, -math.sin(shear), 0.0],
-                            [0.0, math.cos(shear), 0.0],
-                            [0.0, 0.0, 1.0]])
-    x = ndimage.interpolation.affine_transform(x, shear_matrix,
-                                               mode=fill_mode,
-                                               order=3,
-                                               cval=cval)
-    return x
+    matrix = transform_matrix_offset_center(shear_matrix(shear),
+                                            x.shape[1], x.shape[2])
+    return apply_transform(x, matrix, fill_mode, cval)
 
 
-def random_channel_shift(x, rg):
-    # TODO
-    pass
+def random_channel_shift(x, intensity):
+    '''Add to each channel of `x` a random value in
+    `[-intensity, intensity]`, clipping to the range of values of `x`.
+    '''
+    shifts = np.array([random.uniform(-intensity, intensity)
+                       for _ in range(x.shape[0])], dtype=x.dtype)
+    min_x, max_x = np.min(x), np.max(x)
+    return np.clip(x + shifts.reshape((-1, 1, 1)), min_x, max_x)
 
 
 def random_zoom(x, rg, fill_mode="nearest", cval=0.):
     zoom_w = random.uniform(1.-rg, 1.)
     zoom_h = random.uniform(1.-rg, 1.)
-    x = ndimage.interpolation.zoom(x, zoom=(1., zoom_w, zoom_h),
-                                   mode=fill_mode,
-                                   cval=cval)
-    return x  # shape of result will be different from shape of input!
+    matrix = transform_matrix_offset_center(zoom_matrix(zoom_w, zoom_h),
+                                            x.shape[1], x.shape[2])
+    return apply_transform(x, matrix, fill_mode, cval)
 
 
 def array_to_img(x, scale=True):
@@ -111,13 +157,29 @@ def img_to_array(img):
     return x
 
 
-def load_img(path, grayscale=False):
+def load_img(path, grayscale=False, target_size=None):
+    '''Load an image as a PIL image.
+
+    # Arguments
+        path: path of the image file.
+        grayscale: whether to convert the image to grayscale
+            (otherwise it is converted to RGB).
+        target_size: None or (rows, cols). Size to which the image is
+            resized. JPEG images are downscaled while they are decoded
+            (PIL draft mode), which is much faster than decoding them
+            at full resolution.
+    '''
     from PIL import Image
     img = Image.open(path)
-    if grayscale:
-        img = img.convert('L')
-    else:  # Ensure 3 channel even when loaded image is grayscale
-        img = img.convert('RGB')
+    mode = 'L' if grayscale else 'RGB'
+    if target_size:
+        size = (target_size[1], target_size[0])
+        # only JPEG supports draft mode (no-op for the other formats)
+        img.draft(mode, size)
+    # Ensure 3 channel even when loaded image is grayscale
+    img = img.convert(mode)
+    if target_size and img.size != size:
+        img = img.resize(size, Image.BILINEAR)
     return img
 
 
@@ -126,10 +188,124 @@ def list_pictures(directory, ext='jpg|jpeg|bmp|png'):
             if isfile(join(directory, f)) and re.match('([\w]+\.(?:' + ext + '))', f)]
 
 
+class ImageDirectory(object):
+    '''Images of a directory with one subdirectory per class,
+    which can be indexed like an array of shape
+    (nb_images, channels, rows, cols) and dtype uint8.
+
+    Images are decoded and resized by a pool of threads when
+    a batch is read (`X[indices]`), and the decoded images can be
+    kept in a size-bounded LRU cache.
+
+    # Arguments
+        directory: path of the directory. Each subdirectory contains
+            the images of one class.
+        target_size: (rows, cols). Size to which the images are resized.
+        grayscale: whether to load the images as grayscale (1 channel)
+            or RGB (3 channels).
+        classes: list of the names of the subdirectories to use,
+            in the order of their class indices (default: all the
+            subdirectories, sorted by name).
+        ext: regular expression of the extensions of the image files.
+        nb_worker: number of threads decoding the images.
+        cache_size: maximum size, in bytes, of the cache of decoded
+            images (0 to disable the cache).
+
+    # Attributes
+        filenames: list of the paths of the images.
+        classes: numpy array of the class index of each image.
+        class_indices: dictionary mapping class names to class indices.
+    '''
+    def __init__(self, directory, target_size=(256, 256), grayscale=False,
+                 classes=None, ext='jpg|jpeg|bmp|png', nb_worker=4,
+                 cache_size=0):
+        if classes is None:
+            classes = sorted([d for d in listdir(directory)
+                              if isdir(join(directory, d))])
+        self.class_indices = dict(zip(classes, range(len(classes))))
+        self.filenames = []
+        labels = []
+        for label, subdir in enumerate(classes):
+            filenames = sorted(list_pictures(join(directory, subdir), ext=ext))
+            self.filenames += filenames
+            labels += [label] * len(filenames)
+        self.classes = np.array(labels, dtype='int32')
+
+        self.target_size = tuple(target_size)
+        self.grayscale = grayscale
+        self.nb_channel = 1 if grayscale else 3
+        self.nb_worker = nb_worker
+        self.pool = None
+        self.image_bytes = self.nb_channel * self.target_size[0] * self.target_size[1]
+        self.max_images = cache_size // self.image_bytes
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.filenames)
+
+    @property
+    def shape(self):
+        return (len(self.filenames), self.nb_channel) + self.target_size
+
+    @property
+    def dtype(self):
+        return np.dtype('uint8')
+
+    @property
+    def ndim(self):
+        return 4
+
+    def _load(self, index):
+        with self.lock:
+            if index in self.cache:
+                self.cache[index] = self.cache.pop(index)
+                return self.cache[index]
+        img = load_img(self.filenames[index], grayscale=self.grayscale,
+                       target_size=self.target_size)
+        x = np.asarray(img, dtype='uint8')
+        if x.ndim == 3:
+            x = x.transpose(2, 0, 1)
+        else:
+            x = x.reshape((1,) + x.shape)
+        if self.max_images:
+            with self.lock:
+                self.cache[index] = x
+                while len(self.cache) > self.max_images:
+                    self.cache.popitem(last=False)
+        return x
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self._load(int(key) % len(self))
+        indices = np.arange(len(self))[key]
+        out = np.empty((len(indices),) + self.shape[1:], dtype=self.dtype)
+        if self.nb_worker > 1 and len(indices) > 1:
+            if self.pool is None:
+                self.pool = ThreadPool(self.nb_worker)
+            images = self.pool.map(self._load, indices.tolist())
+        else:
+            images = [self._load(i) for i in indices.tolist()]
+        for i, x in enumerate(images):
+            out[i] = x
+        return out
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        self.cache.clear()
+
+
 class ImageDataGenerator(object):
     '''Generate minibatches with
     realtime data augmentation.
     '''
+    # attributes computed by fit (see save_statistics)
+    statistics = ['mean', 'std', 'principal_components',
+                  'zca_components', 'zca_scales']
+
     def __init__(self,
                  featurewise_center=True,  # set input mean to 0 over the dataset
                  samplewise_center=False,  # set each sample mean to 0
@@ -140,13 +316,39 @@ class ImageDataGenerator(object):
                  width_shift_range=0.,  # fraction of total width
                  height_shift_range=0.,  # fraction of total height
                  shear_range=0.,  # shear intensity (shear angle in radians)
+                 zoom_range=0.,  # float or [lower, upper] range of zoom factors
+                 channel_shift_range=0.,  # range of random shifts of the channel values
+                 fill_mode="nearest",  # points outside the input: "constant", "nearest", "reflect" or "wrap"
+                 cval=0.,  # value used for points outside the input if fill_mode="constant"
                  horizontal_flip=False,
-                 vertical_flip=False):
+                 vertical_flip=False,
+                 dtype='float32'):  # dtype of the generated batches
 
         self.__dict__.update(locals())
+        if np.dtype(dtype).kind in 'iu' and (featurewise_center or samplewise_center or
+                                             featurewise_std_normalization or
+                                             samplewise_std_normalization or
+                                             zca_whitening):
+            raise Exception('Batches of integer dtype (' + str(dtype) + ') '
+                            'cannot be centered, normalized or whitened: '
+                            'disable featurewise_center, samplewise_center, '
+                            'featurewise_std_normalization, '
+                            'samplewise_std_normalization and zca_whitening, '
+                            'and normalize the images in the model instead '
+                            '(e.g. with `Rescale` or `Normalize` layers).')
+        if np.isscalar(zoom_range):
+            self.zoom_range = [1 - zoom_range, 1 + zoom_range]
+        elif len(zoom_range) == 2:
+            self.zoom_range = [zoom_range[0], zoom_range[1]]
+        else:
+            raise Exception('zoom_range should be a float or '
+                            'a tuple or list of two floats. '
+                            'Received: ' + str(zoom_range))
         self.mean = None
         self.std = None
         self.principal_components = None
+        self.zca_components = None
+        self.zca_scales = None
         self.lock = threading.Lock()
 
     def _flow_index(self, N, batch_size=32, shuffle=False, seed=None):
@@ -186,6 +388,55 @@ class ImageDataGenerator(object):
         self.flow_generator = self._flow_index(X.shape[0], batch_size, shuffle, seed)
         return self
 
+    def flow_from_directory(self, directory, target_size=(256, 256),
+                            color_mode='rgb', classes=None,
+                            class_mode='categorical', batch_size=32,
+                            shuffle=True, seed=None, nb_worker=4,
+                            cache_size=0, save_to_dir=None,
+                            save_prefix="", save_format="jpeg"):
+        '''Generate batches from the images of a directory with one
+        subdirectory per class, which are loaded while iterating
+        (see `ImageDirectory`).
+
+        # Arguments
+            directory: path of the directory.
+            target_size: (rows, cols). Size to which the images are resized.
+            color_mode: "rgb" or "grayscale".
+            classes: list of the subdirectories to use (default: all).
+            class_mode: "categorical" (one-hot labels), "binary"
+                (0 or 1 labels), "sparse" (integer labels)
+                or None (the labels are the class indices).
+            batch_size, shuffle, seed, save_to_dir, save_prefix,
+            save_format: see `flow`.
+            nb_worker: number of threads decoding the images.
+            cache_size: maximum size, in bytes, of the cache
+                of decoded images.
+        '''
+        if color_mode not in {'rgb', 'grayscale'}:
+            raise Exception('Invalid color mode: ' + str(color_mode) +
+                            '; expected "rgb" or "grayscale".')
+        X = ImageDirectory(directory, target_size=target_size,
+                           grayscale=color_mode == 'grayscale',
+                           classes=classes, nb_worker=nb_worker,
+                           cache_size=cache_size)
+        nb_class = len(X.class_indices)
+        if class_mode == 'categorical':
+            y = np.eye(nb_class, dtype=self.dtype)[X.classes]
+        elif class_mode == 'binary':
+            if nb_class != 2:
+                raise Exception('class_mode="binary" requires 2 classes, '
+                                'found %d.' % nb_class)
+            y = X.classes.astype(self.dtype)
+        elif class_mode in {'sparse', None}:
+            y = X.classes
+        else:
+            raise Exception('Invalid class_mode: ' + str(class_mode) +
+                            '; expected "categorical", "binary", '
+                            '"sparse" or None.')
+        return self.flow(X, y, batch_size=batch_size, shuffle=shuffle,
+                         seed=seed, save_to_dir=save_to_dir,
+                         save_prefix=save_prefix, save_format=save_format)
+
     def __iter__(self):
         # needed if we want to do something like for x,y in data_gen.flow(...):
         return self
@@ -197,12 +448,19 @@ class ImageDataGenerator(object):
         with self.lock:
             index_array, current_index, current_batch_size = next(self.flow_generator)
         # The transformation of images is not under thread lock so it can be done in parallel
-        bX = np.zeros(tuple([current_batch_size] + list(self.X.shape)[1:]))
-        for i, j in enumerate(index_array):
-            x = self.X[j]
-            x = self.random_transform(x.astype("float32"))
-            x = self.standardize(x)
-            bX[i] = x
+        bX = np.empty(tuple([current_batch_size] + list(self.X.shape)[1:]), dtype=self.dtype)
+        if isinstance(self.X, ImageDirectory):
+            # decode the images of the batch in parallel
+            X = self.X[index_array]
+            batch_indices = range(current_batch_size)
+        else:
+            X = self.X
+            batch_indices = index_array
+        for i, j in enumerate(batch_indices):
+            # only the geometric transforms are done image by image
+            bX[i] = self.random_affine_transform(X[j].astype(self.dtype))
+        bX = self.random_batch_transform(bX)
+        bX = self.standardize_batch(bX)
         if self.save_to_dir:
             for i in range(current_batch_size):
                 img = array_to_img(bX[i], scale=True)
@@ -215,72 +473,252 @@ class ImageDataGenerator(object):
         return self.next()
 
     def standardize(self, x):
+        return self.standardize_batch(x[np.newaxis])[0]
+
+    def standardize_batch(self, X):
+        '''Standardize a batch of images (in place when possible).
+        '''
         if self.featurewise_center:
-            x -= self.mean
+            X -= self.mean
         if self.featurewise_std_normalization:
-            x /= self.std
+            X /= self.std
 
         if self.zca_whitening:
-            flatx = np.reshape(x, (x.shape[0]*x.shape[1]*x.shape[2]))
-            whitex = np.dot(flatx, self.principal_components)
-            x = np.reshape(whitex, (x.shape[0], x.shape[1], x.shape[2]))
+            flatX = np.reshape(X, (X.shape[0], -1))
+            if self.principal_components is not None:
+                whiteX = np.dot(flatX, self.principal_components)
+            else:
+                # low-rank ZCA (see fit(zca_rank))
+                whiteX = np.dot(np.dot(flatX, self.zca_components) * self.zca_scales,
+                                self.zca_components.T)
+            X = np.reshape(whiteX, X.shape)
 
+        axes = tuple(range(1, X.ndim))
         if self.samplewise_center:
-            x -= np.mean(x)
+            X -= np.mean(X, axis=axes, keepdims=True)
         if self.samplewise_std_normalization:
-            x /= np.std(x)
+            X /= np.std(X, axis=axes, keepdims=True)
 
-        return x
+        return X
 
     def random_transform(self, x):
-        if self.rotation_range:
-            x = random_rotation(x, self.rotation_range)
-        if self.width_shift_range or self.height_shift_range:
-            x = random_shift(x, self.width_shift_range, self.height_shift_range)
+        x = self.random_affine_transform(x)
+        return self.random_batch_transform(x[np.newaxis])[0]
+
+    def random_batch_transform(self, X):
+        '''Random channel shifts and flips of a batch of images,
+        drawn independently for each image.
+        '''
+        nb_sample = X.shape[0]
+        if self.channel_shift_range:
+            shifts = np.random.uniform(-self.channel_shift_range, self.channel_shift_range,
+                                       (nb_sample, X.shape[1], 1, 1))
+            min_X = np.min(X, axis=(1, 2, 3), keepdims=True)
+            max_X = np.max(X, axis=(1, 2, 3), keepdims=True)
+            if X.dtype.kind == 'f':
+                X = np.clip(X + shifts.astype(X.dtype), min_X, max_X)
+            else:
+                # integer images are shifted without wrapping around
+                X = np.clip(np.round(X + shifts), min_X, max_X).astype(X.dtype)
         if self.horizontal_flip:
-            if random.random() < 0.5:
-                x = horizontal_flip(x)
+            flip = np.random.random(nb_sample) < 0.5
+            X[flip] = X[flip, :, :, ::-1]
         if self.vertical_flip:
-            if random.random() < 0.5:
-                x = vertical_flip(x)
+            flip = np.random.random(nb_sample) < 0.5
+            X[flip] = X[flip, :, ::-1, :]
+        return X
+
+    def random_affine_transform(self, x):
+        # rotation, shift, shear and zoom are composed into a single
+        # transform, so that the image is only resampled once
+        transform_matrix = np.eye(3)
+        if self.rotation_range:
+            angle = random.uniform(-self.rotation_range, self.rotation_range)
+            transform_matrix = np.dot(transform_matrix, rotation_matrix(angle))
+        if self.width_shift_range or self.height_shift_range:
+            shift_x = random.uniform(-self.width_shift_range, self.width_shift_range) * x.shape[2]
+            shift_y = random.uniform(-self.height_shift_range, self.height_shift_range) * x.shape[1]
+            transform_matrix = np.dot(transform_matrix, shift_matrix(shift_x, shift_y))
         if self.shear_range:
-            x = random_shear(x,self.shear_range)
+            shear = random.uniform(-self.shear_range, self.shear_range)
+            transform_matrix = np.dot(transform_matrix, shear_matrix(shear))
+        if self.zoom_range[0] != 1 or self.zoom_range[1] != 1:
+            zoom_w = random.uniform(self.zoom_range[0], self.zoom_range[1])
+            zoom_h = random.uniform(self.zoom_range[0], self.zoom_range[1])
+            transform_matrix = np.dot(transform_matrix, zoom_matrix(zoom_w, zoom_h))
+        if not np.array_equal(transform_matrix, np.eye(3)):
+            transform_matrix = transform_matrix_offset_center(transform_matrix,
+                                                              x.shape[1], x.shape[2])
+            x = apply_transform(x, transform_matrix, self.fill_mode, self.cval)
         # TODO:
-        # zoom
         # barrel/fisheye
-        # shearing
-        # channel shifting
         return x
 
+    def _fit_batches(self, X, augment, rounds, batch_size, nb_sample):
+        '''Iterate over the batches of `X` used by `fit`, as float64 arrays.
+        '''
+        if hasattr(X, 'shape'):
+            # array-like: numpy array, HDF5Matrix, keras.data.Dataset...
+            nb_pass = rounds if augment else 1
+            batches = (X[start:start + batch_size]
+                       for _ in range(nb_pass)
+                       for start in range(0, len(X), batch_size))
+        else:
+            # iterator or generator of batches (or of (X, y) tuples)
+            batches = (batch[0] if isinstance(batch, tuple) else batch
+                       for batch in X)
+        seen = 0
+        for batch in batches:
+            if nb_sample is not None and seen >= nb_sample:
+                return
+            batch = np.array(batch, dtype=self.dtype)
+            if augment:
+                for i in range(len(batch)):
+                    batch[i] = self.random_affine_transform(batch[i])
+                batch = self.random_batch_transform(batch)
+            seen += len(batch)
+            yield batch.astype('float64')
+
     def fit(self, X,
             augment=False,  # fit on randomly augmented samples
             rounds=1,  # if augment, how many augmentation passes over the data do we use
-            seed=None):
+            seed=None,
+            batch_size=256,
+            nb_sample=None,
+            zca_rank=None):
         '''Required for featurewise_center, featurewise_std_normalization and zca_whitening.
-        '''
-        X = np.copy(X)
-        if augment:
-            aX = np.zeros(tuple([rounds*X.shape[0]]+list(X.shape)[1:]))
-            for r in range(rounds):
-                for i in range(X.shape[0]):
-                    img = array_to_img(X[i])
-                    img = self.random_transform(img)
-                    aX[i+r*X.shape[0]] = img_to_array(img)
-            X = aX
 
+        The statistics are computed in a single pass over batches of `X`,
+        which is never loaded in memory at once: mean and variance are
+        accumulated with the parallel algorithm of Chan et al., and so is
+        the covariance used by ZCA whitening (or a random sketch of it,
+        see `zca_rank`).
+
+        # Arguments
+            X: numpy array, array-like (e.g. HDF5Matrix, `keras.data.Dataset`
+                or the `X` of `flow_from_directory`), or iterator over
+                batches of samples (or over (X, y) tuples).
+            augment: whether to fit on randomly augmented samples.
+            rounds: if augment, number of augmentation passes over `X`
+                (array-likes only).
+            seed: random seed.
+            batch_size: number of samples read at once from array-likes.
+            nb_sample: maximum number of samples to use (required
+                for infinite iterators).
+            zca_rank: None, or number of principal components kept by
+                ZCA whitening. If None, the covariance matrix (of size
+                d*d, for d features) is computed and decomposed exactly.
+                Otherwise it is approximated from a Nystrom sketch of
+                rank `zca_rank` (memory d*zca_rank), and the whitening
+                projects the samples onto these components.
+        '''
+        if seed is not None:
+            np.random.seed(seed)
+            random.seed(seed)
+
+        n = 0
+        mean = None
+        for batch in self._fit_batches(X, augment, rounds, batch_size, nb_sample):
+            flat = batch.reshape((len(batch), -1))
+            batch_n = len(flat)
+            batch_mean = flat.mean(axis=0)
+            centered = flat - batch_mean
+            batch_m2 = np.sum(centered ** 2, axis=0)
+            if mean is None:
+                shape = batch.shape[1:]
+                d = flat.shape[1]
+                mean = np.zeros(d)
+                m2 = np.zeros(d)
+                if self.zca_whitening and zca_rank is None:
+                    comoment = np.zeros((d, d))
+                elif self.zca_whitening:
+                    omega = np.random.normal(size=(d, min(d, zca_rank + 10)))
+                    sketch = np.zeros(omega.shape)
+            # combine the batch statistics with the running statistics
+            delta = batch_mean - mean
+            total = n + batch_n
+            weight = float(n) * batch_n / total
+            m2 += batch_m2 + delta ** 2 * weight
+            if self.zca_whitening and zca_rank is None:
+                comoment += np.dot(centered.T, centered) + np.outer(delta, delta) * weight
+            elif self.zca_whitening:
+                sketch += (np.dot(centered.T, np.dot(centered, omega)) +
+                           np.outer(delta, np.dot(delta, omega)) * weight)
+            mean += delta * batch_n / total
+            n = total
+        if not n:
+            raise Exception('No samples to fit on.')
+
+        std = np.sqrt(m2 / n)
         if self.featurewise_center:
-            self.mean = np.mean(X, axis=0)
-            X -= self.mean
+            self.mean = mean.reshape(shape)
         if self.featurewise_std_normalization:
-            self.std = np.std(X, axis=0)
-            X /= self.std
+            self.std = std.reshape(shape)
 
         if self.zca_whitening:
-            flatX = np.reshape(X, (X.shape[0], X.shape[1]*X.shape[2]*X.shape[3]))
+            # covariance of the samples as standardized by `standardize`
+            scale = std if self.featurewise_std_normalization else np.ones_like(std)
             fudge = 10e-6
-            sigma = np.dot(flatX.T, flatX) / flatX.shape[1]
-            U, S, V = linalg.svd(sigma)
-            self.principal_components = np.dot(np.dot(U, np.diag(1. / np.sqrt(S + fudge))), U.T)
+            if zca_rank is None:
+                sigma = comoment / n
+                if not self.featurewise_center:
+                    sigma += np.outer(mean, mean)
+                sigma /= np.outer(scale, scale)
+                S, U = linalg.eigh(sigma)
+                S = np.maximum(S, 0)
+                self.principal_components = np.dot(U / np.sqrt(S + fudge), U.T)
+                self.zca_components = None
+                self.zca_scales = None
+            else:
+                # sigma * omega, for the test matrix omega * scale
+                sigma_omega = sketch / n
+                if not self.featurewise_center:
+                    sigma_omega += np.outer(mean, np.dot(mean, omega))
+                sigma_omega /= scale[:, None]
+                omega *= scale[:, None]
+                S, U = nystrom_eigh(sigma_omega, omega)
+                self.principal_components = None
+                self.zca_components = U[:, :zca_rank]
+                self.zca_scales = 1. / np.sqrt(S[:zca_rank] + fudge)
+
+        # the batches are standardized in self.dtype
+        for name in self.statistics:
+            if getattr(self, name) is not None:
+                setattr(self, name, getattr(self, name).astype(self.dtype))
+
+    def save_statistics(self, filepath):
+        '''Save the statistics computed by `fit` to a `.npz` file.
+        '''
+        np.savez(filepath, **dict((name, getattr(self, name))
+                                  for name in self.statistics
+                                  if getattr(self, name) is not None))
+
+    def load_statistics(self, filepath):
+        '''Load statistics saved by `save_statistics`, instead of
+        calling `fit`.
+        '''
+        f = np.load(filepath)
+        for name in self.statistics:
+            setattr(self, name, f[name].astype(self.dtype) if name in f.files else None)
+        f.close()
+
+
+def nystrom_eigh(sketch, omega):
+    '''Eigendecomposition of the Nystrom approximation of a positive
+    semi-definite matrix `A`, given `sketch = A * omega`, with `omega`
+    a random test matrix (Tropp et al., 2017).
+
+    Returns the eigenvalues, in decreasing order, and the eigenvectors
+    (as columns).
+    '''
+    nu = np.finfo('float64').eps * np.linalg.norm(sketch)
+    sketch = sketch + nu * omega
+    B = np.dot(omega.T, sketch)
+    B = (B + B.T) / 2
+    C = linalg.cholesky(B, lower=False)
+    E = linalg.solve_triangular(C, sketch.T, trans='T', lower=False).T
+    U, sigma, _ = linalg.svd(E, full_matrices=False)
+    return np.maximum(sigma ** 2 - nu, 0), U
 
 
 class GraphImageDataGenerator(ImageDataGenerator):
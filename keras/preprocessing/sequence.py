@@ -1,9 +1,115 @@
 from __future__ import absolute_import
 # -*- coding: utf-8 -*-
+import itertools
+import os
 import numpy as np
 import random
 from six.moves import range
 
+class RaggedSequences(object):
+    '''A list of variable-length sequences stored as two arrays:
+    the concatenation of all the sequences (`values`, int32 by default)
+    and the position of each sequence in it (`offsets`, int64):
+    the i-th sequence is `values[offsets[i]:offsets[i + 1]]`.
+
+    Indexing with an int returns a sequence (as a numpy array),
+    indexing with a slice, an array of indices or a boolean mask
+    returns a new RaggedSequences. Contiguous slices are views,
+    so that memory-mapped sequences are not loaded.
+
+    # Arguments
+        values: 1D numpy array.
+        offsets: 1D int64 numpy array of size `len(sequences) + 1`,
+            starting with 0.
+    '''
+    def __init__(self, values, offsets):
+        if len(offsets) == 0 or offsets[0] != 0 or offsets[-1] != len(values):
+            raise Exception("offsets should start with 0 and end with len(values).")
+        self.values = values
+        self.offsets = offsets
+
+    @classmethod
+    def from_sequences(cls, sequences, dtype='int32'):
+        '''Build a RaggedSequences from a list of sequences.
+        '''
+        if isinstance(sequences, RaggedSequences):
+            return cls(sequences.values.astype(dtype, copy=False), sequences.offsets)
+        lengths = np.array([len(s) for s in sequences], dtype='int64')
+        offsets = np.zeros((len(lengths) + 1,), dtype='int64')
+        np.cumsum(lengths, out=offsets[1:])
+        values = np.fromiter(itertools.chain.from_iterable(sequences),
+                             dtype=dtype, count=offsets[-1])
+        return cls(values, offsets)
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def shape(self):
+        return (len(self),)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.values[self.offsets[i]:self.offsets[i + 1]]
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError("index out of range")
+            return self.values[self.offsets[key]:self.offsets[key + 1]]
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                stop = max(start, stop)
+                offsets = self.offsets[start:stop + 1]
+                values = self.values[offsets[0]:offsets[-1]]
+                return RaggedSequences(values, offsets - offsets[0])
+            key = np.arange(start, stop, step)
+        key = np.asarray(key)
+        if key.dtype == np.bool_:
+            key = np.nonzero(key)[0]
+        return self.take(key)
+
+    def take(self, indices):
+        '''Return the sequences at the given indices, as a RaggedSequences.
+        '''
+        indices = np.asarray(indices, dtype='int64').ravel()
+        lengths = self.lengths[indices]
+        offsets = np.zeros((len(indices) + 1,), dtype='int64')
+        np.cumsum(lengths, out=offsets[1:])
+        positions = np.arange(offsets[-1]) - np.repeat(offsets[:-1], lengths)
+        values = self.values[np.repeat(self.offsets[indices], lengths) + positions]
+        return RaggedSequences(values, offsets)
+
+    def tolist(self):
+        return [s.tolist() for s in self]
+
+    def save(self, path):
+        '''Save the sequences to the directory `path` (created if needed),
+        as numpy arrays that `load` can memory-map.
+        '''
+        if not os.path.exists(path):
+            os.makedirs(path)
+        np.save(os.path.join(path, 'values.npy'), self.values)
+        np.save(os.path.join(path, 'offsets.npy'), self.offsets)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        '''Load sequences saved with `save`.
+        `mmap_mode` is passed to `np.load` (e.g. 'r' for read-only
+        memory-mapping).
+        '''
+        values = np.load(os.path.join(path, 'values.npy'), mmap_mode=mmap_mode)
+        offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode=mmap_mode)
+        return cls(values, offsets)
+
+
 def pad_sequences(sequences, maxlen=None, dtype='int32', padding='pre', truncating='pre', value=0.):
     """
         Pad each sequence to the same length:
@@ -17,7 +123,8 @@ def pad_sequences(sequences, maxlen=None, dtype='int32', padding='pre', truncati
 
         Parameters:
         -----------
-        sequences: list of lists where each element is a sequence
+        sequences: list of lists where each element is a sequence,
+            or RaggedSequences
         maxlen: int, maximum length
         dtype: type to cast the resulting sequence.
         padding: 'pre' or 'post', pad either before or after each sequence.
@@ -29,32 +136,184 @@ def pad_sequences(sequences, maxlen=None, dtype='int32', padding='pre', truncati
         x: numpy array with dimensions (number_of_sequences, maxlen)
 
     """
-    lengths = [len(s) for s in sequences]
+    if truncating not in {'pre', 'post'}:
+        raise ValueError("Truncating type '%s' not understood" % truncating)
+    if padding not in {'pre', 'post'}:
+        raise ValueError("Padding type '%s' not understood" % padding)
+    if not isinstance(sequences, RaggedSequences):
+        sequences = RaggedSequences.from_sequences(sequences, dtype=dtype)
 
+    lengths = sequences.lengths
     nb_samples = len(sequences)
     if maxlen is None:
-        maxlen = np.max(lengths)
-
-    x = (np.ones((nb_samples, maxlen)) * value).astype(dtype)
-    for idx, s in enumerate(sequences):
-        if len(s) == 0:
-            continue # empty list was found
-        if truncating == 'pre':
-            trunc = s[-maxlen:]
-        elif truncating == 'post':
-            trunc = s[:maxlen]
-        else:
-            raise ValueError("Truncating type '%s' not understood" % padding)
+        maxlen = int(np.max(lengths)) if nb_samples else 0
 
-        if padding == 'post':
-            x[idx, :len(trunc)] = trunc
-        elif padding == 'pre':
-            x[idx, -len(trunc):] = trunc
-        else:
-            raise ValueError("Padding type '%s' not understood" % padding)
+    # all the kept values are copied at once: for each of them,
+    # compute its position in `sequences.values` and in `x`
+    kept = np.minimum(lengths, maxlen)
+    ends = np.cumsum(kept)
+    positions = np.arange(ends[-1] if nb_samples else 0) - np.repeat(ends - kept, kept)
+    if truncating == 'pre':
+        starts = sequences.offsets[1:] - kept
+    else:
+        starts = sequences.offsets[:-1]
+    if padding == 'pre':
+        columns = maxlen - kept
+    else:
+        columns = np.zeros_like(kept)
+
+    x = np.full((nb_samples, maxlen), value, dtype=dtype)
+    rows = np.repeat(np.arange(nb_samples), kept)
+    x[rows, np.repeat(columns, kept) + positions] = sequences.values[np.repeat(starts, kept) + positions]
     return x
 
 
+def pack_sequences(sequences, maxlen, y=None, dtype='int32', truncating='pre'):
+    '''
+        Pack several short sequences per row of a fixed-length array,
+        instead of padding each of them to `maxlen`.
+        Sequences are placed one after the other, in order, and a new
+        row is started when the next sequence doesn't fit.
+
+        Feed the result to an `Embedding(packed=True)` layer: the states
+        of the following recurrent layers are reset at the start of each
+        sequence, and padding is masked out of the loss.
+
+        Parameters:
+        -----------
+        sequences: list of sequences, or RaggedSequences.
+        maxlen: int, length of the rows. Longer sequences are truncated.
+        y: None, or list of per-timestep targets (numpy arrays of shape
+            `(len(sequence), ...)`), one per sequence.
+        dtype: type of the returned array.
+        truncating: 'pre' or 'post', remove values from sequences larger
+            than maxlen either in the beginning or in the end of the sequence.
+
+        Returns:
+        --------
+        X: numpy array of shape `(nb_rows, 2, maxlen)`, where `X[:, 0]`
+            are the packed sequences and `X[:, 1]` are segment ids
+            (the i-th sequence of a row has segment id i, starting at 1,
+            and padding has segment id 0).
+        If `y` is not None, a tuple `(X, y_packed)` where `y_packed` has
+        shape `(nb_rows, maxlen, ...)`, aligned with `X[:, 0]`.
+    '''
+    if truncating not in {'pre', 'post'}:
+        raise ValueError("Truncating type '%s' not understood" % truncating)
+    if not isinstance(sequences, RaggedSequences):
+        sequences = RaggedSequences.from_sequences(sequences, dtype=dtype)
+    kept = np.minimum(sequences.lengths, maxlen)
+    nb_samples = len(sequences)
+
+    # assign a row, a start column and a segment id to each sequence
+    rows = np.zeros((nb_samples,), dtype='int64')
+    columns = np.zeros((nb_samples,), dtype='int64')
+    segments = np.zeros((nb_samples,), dtype='int64')
+    row, fill, segment = 0, 0, 0
+    for i, length in enumerate(kept.tolist()):
+        if fill + length > maxlen:
+            row, fill, segment = row + 1, 0, 0
+        segment += 1
+        rows[i], columns[i], segments[i] = row, fill, segment
+        fill += length
+    nb_rows = row + 1 if nb_samples else 0
+
+    ends = np.cumsum(kept)
+    positions = np.arange(ends[-1] if nb_samples else 0) - np.repeat(ends - kept, kept)
+    if truncating == 'pre':
+        starts = sequences.offsets[1:] - kept
+    else:
+        starts = sequences.offsets[:-1]
+    sources = np.repeat(starts, kept) + positions
+    destination = (np.repeat(rows, kept), np.repeat(columns, kept) + positions)
+
+    X = np.zeros((nb_rows, 2, maxlen), dtype=dtype)
+    X[:, 0][destination] = sequences.values[sources]
+    X[:, 1][destination] = np.repeat(segments, kept)
+    if y is None:
+        return X
+
+    y_values = np.concatenate([np.asarray(t) for t in y])
+    if len(y_values) != sequences.offsets[-1]:
+        raise Exception("Each target sequence of y should have "
+                        "the length of its input sequence.")
+    y_packed = np.zeros((nb_rows, maxlen) + y_values.shape[1:], dtype=y_values.dtype)
+    y_packed[destination] = y_values[sources]
+    return X, y_packed
+
+
+def bucket_batches(sequences, y=None, batch_size=32, maxlen=None, dtype='int32',
+                   padding='pre', truncating='pre', value=0., shuffle=True,
+                   sort_window=100, sample_weight=None):
+    '''
+        Generator of batches of sequences of similar lengths, each batch
+        being padded only to the length of its longest sequence
+        (at most `maxlen`), to be used with `fit_generator`.
+        This saves most of the time spent by recurrent layers on padding
+        (the model should not fix the number of timesteps,
+        e.g. don't pass `input_length` to `Embedding`).
+        Padding with 0 is compatible with `Embedding(mask_zero=True)`.
+
+        Each epoch, the samples are shuffled, sorted by length by windows
+        of `sort_window` batches, split into batches, and the order of the
+        batches is shuffled. The generator loops indefinitely:
+        use `samples_per_epoch=len(sequences)`
+        (or `Sequential.fit(..., bucket_by_length=True)`).
+        It yields nothing if `sequences` is empty.
+
+        Parameters:
+        -----------
+        sequences: list of sequences, or RaggedSequences.
+        y: None or numpy array of targets (one per sequence).
+        batch_size: int.
+        maxlen, dtype, padding, truncating, value: see `pad_sequences`.
+        shuffle: if False, samples are sorted by length once
+            and batches are always generated in the same order.
+        sort_window: int, number of batches whose samples are sorted
+            together. Higher values give batches of more similar lengths
+            but less random batch compositions.
+        sample_weight: None or numpy array of sample weights.
+
+        Yields:
+        -------
+        the padded batch of sequences if `y` is None, else
+        `(X_batch, y_batch)` or `(X_batch, y_batch, sample_weight_batch)`.
+    '''
+    if not isinstance(sequences, RaggedSequences):
+        sequences = RaggedSequences.from_sequences(sequences, dtype=dtype)
+    lengths = sequences.lengths
+    if maxlen is not None:
+        lengths = np.minimum(lengths, maxlen)
+    nb_samples = len(sequences)
+    if not nb_samples:
+        return
+
+    while True:
+        if shuffle:
+            index_array = np.random.permutation(nb_samples)
+        else:
+            index_array = np.arange(nb_samples)
+        window = nb_samples if not shuffle else batch_size * sort_window
+        for start in range(0, nb_samples, window):
+            chunk = index_array[start:start + window]
+            order = np.argsort(lengths[chunk], kind='mergesort')
+            index_array[start:start + window] = chunk[order]
+        batches = [index_array[i:i + batch_size] for i in range(0, nb_samples, batch_size)]
+        if shuffle:
+            np.random.shuffle(batches)
+
+        for batch_ids in batches:
+            X_batch = pad_sequences(sequences.take(batch_ids), maxlen=max(int(lengths[batch_ids].max()), 1),
+                                    dtype=dtype, padding=padding, truncating=truncating,
+                                    value=value)
+            if y is None:
+                yield X_batch
+            elif sample_weight is None:
+                yield X_batch, y[batch_ids]
+            else:
+                yield X_batch, y[batch_ids], sample_weight[batch_ids]
+
+
 def make_sampling_table(size, sampling_factor=1e-5):
     '''
         This generates an array where the ith element
@@ -82,6 +341,179 @@ def make_sampling_table(size, sampling_factor=1e-5):
     return np.minimum(1., f / np.sqrt(f))
 
 
+def make_alias_table(probabilities):
+    '''
+        Build the tables of Walker's alias method, to draw samples from
+        a discrete distribution in constant time per sample
+        (see `alias_sample`).
+
+        Parameters:
+        -----------
+        probabilities: 1D array of non-negative weights (normalized here).
+
+        Returns:
+        --------
+        prob, alias: float64 and int32 arrays of the size of `probabilities`.
+    '''
+    probabilities = np.asarray(probabilities, dtype='float64')
+    n = len(probabilities)
+    prob = probabilities * n / probabilities.sum()
+    alias = np.arange(n, dtype='int32')
+    small = list(np.nonzero(prob < 1.)[0])
+    large = list(np.nonzero(prob >= 1.)[0])
+    while small and large:
+        s, l = small.pop(), large.pop()
+        alias[s] = l
+        prob[l] -= 1. - prob[s]
+        if prob[l] < 1.:
+            small.append(l)
+        else:
+            large.append(l)
+    # leftovers are only due to rounding errors
+    prob[small + large] = 1.
+    return prob, alias
+
+
+def alias_sample(prob, alias, size):
+    '''
+        Draw `size` samples (int32) with the tables of `make_alias_table`.
+    '''
+    i = np.random.randint(0, len(prob), size=size)
+    keep = np.random.random(size) < prob[i]
+    return np.where(keep, i, alias[i]).astype('int32')
+
+
+def skipgram_batches(sequences, vocabulary_size, batch_size=1024,
+                     window_size=4, negative_samples=1., sampling_table=None,
+                     word_counts=None, shuffle=True, chunk_size=1000000):
+    '''
+        Vectorized, streaming version of `skipgrams`: generator of
+        fixed-size batches of (word, context) couples and labels,
+        to be used with `fit_generator`.
+
+        Positive couples are (word, word in the same window of the same
+        sequence). Words are subsampled with `sampling_table` (couples are
+        only generated for the words kept). Negative couples are
+        (word, random word), where random words are drawn from the unigram
+        distribution raised to the power 0.75, as in word2vec.
+
+        The sequences are processed by chunks of about `chunk_size` words,
+        and the generator loops over them indefinitely.
+
+        Parameters:
+        -----------
+        sequences: list of sequences of word indexes, or RaggedSequences.
+        vocabulary_size: int. maximum possible word index + 1
+        batch_size: int, number of couples per batch.
+        window_size: int. actually half-window.
+        negative_samples: float >= 0. number of negative couples
+            per positive couple.
+        sampling_table: None, or array of shape `(vocabulary_size,)` of
+            sampling probabilities (see `make_sampling_table`).
+        word_counts: None, or array of shape `(vocabulary_size,)` of word
+            frequencies, used to draw the negative samples.
+            If None, the index of a word is assumed to be its rank,
+            and frequencies to follow Zipf's law.
+        shuffle: whether to shuffle the couples of each chunk.
+        chunk_size: int, number of words processed at once.
+
+        Yields:
+        -------
+        ([words, contexts], labels): three int32 arrays of shape
+            `(batch_size,)`, where labels are 1 for positive couples
+            and 0 for negative couples.
+
+        Notes:
+        ------
+        By convention, index 0 in the vocabulary is a non-word and will be skipped.
+    '''
+    if not isinstance(sequences, RaggedSequences):
+        sequences = RaggedSequences.from_sequences(sequences)
+    if word_counts is None:
+        word_counts = 1. / np.arange(1, vocabulary_size)
+        word_counts = np.concatenate([[0.], word_counts])
+    word_counts = np.asarray(word_counts, dtype='float64').copy()
+    word_counts[0] = 0.
+    prob, alias = make_alias_table(word_counts ** 0.75)
+
+    offsets = sequences.offsets
+    nb_sequences = len(sequences)
+    buffers = []
+    nb_buffered = 0
+    nb_yielded = 0
+    while True:
+        start = 0
+        while start < nb_sequences:
+            # a chunk of whole sequences, of about chunk_size words
+            stop = np.searchsorted(offsets, offsets[start] + chunk_size, side='right') - 1
+            stop = min(max(stop, start + 1), nb_sequences)
+            chunk = sequences[start:stop]
+            start = stop
+            words, contexts, labels = _skipgram_chunk(chunk, window_size, negative_samples,
+                                                      sampling_table, prob, alias)
+            if shuffle:
+                index_array = np.random.permutation(len(labels))
+                words, contexts, labels = words[index_array], contexts[index_array], labels[index_array]
+            if len(labels):
+                buffers.append((words, contexts, labels))
+                nb_buffered += len(labels)
+            if nb_buffered < batch_size:
+                continue
+
+            words, contexts, labels = [np.concatenate(b) for b in zip(*buffers)]
+            nb_batches = nb_buffered // batch_size
+            for i in range(nb_batches):
+                batch = slice(i * batch_size, (i + 1) * batch_size)
+                yield [words[batch], contexts[batch]], labels[batch]
+            rest = slice(nb_batches * batch_size, None)
+            buffers = [(words[rest], contexts[rest], labels[rest])]
+            nb_buffered -= nb_batches * batch_size
+            nb_yielded += nb_batches
+        if not nb_yielded:
+            raise Exception('The sequences produced fewer than batch_size=%d '
+                            'couples (%d) in a whole pass: use a smaller '
+                            'batch_size, or longer sequences (or a less '
+                            'aggressive sampling_table).' % (batch_size, nb_buffered))
+
+
+def _skipgram_chunk(sequences, window_size, negative_samples,
+                    sampling_table, prob, alias):
+    values = np.asarray(sequences.values, dtype='int32')
+    nb_words = len(values)
+    sequence_ids = np.repeat(np.arange(len(sequences)), sequences.lengths)
+
+    centers = values != 0
+    if sampling_table is not None:
+        centers &= np.asarray(sampling_table)[values] >= np.random.random(nb_words)
+    center_indices = np.nonzero(centers)[0]
+
+    words = []
+    contexts = []
+    for d in range(-window_size, window_size + 1):
+        if d == 0:
+            continue
+        i = center_indices
+        j = i + d
+        valid = (j >= 0) & (j < nb_words)
+        i, j = i[valid], j[valid]
+        valid = (sequence_ids[i] == sequence_ids[j]) & (values[j] != 0)
+        words.append(values[i[valid]])
+        contexts.append(values[j[valid]])
+    words = np.concatenate(words)
+    contexts = np.concatenate(contexts)
+    nb_positive = len(words)
+    labels = np.ones((nb_positive,), dtype='int32')
+
+    nb_negative = int(nb_positive * negative_samples)
+    if nb_negative and nb_positive:
+        negative_words = words[np.random.randint(0, nb_positive, size=nb_negative)]
+        negative_contexts = alias_sample(prob, alias, nb_negative)
+        words = np.concatenate([words, negative_words])
+        contexts = np.concatenate([contexts, negative_contexts])
+        labels = np.concatenate([labels, np.zeros((nb_negative,), dtype='int32')])
+    return words.astype('int32'), contexts.astype('int32'), labels
+
+
 def skipgrams(sequence, vocabulary_size,
               window_size=4, negative_samples=1., shuffle=True,
               categorical=False, sampling_table=None):
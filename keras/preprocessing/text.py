@@ -5,11 +5,18 @@
 '''
 from __future__ import absolute_import
 
+import itertools
+import json
+import os
 import string
 import sys
+import zlib
+from collections import Counter
 import numpy as np
 from six.moves import range
 from six.moves import zip
+from six.moves import map
+from .sequence import RaggedSequences
 
 if sys.version_info < (3,):
     maketrans = string.maketrans
@@ -24,12 +31,25 @@ def base_filter():
     return f
 
 
+_translation_tables = {}
+
+
+def translation_table(filters, split):
+    '''Table mapping each character of `filters` to `split`,
+    for use with `str.translate`. Tables are cached.
+    '''
+    key = (filters, split)
+    if key not in _translation_tables:
+        _translation_tables[key] = maketrans(filters, split*len(filters))
+    return _translation_tables[key]
+
+
 def text_to_word_sequence(text, filters=base_filter(), lower=True, split=" "):
     '''prune: sequence of characters to filter out
     '''
     if lower:
         text = text.lower()
-    text = text.translate(maketrans(filters, split*len(filters)))
+    text = text.translate(translation_table(filters, split))
     seq = text.split(split)
     return [_f for _f in seq if _f]
 
@@ -39,9 +59,163 @@ def one_hot(text, n, filters=base_filter(), lower=True, split=" "):
     return [(abs(hash(w)) % (n - 1) + 1) for w in seq]
 
 
+def hash_word(word, n):
+    '''Map a word to an integer in [1, n), in a way that does not
+    depend on the Python process (unlike the builtin `hash`).
+    '''
+    if not isinstance(word, bytes):
+        word = word.encode('utf-8')
+    return (zlib.crc32(word) & 0xffffffff) % (n - 1) + 1
+
+
+def _count_chunk(args):
+    '''Count words (or hashed indices) in a chunk of texts.
+    Module-level so that it can be sent to worker processes.
+    '''
+    texts, filters, lower, split, char_level, hash_space = args
+    word_counts = Counter()
+    word_docs = Counter()
+    for text in texts:
+        seq = text if char_level else text_to_word_sequence(text, filters, lower, split)
+        if hash_space:
+            seq = [hash_word(w, hash_space) for w in seq]
+        else:
+            word_counts.update(seq)
+        word_docs.update(set(seq))
+    return word_counts, word_docs, len(texts)
+
+
+def _load_array(path, mmap):
+    if mmap:
+        try:
+            return np.load(path, mmap_mode='r')
+        except ValueError:
+            # older numpy versions can't memory-map empty arrays
+            pass
+    return np.load(path)
+
+
+class VocabularyMapping(object):
+    '''Read-only mapping from words to integers, backed by arrays
+    (possibly memory-mapped) instead of Python objects:
+    a table of the utf-8 encoded words, sorted, concatenated in a uint8 array,
+    the `offsets` (int64, one more than the number of words)
+    of each word in the table, and the aligned `values` (int64).
+    Negative values mark words that are not part of the mapping.
+
+    Lookups are binary searches over the table.
+    '''
+    def __init__(self, table, offsets, values):
+        self.table = table
+        self.offsets = offsets
+        self.values = values
+        self.length = int(np.count_nonzero(np.asarray(values) >= 0))
+
+    def _word(self, i):
+        return self.table[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def _find(self, word):
+        if not isinstance(word, bytes):
+            word = word.encode('utf-8')
+        lo, hi = 0, len(self.values)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._word(mid) < word:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.values) and self._word(lo) == word and self.values[lo] >= 0:
+            return lo
+        return None
+
+    def get(self, word, default=None):
+        i = self._find(word)
+        if i is None:
+            return default
+        return int(self.values[i])
+
+    def __getitem__(self, word):
+        i = self._find(word)
+        if i is None:
+            raise KeyError(word)
+        return int(self.values[i])
+
+    def __contains__(self, word):
+        return self._find(word) is not None
+
+    def __len__(self):
+        return self.length
+
+    def items(self):
+        for i in range(len(self.values)):
+            if self.values[i] >= 0:
+                yield self._word(i).decode('utf-8'), int(self.values[i])
+
+    def keys(self):
+        return (w for w, _ in self.items())
+
+    def __iter__(self):
+        return self.keys()
+
+
+class IndexMapping(object):
+    '''Read-only mapping from integers to integers, backed by
+    the sorted int64 array `keys` and the aligned `values`.
+    '''
+    def __init__(self, keys, values):
+        self.keys_array = keys
+        self.values_array = values
+
+    def _find(self, key):
+        i = int(np.searchsorted(self.keys_array, key))
+        if i < len(self.keys_array) and self.keys_array[i] == key:
+            return i
+        return None
+
+    def get(self, key, default=None):
+        i = self._find(key)
+        if i is None:
+            return default
+        return int(self.values_array[i])
+
+    def __getitem__(self, key):
+        i = self._find(key)
+        if i is None:
+            raise KeyError(key)
+        return int(self.values_array[i])
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __len__(self):
+        return len(self.keys_array)
+
+    def items(self):
+        return zip(self.keys_array.tolist(), self.values_array.tolist())
+
+    def keys(self):
+        return iter(self.keys_array.tolist())
+
+    def __iter__(self):
+        return self.keys()
+
+
+_worker_tokenizer = None
+
+
+def _init_worker_tokenizer(tokenizer):
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+
+def _sequences_chunk(texts):
+    return _worker_tokenizer._texts_to_sequences_chunk(texts)
+
+
 class Tokenizer(object):
     def __init__(self, nb_words=None, filters=base_filter(),
-                 lower=True, split=' ', char_level=False):
+                 lower=True, split=' ', char_level=False, hashing=False,
+                 min_count=1, max_vocab_size=None):
         '''The class allows to vectorize a text corpus, by turning each
         text into either a sequence of integers (each integer being the index
         of a token in a dictionary) or into a vector where the coefficient
@@ -57,6 +231,18 @@ class Tokenizer(object):
             lower: boolean. Whether to convert the texts to lowercase.
             split: character or string to use for token splitting.
             char_level: if True, every character will be treated as a word.
+            hashing: if True, words are mapped to indices with `hash_word`
+                instead of a fitted vocabulary, so that no `word_index`
+                needs to be kept in memory. Indices are then in
+                `[1, nb_words)`, or in `[1, 2**31 - 1)` if `nb_words` is
+                None (for use with a `HashedEmbedding` layer).
+            min_count: words appearing less than `min_count` times
+                are not indexed.
+            max_vocab_size: if not None, the maximum number of distinct words
+                counted during fitting. When it is exceeded, the least
+                frequent words are dropped (with a threshold that keeps
+                increasing), which bounds memory on very large corpora
+                at the cost of approximate counts for rare words.
 
         By default, all punctuation is removed, turning the texts into
         space-separated sequences of words
@@ -65,46 +251,115 @@ class Tokenizer(object):
 
         `0` is a reserved index that won't be assigned to any word.
         '''
-        self.word_counts = {}
-        self.word_docs = {}
+        self.word_counts = Counter()
+        self.word_docs = Counter()
+        self.word_index = {}
+        self.index_docs = {}
         self.filters = filters
         self.split = split
         self.lower = lower
         self.nb_words = nb_words
         self.document_count = 0
         self.char_level = char_level
+        self.hashing = hashing
+        self.min_count = min_count
+        self.max_vocab_size = max_vocab_size
+        self.min_reduce = 1
 
-    def fit_on_texts(self, texts):
+    def hash_space(self):
+        '''Upper bound (excluded) of the indices produced in hashing mode.
+        '''
+        return self.nb_words or 2 ** 31 - 1
+
+    def fit_on_texts(self, texts, nb_worker=1, chunk_size=10000):
         '''
             required before using texts_to_sequences or texts_to_matrix
+            (except in hashing mode, where it only collects the document
+            frequencies needed by the "tfidf" mode of texts_to_matrix)
+
+            Fitting is incremental: calling it several times
+            is equivalent to calling it once on all the texts.
 
         # Arguments
             texts: can be a list of strings,
                 or a generator of strings (for memory-efficiency)
+            nb_worker: number of processes used to count words.
+            chunk_size: number of texts counted at once by a worker.
         '''
-        self.document_count = 0
-        for text in texts:
-            self.document_count += 1
-            seq = text if self.char_level else text_to_word_sequence(text, self.filters, self.lower, self.split)
-            for w in seq:
-                if w in self.word_counts:
-                    self.word_counts[w] += 1
-                else:
-                    self.word_counts[w] = 1
-            for w in set(seq):
-                if w in self.word_docs:
-                    self.word_docs[w] += 1
-                else:
-                    self.word_docs[w] = 1
+        hash_space = self.hash_space() if self.hashing else None
+        chunks = ((chunk, self.filters, self.lower, self.split, self.char_level, hash_space)
+                  for chunk in self._chunks(texts, chunk_size))
+        if nb_worker > 1:
+            results = self._pool_map(_count_chunk, chunks, nb_worker)
+        else:
+            results = (_count_chunk(chunk) for chunk in chunks)
+        if self.hashing:
+            self.index_docs = Counter(dict(self.index_docs.items()))
+        elif not isinstance(self.word_counts, Counter):
+            # continue fitting a tokenizer loaded with `Tokenizer.load`
+            self.word_counts = Counter(dict(self.word_counts.items()))
+            self.word_docs = Counter(dict(self.word_docs.items()))
 
-        wcounts = list(self.word_counts.items())
+        for word_counts, word_docs, document_count in results:
+            self.document_count += document_count
+            if self.hashing:
+                self.index_docs.update(word_docs)
+                continue
+            self.word_counts.update(word_counts)
+            self.word_docs.update(word_docs)
+            self._prune_vocab()
+
+        if self.hashing:
+            return
+        wcounts = [wc for wc in self.word_counts.items() if wc[1] >= self.min_count]
         wcounts.sort(key=lambda x: x[1], reverse=True)
         sorted_voc = [wc[0] for wc in wcounts]
         self.word_index = dict(list(zip(sorted_voc, list(range(1, len(sorted_voc) + 1)))))
 
         self.index_docs = {}
-        for w, c in list(self.word_docs.items()):
-            self.index_docs[self.word_index[w]] = c
+        for w, i in list(self.word_index.items()):
+            self.index_docs[i] = self.word_docs[w]
+
+    def _chunks(self, texts, chunk_size):
+        texts = iter(texts)
+        while True:
+            chunk = list(itertools.islice(texts, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def _pool_map(self, function, chunks, nb_worker, initializer=None, initargs=()):
+        '''Apply `function` to chunks in a pool of processes, yielding
+        the results in order. At most `2 * nb_worker` chunks are read ahead,
+        so that streamed corpora are never loaded entirely in memory.
+        '''
+        import multiprocessing
+        pool = multiprocessing.Pool(nb_worker, initializer, initargs)
+        try:
+            pending = []
+            for chunk in chunks:
+                pending.append(pool.apply_async(function, (chunk,)))
+                if len(pending) >= 2 * nb_worker:
+                    yield pending.pop(0).get()
+            for result in pending:
+                yield result.get()
+        finally:
+            pool.terminate()
+
+    def _prune_vocab(self):
+        '''Drop the least frequent words until there are no more than
+        `max_vocab_size` of them. The count threshold is kept between
+        calls, so that a word dropped once needs to be frequent enough
+        to survive the next pruning.
+        '''
+        if not self.max_vocab_size:
+            return
+        while len(self.word_counts) > self.max_vocab_size:
+            self.word_counts = Counter(dict((w, c) for w, c in self.word_counts.items()
+                                            if c > self.min_reduce))
+            self.word_docs = Counter(dict((w, c) for w, c in self.word_docs.items()
+                                          if w in self.word_counts))
+            self.min_reduce += 1
 
     def fit_on_sequences(self, sequences):
         '''
@@ -145,6 +400,10 @@ class Tokenizer(object):
         nb_words = self.nb_words
         for text in texts:
             seq = text if self.char_level else text_to_word_sequence(text, self.filters, self.lower, self.split)
+            if self.hashing:
+                n = self.hash_space()
+                yield [hash_word(w, n) for w in seq]
+                continue
             vect = []
             for w in seq:
                 i = self.word_index.get(w)
@@ -155,18 +414,108 @@ class Tokenizer(object):
                         vect.append(i)
             yield vect
 
-    def texts_to_matrix(self, texts, mode="binary"):
+    def texts_to_sequences_batch(self, texts, nb_worker=1, chunk_size=10000):
+        '''
+            Transform each text in texts in a sequence of integers,
+            like `texts_to_sequences`, but processing the texts in chunks:
+            each chunk is lowercased, filtered and split at once,
+            and the words are looked up without per-token Python code.
+
+        # Arguments
+            texts: list (or generator) of strings.
+            nb_worker: number of processes used to tokenize chunks.
+            chunk_size: number of texts processed at once.
+
+        # Returns
+            A `RaggedSequences` of int32 word indices
+            (one sequence per text).
+        '''
+        chunks = self._chunks(texts, chunk_size)
+        if nb_worker > 1:
+            results = self._pool_map(_sequences_chunk, chunks, nb_worker,
+                                     _init_worker_tokenizer, (self,))
+        else:
+            results = (self._texts_to_sequences_chunk(chunk) for chunk in chunks)
+
+        all_ids = []
+        all_offsets = [np.zeros((1,), dtype='int64')]
+        nb_ids = 0
+        for ids, offsets in results:
+            all_ids.append(ids)
+            all_offsets.append(offsets[1:] + nb_ids)
+            nb_ids += len(ids)
+        if all_ids:
+            ids = np.concatenate(all_ids)
+        else:
+            ids = np.zeros((0,), dtype='int32')
+        return RaggedSequences(ids, np.concatenate(all_offsets))
+
+    def _texts_to_sequences_chunk(self, texts):
+        if self.char_level:
+            seqs = texts
+        else:
+            # filter and split the whole chunk at once, with texts
+            # joined by a separator that can't be filtered out, and
+            # that doesn't occur in the texts (else they would be split)
+            texts = list(texts)
+            separator = '\x00'
+            while True:
+                if (separator not in self.filters and separator != self.split and
+                        separator.lower() == separator):
+                    text = separator.join(texts)
+                    if text.count(separator) == max(len(texts) - 1, 0):
+                        break
+                separator = chr(ord(separator) + 1)
+            if self.lower:
+                text = text.lower()
+            text = text.translate(translation_table(self.filters, self.split))
+            seqs = [t.split(self.split) for t in text.split(separator)]
+        lengths = np.fromiter(map(len, seqs), dtype='int64', count=len(seqs))
+        tokens = list(itertools.chain.from_iterable(seqs))
+
+        # -1 for empty, unknown or out of range tokens
+        if self.hashing:
+            n = self.hash_space()
+            lookup = dict((w, hash_word(w, n)) for w in set(tokens) if w)
+        elif isinstance(self.word_index, dict):
+            lookup = self.word_index
+        else:
+            # array-backed vocabulary: look up each distinct word once
+            lookup = dict((w, self.word_index.get(w, -1)) for w in set(tokens))
+        ids = np.fromiter(map(lookup.get, tokens, itertools.repeat(-1)),
+                          dtype='int64', count=len(tokens))
+        if self.nb_words and not self.hashing:
+            ids[ids >= self.nb_words] = -1
+
+        rows = np.repeat(np.arange(len(seqs)), lengths)
+        offsets = np.zeros((len(seqs) + 1,), dtype='int64')
+        offsets[1:] = np.cumsum(np.bincount(rows[ids >= 0], minlength=len(seqs)))
+        return ids[ids >= 0].astype('int32'), offsets
+
+    def texts_to_matrix(self, texts, mode="binary", output="dense", dtype="float64"):
         '''
             modes: binary, count, tfidf, freq
+            See `sequences_to_matrix` for `output` and `dtype`.
         '''
         sequences = self.texts_to_sequences(texts)
-        return self.sequences_to_matrix(sequences, mode=mode)
+        return self.sequences_to_matrix(sequences, mode=mode, output=output, dtype=dtype)
 
-    def sequences_to_matrix(self, sequences, mode="binary"):
+    def sequences_to_matrix(self, sequences, mode="binary", output="dense", dtype="float64"):
         '''
             modes: binary, count, tfidf, freq
+
+        # Arguments
+            sequences: list of sequences of word indices.
+                Indices outside of `[0, nb_words)` are ignored.
+            mode: one of "binary", "count", "tfidf", "freq".
+            output: "dense" to return a numpy array,
+                "csr" to return a `scipy.sparse.csr_matrix`
+                (only the non-zero coefficients are stored).
+            dtype: dtype of the returned matrix.
         '''
         if not self.nb_words:
+            if self.hashing:
+                raise Exception("Specify a dimension (nb_words argument) to vectorize texts in hashing mode.")
             if self.word_index:
                 nb_words = len(self.word_index) + 1
             else:
@@ -174,32 +523,143 @@ class Tokenizer(object):
         else:
             nb_words = self.nb_words
 
+        if mode not in {"binary", "count", "tfidf", "freq"}:
+            raise Exception("Unknown vectorization mode: " + str(mode))
+        if output not in {"dense", "csr"}:
+            raise Exception("Unknown output type: " + str(output))
         if mode == "tfidf" and not self.document_count:
             raise Exception("Fit the Tokenizer on some data before using tfidf mode.")
 
-        X = np.zeros((len(sequences), nb_words))
-        for i, seq in enumerate(sequences):
-            if not seq:
-                pass
-            counts = {}
-            for j in seq:
-                if j >= nb_words:
-                    pass
-                if j not in counts:
-                    counts[j] = 1.
-                else:
-                    counts[j] += 1
-            for j, c in list(counts.items()):
-                if mode == "count":
-                    X[i][j] = c
-                elif mode == "freq":
-                    X[i][j] = c / len(seq)
-                elif mode == "binary":
-                    X[i][j] = 1
-                elif mode == "tfidf":
-                    tf = np.log(c / len(seq))
-                    df = (1 + np.log(1 + self.index_docs.get(j, 0) / (1 + self.document_count)))
-                    X[i][j] = tf / df
-                else:
-                    raise Exception("Unknown vectorization mode: " + str(mode))
-        return X
+        nb_samples = len(sequences)
+        lengths = np.array([len(seq) for seq in sequences], dtype="int64")
+        flat = np.fromiter(itertools.chain.from_iterable(sequences),
+                           dtype="int64", count=lengths.sum())
+        rows = np.repeat(np.arange(nb_samples, dtype="int64"), lengths)
+        keep = (flat >= 0) & (flat < nb_words)
+        rows = rows[keep]
+        cols = flat[keep]
+
+        if output == "dense":
+            # count the (row, col) pairs with a bincount of their flat
+            # (int64) index, by chunks of rows to bound the buffer size
+            keys = rows.astype("int64") * nb_words + cols
+            chunk_rows = max(1, (1 << 22) // nb_words)
+            all_keys = []
+            all_counts = []
+            for start in range(0, nb_samples, chunk_rows):
+                stop = min(start + chunk_rows, nb_samples)
+                lo, hi = np.searchsorted(rows, [start, stop])
+                offset = start * nb_words
+                chunk_counts = np.bincount(keys[lo:hi] - offset,
+                                           minlength=(stop - start) * nb_words)
+                nonzero = np.flatnonzero(chunk_counts)
+                all_keys.append(nonzero + offset)
+                all_counts.append(chunk_counts[nonzero])
+            if all_keys:
+                keys = np.concatenate(all_keys)
+                counts = np.concatenate(all_counts)
+            else:
+                counts = keys
+            rows, cols = np.divmod(keys, nb_words)
+        else:
+            from scipy import sparse
+            # duplicate (row, col) entries are summed when converting to CSR
+            X = sparse.coo_matrix((np.ones(len(rows), dtype="int64"), (rows, cols)),
+                                  shape=(nb_samples, nb_words)).tocsr()
+            counts = X.data
+            rows = np.repeat(np.arange(nb_samples), np.diff(X.indptr))
+            cols = X.indices
+
+        counts = counts.astype("float64")
+        if mode == "count":
+            values = counts
+        elif mode == "freq":
+            values = counts / lengths[rows]
+        elif mode == "binary":
+            values = np.ones_like(counts)
+        elif mode == "tfidf":
+            docs = np.zeros((nb_words,), dtype="float64")
+            if isinstance(self.index_docs, IndexMapping):
+                keys = np.asarray(self.index_docs.keys_array)
+                keep = (keys >= 0) & (keys < nb_words)
+                docs[keys[keep]] = np.asarray(self.index_docs.values_array)[keep]
+            else:
+                for i, c in list(self.index_docs.items()):
+                    if 0 <= i < nb_words:
+                        docs[i] = c
+            tf = np.log(counts / lengths[rows])
+            df = 1 + np.log(1 + docs / (1 + self.document_count))
+            values = tf / df[cols]
+
+        if output == "dense":
+            X = np.zeros((nb_samples, nb_words), dtype=dtype)
+            X[rows, cols] = values
+            return X
+        return sparse.csr_matrix((values.astype(dtype), X.indices, X.indptr),
+                                 shape=(nb_samples, nb_words))
+
+    def save(self, path):
+        '''Save the tokenizer to the directory `path` (created if needed),
+        as numpy arrays that `Tokenizer.load` can memory-map.
+        '''
+        if not os.path.exists(path):
+            os.makedirs(path)
+        config = {'nb_words': self.nb_words,
+                  'filters': self.filters,
+                  'lower': self.lower,
+                  'split': self.split,
+                  'char_level': self.char_level,
+                  'hashing': self.hashing,
+                  'min_count': self.min_count,
+                  'max_vocab_size': self.max_vocab_size,
+                  'min_reduce': self.min_reduce,
+                  'document_count': self.document_count}
+        with open(os.path.join(path, 'config.json'), 'w') as f:
+            json.dump(config, f)
+
+        words = []
+        for w in self.word_counts.keys():
+            words.append((w if isinstance(w, bytes) else w.encode('utf-8'), w))
+        words.sort()
+        offsets = np.zeros((len(words) + 1,), dtype='int64')
+        offsets[1:] = np.cumsum([len(b) for b, _ in words])
+        table = np.array(bytearray(b''.join([b for b, _ in words])), dtype='uint8')
+        arrays = {'words': table,
+                  'offsets': offsets,
+                  'word_index': [self.word_index.get(w, -1) for _, w in words],
+                  'word_counts': [self.word_counts[w] for _, w in words],
+                  'word_docs': [self.word_docs.get(w, 0) for _, w in words]}
+        index_docs = sorted(self.index_docs.items())
+        arrays['index_docs_keys'] = [i for i, _ in index_docs]
+        arrays['index_docs_values'] = [c for _, c in index_docs]
+        for name, array in arrays.items():
+            if name != 'words':
+                array = np.asarray(array, dtype='int64')
+            np.save(os.path.join(path, name + '.npy'), array)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        '''Load a tokenizer saved with `save`.
+        Its vocabulary is backed by the saved arrays
+        (memory-mapped if `mmap` is True), so that loading is immediate
+        and lookups don't require deserializing Python objects.
+        '''
+        with open(os.path.join(path, 'config.json')) as f:
+            config = json.load(f)
+        document_count = config.pop('document_count')
+        min_reduce = config.pop('min_reduce')
+        tokenizer = cls(**config)
+        tokenizer.document_count = document_count
+        tokenizer.min_reduce = min_reduce
+
+        def load_array(name):
+            return _load_array(os.path.join(path, name + '.npy'), mmap)
+
+        table = load_array('words')
+        offsets = load_array('offsets')
+        tokenizer.word_index = VocabularyMapping(table, offsets, load_array('word_index'))
+        tokenizer.word_counts = VocabularyMapping(table, offsets, load_array('word_counts'))
+        tokenizer.word_docs = VocabularyMapping(table, offsets, load_array('word_docs'))
+        tokenizer.index_docs = IndexMapping(load_array('index_docs_keys'),
+                                            load_array('index_docs_values'))
+        return tokenizer
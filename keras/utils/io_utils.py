@@ -1,55 +1,169 @@
 from __future__ import absolute_import
 import h5py
+import threading
 import numpy as np
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from six.moves import queue
 
 
-class HDF5Matrix():
+class HDF5Matrix(object):
+    '''Representation of HDF5 dataset which can be used instead of a
+    numpy array, e.g. as input data of `fit` or `predict`.
+
+    Rows are read by blocks aligned with the HDF5 chunks of the dataset
+    (or of about 1MB for contiguous datasets), which are kept in an LRU
+    cache. Any index array can be used (it is sorted internally, and the
+    rows are returned in the requested order), so that data can be
+    shuffled per sample. Blocks needed by the next batch can be read in
+    a background thread (see `prefetch`), which `fit` does automatically.
+
+    # Arguments
+        datapath: path of the HDF5 file.
+        dataset: name of the dataset in the file.
+        start: index of the first row to use.
+        end: index after the last row to use (default: all the rows).
+        normalizer: function applied to the arrays read.
+        cache_size: maximum size of the block cache, in bytes.
+        read_ahead: whether to read the blocks passed to `prefetch`
+            in a background thread.
+    '''
     refs = defaultdict(int)
+    files = {}
 
-    def __init__(self, datapath, dataset, start, end, normalizer=None):
-        if datapath not in list(self.refs.keys()):
-            f = h5py.File(datapath)
-            self.refs[datapath] = f
-        else:
-            f = self.refs[datapath]
+    def __init__(self, datapath, dataset, start=0, end=None, normalizer=None,
+                 cache_size=2 ** 28, read_ahead=True):
+        if self.refs[datapath] == 0:
+            self.files[datapath] = h5py.File(datapath, 'r')
+        self.refs[datapath] += 1
+        self.datapath = datapath
+        self.data = self.files[datapath][dataset]
         self.start = start
-        self.end = end
-        self.data = f[dataset]
+        self.end = self.data.shape[0] if end is None else end
         self.normalizer = normalizer
 
+        row_bytes = max(int(np.prod(self.data.shape[1:])) * self.data.dtype.itemsize, 1)
+        if self.data.chunks:
+            self.block_rows = self.data.chunks[0]
+        else:
+            self.block_rows = max(2 ** 20 // row_bytes, 1)
+        self.max_blocks = max(cache_size // (row_bytes * self.block_rows), 1)
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.pending = set()
+
+        self.read_ahead = read_ahead
+        self.queue = None
+        self.thread = None
+
     def __len__(self):
         return self.end - self.start
 
-    def __getitem__(self, key):
+    @property
+    def shape(self):
+        return (self.end - self.start,) + tuple(self.data.shape[1:])
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def _indices(self, key):
+        '''Convert `key` to an array of absolute row indices.
+        '''
+        n = len(self)
         if isinstance(key, slice):
-            if key.stop + self.start <= self.end:
-                idx = slice(key.start+self.start, key.stop + self.start)
-            else:
-                raise IndexError
-        elif isinstance(key, int):
-            if key + self.start < self.end:
-                idx = key+self.start
-            else:
-                raise IndexError
-        elif isinstance(key, np.ndarray):
-            if np.max(key) + self.start < self.end:
-                idx = (self.start + key).tolist()
-            else:
-                raise IndexError
-        elif isinstance(key, list):
-            if max(key) + self.start < self.end:
-                idx = [x + self.start for x in key]
-            else:
-                raise IndexError
+            return np.arange(*key.indices(n)) + self.start
+        key = np.asarray(key)
+        if key.dtype == np.bool_:
+            key = np.nonzero(key)[0]
+        key = key.astype('int64')
+        if key.size and (key.max() >= n or key.min() < -n):
+            raise IndexError
+        key = np.where(key < 0, key + n, key)
+        return key + self.start
+
+    def _read_block(self, block):
+        with self.lock:
+            if block in self.cache:
+                self.cache[block] = self.cache.pop(block)
+                return self.cache[block]
+        data = self.data[block * self.block_rows:(block + 1) * self.block_rows]
+        with self.lock:
+            self.cache[block] = data
+            self.pending.discard(block)
+            while len(self.cache) > self.max_blocks:
+                self.cache.popitem(last=False)
+        return data
+
+    def _read(self, indices):
+        '''Read the rows `indices` (absolute indices, in any order).
+        '''
+        order = np.argsort(indices, kind='mergesort')
+        sorted_indices = indices[order]
+        blocks = sorted_indices // self.block_rows
+        out = np.empty((len(indices),) + tuple(self.data.shape[1:]), dtype=self.data.dtype)
+        # boundaries of the runs of indices in the same block
+        bounds = np.concatenate([[0], np.nonzero(np.diff(blocks))[0] + 1, [len(blocks)]])
+        for run_start, run_end in zip(bounds[:-1], bounds[1:]):
+            block = int(blocks[run_start])
+            data = self._read_block(block)
+            rows = sorted_indices[run_start:run_end] - block * self.block_rows
+            out[order[run_start:run_end]] = data[rows]
+        return out
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            out = self._read(self._indices([key]))[0]
+        else:
+            out = self._read(self._indices(key))
         if self.normalizer is not None:
-            return self.normalizer(self.data[idx])
+            return self.normalizer(out)
         else:
-            return self.data[idx]
+            return out
 
-    @property
-    def shape(self):
-        return tuple([self.end - self.start, self.data.shape[1]])
+    def prefetch(self, key):
+        '''Read the blocks of the rows `key` in a background thread,
+        so that they are cached when `self[key]` is called.
+        '''
+        if not self.read_ahead:
+            return
+        if self.thread is None:
+            self.queue = queue.Queue()
+            self.thread = threading.Thread(target=self._read_ahead_loop)
+            self.thread.daemon = True
+            self.thread.start()
+        blocks = np.unique(self._indices(key) // self.block_rows)
+        with self.lock:
+            blocks = [int(b) for b in blocks
+                      if b not in self.cache and b not in self.pending]
+            # don't evict the blocks about to be used
+            blocks = blocks[:self.max_blocks // 2]
+            self.pending.update(blocks)
+        for block in blocks:
+            self.queue.put(block)
+
+    def _read_ahead_loop(self):
+        while True:
+            block = self.queue.get()
+            if block is None:
+                return
+            self._read_block(block)
+
+    def close(self):
+        '''Stop the read-ahead thread, and close the HDF5 file
+        if no other HDF5Matrix uses it.
+        '''
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        self.cache.clear()
+        self.refs[self.datapath] -= 1
+        if self.refs[self.datapath] == 0:
+            self.files.pop(self.datapath).close()
 
 
 def save_array(array, name):
@@ -10,6 +10,7 @@ from ..layers.embeddings import *
 from ..layers.noise import *
 from ..layers.normalization import *
 from ..layers.recurrent import *
+from ..layers.augmentation import *
 from ..layers import containers
 from .. import regularizers
 from .. import constraints
@@ -42,7 +43,8 @@ def container_from_config(original_layer_dict, custom_objects={}):
         for layer in layers:
             init_layer = container_from_config(layer)
             layer_list.append(init_layer)
-        seq_layer = containers.Sequential(layer_list)
+        seq_layer = containers.Sequential(layer_list,
+                                          checkpoint_every=layer_dict.get('checkpoint_every'))
         return seq_layer
 
     elif name == 'Graph':
@@ -1,6 +1,8 @@
 from __future__ import print_function
 import pytest
+import numpy as np
 from keras.datasets import cifar10, cifar100, reuters, imdb, mnist
+from keras.datasets.data_utils import sequences_to_arrays, load_sequence_data
 
 
 def test_cifar():
@@ -16,11 +18,41 @@ def test_reuters():
 
 def test_mnist():
     (X_train, y_train), (X_test, y_test) = mnist.load_data()
+    # the second call loads the cached arrays, writeable by default
+    (X_train, y_train), (X_test, y_test) = mnist.load_data()
+    assert not isinstance(X_train, np.memmap)
+    assert X_train.dtype == np.uint8
+    X_train[0] = 0
+    (X_train, y_train), (X_test, y_test) = mnist.load_data(mmap_mode='r')
+    assert isinstance(X_train, np.memmap)
 
 
 def test_imdb():
     (X_train, y_train), (X_test, y_test) = imdb.load_data()
     (X_train, y_train), (X_test, y_test) = imdb.load_data(maxlen=40)
+    (X_train, y_train), (X_test, y_test) = imdb.load_data(ragged=True)
+    assert len(X_train) == len(y_train)
+
+
+def test_load_sequence_data():
+    X = [[1, 2], [3, 4, 5], [6], [7, 8, 9, 10]]
+    labels = [0, 1, 2, 3]
+    arrays = sequences_to_arrays(X, labels)
+    (X_train, y_train), (X_test, y_test) = load_sequence_data(
+        arrays['values'], arrays['offsets'], arrays['labels'],
+        test_split=0.25, seed=1, start_char=1, oov_char=2, index_from=3,
+        nb_words=12)
+    assert len(X_train) == 3 and len(X_test) == 1
+    for x, y in zip(X_train + X_test, y_train + y_test):
+        assert x == [1] + [w + 3 if w + 3 < 12 else 2 for w in X[y]]
+
+    (X_train, y_train), (X_test, y_test) = load_sequence_data(
+        arrays['values'], arrays['offsets'], arrays['labels'],
+        test_split=0., maxlen=3, oov_char=None, start_char=None, index_from=0,
+        skip_top=2, nb_words=11, ragged=True)
+    assert sorted(y_train.tolist()) == [0, 2]
+    for x, y in zip(X_train, y_train):
+        assert x.tolist() == [w for w in X[y] if w >= 2]
 
 
 if __name__ == '__main__':
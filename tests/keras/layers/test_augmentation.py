@@ -0,0 +1,68 @@
+import pytest
+import numpy as np
+from numpy.testing import assert_allclose
+from keras import backend as K
+from keras.layers import core
+from keras.layers import augmentation
+
+batch_input_shape = (8, 3, 6, 5)
+
+
+def test_RandomFlip():
+    X = np.random.random(batch_input_shape)
+    layer = augmentation.RandomFlip(horizontal=True, vertical=True,
+                                    input_shape=batch_input_shape[1:])
+    _runner(layer, X, batch_input_shape)
+    layer.input = K.variable(X)
+    assert_allclose(K.eval(layer.get_output(train=False)), X)
+    output = K.eval(layer.get_output(train=True))
+    for x, y in zip(X, output):
+        assert any(np.allclose(x[:, ::i, ::j], y) for i in [1, -1] for j in [1, -1])
+
+
+def test_RandomCrop():
+    X = np.random.random(batch_input_shape)
+    layer = augmentation.RandomCrop((4, 4), input_shape=batch_input_shape[1:])
+    assert layer.output_shape == (None, 3, 4, 4)
+    _runner(layer, X, (8, 3, 4, 4))
+    layer.input = K.variable(X)
+    assert_allclose(K.eval(layer.get_output(train=False)), X[:, :, 1:5, 0:4])
+    output = K.eval(layer.get_output(train=True))
+    # the same crop for the whole batch
+    assert any(np.allclose(output, X[:, :, i:i + 4, j:j + 4])
+               for i in range(3) for j in range(2))
+
+    X = np.random.random((8, 6, 5, 3))
+    layer = augmentation.RandomCrop((4, 4), dim_ordering='tf',
+                                    input_shape=(6, 5, 3))
+    layer.input = K.variable(X)
+    assert_allclose(K.eval(layer.get_output(train=False)), X[:, 1:5, 0:4, :])
+
+
+def test_RandomTranslation():
+    X = np.random.random(batch_input_shape)
+    layer = augmentation.RandomTranslation(width_range=0.2, height_range=0.2,
+                                           input_shape=batch_input_shape[1:])
+    _runner(layer, X, batch_input_shape)
+    layer.input = K.variable(X)
+    assert_allclose(K.eval(layer.get_output(train=False)), X)
+    output = K.eval(layer.get_output(train=True))
+    padded = np.zeros((8, 3, 8, 7))
+    padded[:, :, 1:7, 1:6] = X
+    assert any(np.allclose(output, padded[:, :, i:i + 6, j:j + 5])
+               for i in range(3) for j in range(3))
+
+
+def _runner(layer, X, output_shape):
+    assert isinstance(layer, core.Layer)
+    layer.build()
+    conf = layer.get_config()
+    assert (type(conf) == dict)
+    layer.input = K.variable(X)
+    for train in [True, False]:
+        output_np = K.eval(layer.get_output(train=train))
+        assert output_np.shape == output_shape
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -1,6 +1,6 @@
 import pytest
 import numpy as np
-from keras.models import Sequential
+from keras.models import Sequential, model_from_json
 from numpy.testing import assert_allclose
 
 from keras import backend as K
@@ -67,6 +67,29 @@ def test_activation():
     _runner(layer)
 
 
+def test_rescale():
+    layer = core.Rescale(1. / 255, offset=-0.5, input_shape=(3, 4, 4),
+                         input_dtype='uint8')
+    _runner(layer)
+    assert layer.get_config()['input_dtype'] == 'uint8'
+    X = np.random.randint(0, 256, (2, 3, 4, 4)).astype('uint8')
+    f = K.function([layer.get_input()], [layer.get_output()])
+    assert_allclose(f([X])[0], X / 255. - 0.5, rtol=1e-5, atol=1e-6)
+
+
+def test_normalize():
+    mean = np.random.random((3, 1, 1)) * 100
+    std = np.random.random((3, 4, 4)) * 10 + 1
+    layer = core.Normalize(mean, std, input_shape=(3, 4, 4),
+                           input_dtype='uint8')
+    _runner(layer)
+    X = np.random.randint(0, 256, (2, 3, 4, 4)).astype('uint8')
+    f = K.function([layer.get_input()], [layer.get_output()])
+    assert_allclose(f([X])[0], (X - mean) / std, rtol=1e-4, atol=1e-4)
+    config = layer.get_config()
+    assert_allclose(core.Normalize(config['mean'], config['std']).mean, mean, rtol=1e-6)
+
+
 def test_reshape():
     layer = core.Reshape(dims=(10, 10))
     _runner(layer)
@@ -87,6 +110,36 @@ def test_dense():
     _runner(layer)
 
 
+def test_sampled_softmax():
+    nb_samples = 32
+    input_dim = 10
+    nb_class = 50
+    X = np.random.random((nb_samples, input_dim))
+    y = np.random.randint(nb_class, size=(nb_samples, 1))
+
+    model = Sequential()
+    model.add(core.Dense(input_dim, input_shape=(input_dim,)))
+    softmax = core.SampledSoftmax(nb_class, nb_sampled=5)
+    model.add(softmax)
+    model.compile(loss='sampled_softmax', optimizer='sgd')
+    model.fit(X, y, nb_epoch=1, batch_size=8, verbose=0)
+    # one output kept per mode
+    assert sorted(softmax._outputs.keys()) == [False, True]
+
+    probs = model.predict(X)
+    assert probs.shape == (nb_samples, nb_class)
+    assert_allclose(probs.sum(axis=-1), np.ones(nb_samples), rtol=1e-5)
+    # the test loss is the exact cross-entropy on the class indices
+    loss = model.evaluate(X, y, verbose=0)
+    expected = -np.log(probs[np.arange(nb_samples), y[:, 0]]).mean()
+    assert_allclose(loss, expected, rtol=1e-4)
+
+    # the objective is saved with the model
+    new_model = model_from_json(model.to_json())
+    new_model.set_weights(model.get_weights())
+    assert_allclose(new_model.evaluate(X, y, verbose=0), loss, rtol=1e-4)
+
+
 def test_act_reg():
     layer = core.ActivityRegularization(0.5, 0.5)
     _runner(layer)
@@ -3,8 +3,10 @@ import numpy as np
 from numpy.testing import assert_allclose
 from keras.models import Sequential
 from keras.layers.core import Dense, Activation, Flatten
-from keras.layers.embeddings import Embedding
+from keras.layers.embeddings import Embedding, HashedEmbedding
 from keras.constraints import unitnorm
+from keras.regularizers import activity_l2
+from keras.optimizers import SGD
 from keras import backend as K
 
 
@@ -27,5 +29,74 @@ def test_unitnorm_constraint():
     assert_allclose(norm, np.ones_like(norm).astype('float32'), rtol=1e-05)
 
 
+def test_sparse_updates():
+    X = np.array([[1, 1], [2, 1]], dtype='int32')
+    y = np.array([[1], [0]], dtype='int32')
+    W = np.random.random((5, 2)).astype('float32')
+
+    def build(sparse_updates, optimizer):
+        model = Sequential()
+        model.add(Embedding(5, 2, weights=[W], input_length=2,
+                            sparse_updates=sparse_updates))
+        model.add(Flatten())
+        model.add(Dense(1))
+        model.add(Activation('sigmoid'))
+        model.compile(loss='binary_crossentropy', optimizer=optimizer,
+                      class_mode='binary')
+        return model
+
+    for optimizer in ['sgd', 'adam']:
+        model = build(False, optimizer)
+        sparse_model = build(True, optimizer)
+        sparse_model.set_weights(model.get_weights())
+        model.train_on_batch(X, y)
+        sparse_model.train_on_batch(X, y)
+        W_sparse = K.get_value(sparse_model.trainable_weights[0])
+        # rows absent from the batch are left untouched
+        assert_allclose(W_sparse[[0, 3, 4]], W[[0, 3, 4]])
+        assert_allclose(W_sparse, K.get_value(model.trainable_weights[0]),
+                        rtol=1e-05)
+
+    # the embedding is run outside of the checkpointed segments
+    checkpointed_model = Sequential(checkpoint_every=2)
+    checkpointed_model.add(Embedding(5, 2, weights=[W], input_length=2,
+                                     sparse_updates=True))
+    checkpointed_model.add(Flatten())
+    checkpointed_model.add(Dense(1))
+    checkpointed_model.add(Activation('sigmoid'))
+    checkpointed_model.compile(loss='binary_crossentropy', optimizer='sgd',
+                               class_mode='binary')
+    checkpointed_model.train_on_batch(X, y)
+    W_sparse = K.get_value(checkpointed_model.trainable_weights[0])
+    assert_allclose(W_sparse[[0, 3, 4]], W[[0, 3, 4]])
+    assert not np.allclose(W_sparse[[1, 2]], W[[1, 2]])
+
+    # only the last lookup would be updated
+    embedding = Embedding(5, 2, input_length=2, sparse_updates=True)
+    loss = K.sum(embedding.get_output(train=True))
+    loss += K.sum(embedding.get_output(train=True))
+    with pytest.raises(Exception):
+        SGD().get_updates(embedding.trainable_weights,
+                          embedding.constraints, loss)
+
+    with pytest.raises(Exception):
+        Embedding(5, 2, sparse_updates=True,
+                  activity_regularizer=activity_l2())
+
+
+def test_hashed_embedding():
+    X = np.array([[1, 2 ** 31 - 2], [123456789, 1]], dtype='int32')
+    model = Sequential()
+    model.add(HashedEmbedding(10, 3, nb_hashes=2, input_length=2))
+    model.compile(loss='mse', optimizer='sgd')
+    out = model.predict(X)
+    assert out.shape == (2, 2, 3)
+    assert_allclose(out[0, 0], out[1, 1])
+
+    buckets = K.eval(model.layers[0].get_buckets(K.variable(X, dtype='int32')))
+    assert buckets.shape == (2, 2, 2)
+    assert buckets.min() >= 0 and buckets.max() < 10
+
+
 if __name__ == '__main__':
     pytest.main([__file__])
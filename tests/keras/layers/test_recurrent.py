@@ -103,6 +103,44 @@ def test_LSTM():
     _runner(recurrent.LSTM)
 
 
+def test_packed_sequences():
+    a = np.array([[1, 2, 3], [4, 5, 6]])
+    packed = np.array([[a.ravel(), [1, 1, 1, 2, 2, 2]]])
+
+    for layer_class in [recurrent.SimpleRNN, recurrent.GRU, recurrent.LSTM]:
+        for go_backwards in [False, True]:
+            model = Sequential()
+            model.add(embeddings.Embedding(embedding_num, embedding_dim, input_length=3))
+            model.add(layer_class(output_dim, return_sequences=True,
+                                  go_backwards=go_backwards))
+            model.compile(loss='mse', optimizer='sgd')
+
+            packed_model = Sequential()
+            packed_model.add(embeddings.Embedding(embedding_num, embedding_dim,
+                                                  input_length=6, packed=True))
+            packed_model.add(layer_class(output_dim, return_sequences=True,
+                                         go_backwards=go_backwards))
+            packed_model.compile(loss='mse', optimizer='sgd')
+            packed_model.set_weights(model.get_weights())
+
+            out = model.predict(a)
+            packed_out = packed_model.predict(packed)[0].reshape(out.shape)
+            if go_backwards:
+                # outputs come in the order of iteration
+                packed_out = packed_out[::-1]
+            assert_allclose(packed_out, out, atol=1e-5)
+
+            y = np.random.random((1, 6, output_dim))
+            packed_model.train_on_batch(packed, y)
+
+    # Bidirectional assumes binary masks padded at the start
+    model = Sequential()
+    model.add(embeddings.Embedding(embedding_num, embedding_dim,
+                                   input_length=6, packed=True))
+    with pytest.raises(Exception):
+        model.add(recurrent.Bidirectional(recurrent.LSTM(output_dim)))
+
+
 def test_batch_input_shape_serialization():
     model = Sequential()
     model.add(embeddings.Embedding(2, 2,
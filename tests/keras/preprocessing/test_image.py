@@ -1,3 +1,7 @@
+import pytest
+import numpy as np
+
+
 # import pytest
 # from keras.preprocessing.image import *
 # from PIL import Image
@@ -57,3 +61,166 @@
 
 # if __name__ == '__main__':
 #     pytest.main([__file__])
+
+
+def test_apply_transform():
+    from keras.preprocessing.image import (apply_transform, transform_matrix_offset_center,
+                                           rotation_matrix, shift_matrix, zoom_matrix)
+    x = np.random.random((3, 16, 16)).astype('float32')
+    # a single interpolation resamples all the channels
+    matrix = transform_matrix_offset_center(rotation_matrix(90), 16, 16)
+    assert np.allclose(apply_transform(x, matrix), np.rot90(x, 3, axes=(1, 2)), atol=1e-5)
+    shifted = apply_transform(x, shift_matrix(3, 2))
+    assert np.allclose(shifted[:, 2:, 3:], x[:, :-2, :-3])
+    matrix = transform_matrix_offset_center(zoom_matrix(1., 1.), 16, 16)
+    assert np.allclose(apply_transform(x, matrix), x)
+
+
+def test_random_transform():
+    from keras.preprocessing.image import ImageDataGenerator, random_channel_shift
+    x = np.random.random((3, 16, 16)).astype('float32')
+    shifted = random_channel_shift(x, 0.5)
+    assert shifted.min() >= x.min() and shifted.max() <= x.max()
+
+    generator = ImageDataGenerator(featurewise_center=False,
+                                   featurewise_std_normalization=False,
+                                   rotation_range=20.,
+                                   width_shift_range=0.1,
+                                   height_shift_range=0.1,
+                                   shear_range=0.3,
+                                   zoom_range=(0.8, 1.2),
+                                   channel_shift_range=0.1,
+                                   fill_mode='constant',
+                                   horizontal_flip=True,
+                                   vertical_flip=True)
+    assert generator.random_transform(x).shape == x.shape
+    generator = ImageDataGenerator(featurewise_center=False,
+                                   featurewise_std_normalization=False)
+    assert np.array_equal(generator.random_transform(x.copy()), x)
+
+
+def test_batch_standardize():
+    from keras.preprocessing.image import ImageDataGenerator
+    X = np.random.random((500, 3, 4, 4)).astype('float32')
+    generator = ImageDataGenerator(featurewise_center=True,
+                                   featurewise_std_normalization=True,
+                                   zca_whitening=True,
+                                   samplewise_center=True,
+                                   samplewise_std_normalization=True)
+    generator.fit(X)
+    batch = generator.standardize_batch(X[:10].copy())
+    assert batch.dtype == np.float32
+    expected = np.array([generator.standardize(x.copy()) for x in X[:10]])
+    assert np.allclose(batch, expected, atol=1e-4)
+
+    generator = ImageDataGenerator(featurewise_center=False,
+                                   featurewise_std_normalization=False,
+                                   channel_shift_range=0.1,
+                                   horizontal_flip=True,
+                                   vertical_flip=True,
+                                   dtype='float64')
+    bX, bY = next(generator.flow(X, np.arange(len(X)), batch_size=32, shuffle=True))
+    assert bX.dtype == np.float64
+    assert bX.shape == (32,) + X.shape[1:]
+    for x, i in zip(bX, bY):
+        assert x.min() >= X[i].min() - 1e-6 and x.max() <= X[i].max() + 1e-6
+
+    # integer batches cannot be standardized
+    with pytest.raises(Exception):
+        ImageDataGenerator(dtype='uint8')
+    X = np.random.randint(0, 256, (100, 3, 4, 4)).astype('uint8')
+    generator = ImageDataGenerator(featurewise_center=False,
+                                   featurewise_std_normalization=False,
+                                   channel_shift_range=50.,
+                                   dtype='uint8')
+    bX, bY = next(generator.flow(X, np.arange(len(X)), batch_size=32))
+    assert bX.dtype == np.uint8
+    for x, i in zip(bX, bY):
+        # shifted values are clipped instead of wrapping around
+        assert x.min() >= X[i].min() and x.max() <= X[i].max()
+        shift = x.astype('int32') - X[i].astype('int32')
+        assert np.all(np.abs(shift) <= 50)
+
+
+def test_flow_from_directory(tmpdir):
+    Image = pytest.importorskip('PIL.Image')
+    from keras.preprocessing.image import ImageDataGenerator
+    for label in ['a', 'b']:
+        subdir = tmpdir.mkdir(label)
+        for n in range(5):
+            imarray = (np.random.rand(30, 40, 3) * 255).astype('uint8')
+            Image.fromarray(imarray).save(str(subdir.join('img_%d.jpg' % n)))
+    tmpdir.join('a', 'notes.txt').write('not an image')
+
+    generator = ImageDataGenerator(featurewise_center=False,
+                                   featurewise_std_normalization=False,
+                                   horizontal_flip=True)
+    flow = generator.flow_from_directory(str(tmpdir), target_size=(16, 20),
+                                         batch_size=4, cache_size=2 ** 20)
+    images = flow.X
+    assert images.shape == (10, 3, 16, 20)
+    assert images.class_indices == {'a': 0, 'b': 1}
+    assert np.array_equal(images.classes, [0] * 5 + [1] * 5)
+    assert np.array_equal(images[[2, 7]][1], images[7])
+
+    bX, bY = next(flow)
+    assert bX.shape == (4, 3, 16, 20)
+    assert bY.shape == (4, 2)
+    assert np.allclose(bY.sum(axis=1), 1)
+
+    flow = generator.flow_from_directory(str(tmpdir), target_size=(16, 20),
+                                         color_mode='grayscale',
+                                         class_mode='sparse', batch_size=10)
+    bX, bY = next(flow)
+    assert bX.shape == (10, 1, 16, 20)
+    assert sorted(bY) == [0] * 5 + [1] * 5
+
+
+def test_streaming_fit(tmpdir):
+    from keras.preprocessing.image import ImageDataGenerator
+    # samples close to a rank 4 subspace
+    factors = np.random.normal(size=(600, 4))
+    X = np.dot(factors, np.random.normal(size=(4, 48))) + 0.01 * np.random.normal(size=(600, 48)) + 2.
+    X = X.reshape((600, 3, 4, 4))
+    flatX = X.reshape((600, -1))
+    standardized = (flatX - flatX.mean(axis=0)) / flatX.std(axis=0)
+    sigma = np.dot(standardized.T, standardized) / len(X)
+    S, U = np.linalg.eigh(sigma)
+
+    generator = ImageDataGenerator(zca_whitening=True, dtype='float64')
+    generator.fit(X, batch_size=64)
+    assert np.allclose(generator.mean, X.mean(axis=0))
+    assert np.allclose(generator.std, X.std(axis=0))
+    expected = np.dot(U / np.sqrt(np.maximum(S, 0) + 10e-6), U.T)
+    assert np.allclose(generator.principal_components, expected, atol=1e-6)
+
+    # low-rank ZCA, fitted from a generator of batches
+    def batches():
+        while 1:
+            for start in range(0, len(X), 50):
+                yield X[start:start + 50], None
+    generator = ImageDataGenerator(zca_whitening=True, dtype='float64')
+    generator.fit(batches(), nb_sample=len(X), zca_rank=4)
+    assert np.allclose(generator.mean, X.mean(axis=0))
+    assert generator.zca_components.shape == (48, 4)
+    assert np.allclose(1. / generator.zca_scales ** 2 - 10e-6, S[::-1][:4], rtol=1e-3)
+    whitened = generator.standardize_batch(X.copy()).reshape((600, -1))
+    eigenvalues = np.linalg.eigvalsh(np.dot(whitened.T, whitened) / len(X))
+    assert np.allclose(eigenvalues[-4:], 1, atol=1e-2)
+
+    path = str(tmpdir.join('statistics.npz'))
+    generator.save_statistics(path)
+    loaded = ImageDataGenerator(zca_whitening=True, dtype='float64')
+    loaded.load_statistics(path)
+    assert loaded.principal_components is None
+    assert np.array_equal(loaded.zca_components, generator.zca_components)
+    assert np.allclose(loaded.standardize_batch(X[:5].copy()),
+                       generator.standardize_batch(X[:5].copy()))
+
+    generator = ImageDataGenerator(rotation_range=10., horizontal_flip=True)
+    generator.fit(X, augment=True, rounds=2, seed=1)
+    assert generator.mean.dtype == np.float32
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
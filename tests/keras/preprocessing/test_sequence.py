@@ -4,8 +4,13 @@ from numpy.testing import assert_allclose
 import pytest
 
 from keras.preprocessing.sequence import pad_sequences
+from keras.preprocessing.sequence import RaggedSequences
+from keras.preprocessing.sequence import bucket_batches
+from keras.preprocessing.sequence import pack_sequences
 from keras.preprocessing.sequence import make_sampling_table
 from keras.preprocessing.sequence import skipgrams
+from keras.preprocessing.sequence import skipgram_batches
+from keras.preprocessing.sequence import make_alias_table, alias_sample
 
 
 def test_pad_sequences():
@@ -27,6 +32,96 @@ def test_pad_sequences():
     b = pad_sequences(a, maxlen=3, value=1)
     assert_allclose(b, [[1, 1, 1], [1, 1, 2], [1, 2, 3]])
 
+    # test ragged sequences, with empty sequences
+    a = [[1], [], [1, 2, 3, 4]]
+    ragged = RaggedSequences.from_sequences(a)
+    for padding in ['pre', 'post']:
+        for truncating in ['pre', 'post']:
+            for maxlen in [None, 2, 5]:
+                b = pad_sequences(a, maxlen=maxlen, padding=padding,
+                                  truncating=truncating, value=-1)
+                c = pad_sequences(ragged, maxlen=maxlen, padding=padding,
+                                  truncating=truncating, value=-1)
+                assert b.dtype == c.dtype == np.int32
+                assert np.all(b == c)
+    b = pad_sequences(a, maxlen=2, truncating='post', padding='post', value=-1)
+    assert_allclose(b, [[1, -1], [-1, -1], [1, 2]])
+    b = pad_sequences(a, dtype='float32', value=0.5)
+    assert b.dtype == np.float32
+    assert_allclose(b, [[0.5, 0.5, 0.5, 1], [0.5] * 4, [1, 2, 3, 4]])
+
+    with pytest.raises(ValueError):
+        pad_sequences(a, truncating='foo')
+
+
+def test_ragged_sequences(tmpdir):
+    a = [[1, 2], [], [3], [4, 5, 6]]
+    ragged = RaggedSequences.from_sequences(a)
+    assert ragged.values.dtype == np.int32
+    assert ragged.offsets.dtype == np.int64
+    assert len(ragged) == 4
+    assert ragged.lengths.tolist() == [2, 0, 1, 3]
+    assert ragged.tolist() == a
+    assert ragged[3].tolist() == [4, 5, 6]
+    assert ragged[-4].tolist() == [1, 2]
+    assert ragged[1:3].tolist() == [[], [3]]
+    assert ragged[::-2].tolist() == [[4, 5, 6], []]
+    assert ragged[[3, 0]].tolist() == [[4, 5, 6], [1, 2]]
+    assert ragged[ragged.lengths > 1].tolist() == [[1, 2], [4, 5, 6]]
+
+    path = str(tmpdir.join('ragged'))
+    ragged.save(path)
+    loaded = RaggedSequences.load(path, mmap_mode='r')
+    assert isinstance(loaded.values, np.memmap)
+    assert loaded.tolist() == a
+    assert loaded[2:].tolist() == [[3], [4, 5, 6]]
+
+
+def test_pack_sequences():
+    a = [[1, 2], [3], [4, 5, 6, 7], [8, 9, 10, 11, 12, 13], [14]]
+    X = pack_sequences(a, maxlen=5)
+    assert X.shape == (4, 2, 5)
+    assert X.dtype == np.int32
+    assert_allclose(X[:, 0], [[1, 2, 3, 0, 0], [4, 5, 6, 7, 0],
+                              [9, 10, 11, 12, 13], [14, 0, 0, 0, 0]])
+    assert_allclose(X[:, 1], [[1, 1, 2, 0, 0], [1, 1, 1, 1, 0],
+                              [1, 1, 1, 1, 1], [1, 0, 0, 0, 0]])
+
+    X = pack_sequences(a, maxlen=7)
+    assert_allclose(X[:, 0], [[1, 2, 3, 4, 5, 6, 7], [8, 9, 10, 11, 12, 13, 14]])
+    assert_allclose(X[:, 1], [[1, 1, 2, 3, 3, 3, 3], [1, 1, 1, 1, 1, 1, 2]])
+
+    y = [np.array(s) * 10 for s in a]
+    X, y_packed = pack_sequences(a, maxlen=5, y=y, truncating='post')
+    assert_allclose(X[2, 0], [8, 9, 10, 11, 12])
+    assert_allclose(y_packed, X[:, 0] * 10)
+
+
+def test_bucket_batches():
+    np.random.seed(1337)
+    sequences = [[i + 1] * (i % 7) for i in range(50)]
+    y = np.arange(50)
+    generator = bucket_batches(sequences, y, batch_size=8, maxlen=5, sort_window=3)
+    for epoch in range(2):
+        seen = []
+        for _ in range(7):
+            X_batch, y_batch = next(generator)
+            lengths = [min(len(sequences[i]), 5) for i in y_batch]
+            assert X_batch.shape == (len(y_batch), max(max(lengths), 1))
+            assert X_batch.dtype == np.int32
+            for x, i in zip(X_batch, y_batch):
+                assert np.all(x[x != 0] == i + 1)
+            seen.extend(y_batch.tolist())
+        assert sorted(seen) == list(range(50))
+
+    # without shuffling, batches are sorted by length
+    generator = bucket_batches(sequences, batch_size=10, shuffle=False)
+    widths = [next(generator).shape[1] for _ in range(5)]
+    assert widths == sorted(widths)
+
+    for shuffle in [True, False]:
+        assert list(bucket_batches([], shuffle=shuffle)) == []
+
 
 def test_make_sampling_table():
     a = make_sampling_table(3)
@@ -49,5 +144,56 @@ def test_skipgrams():
         assert len(l) == 2
 
 
+def test_alias_sample():
+    np.random.seed(1337)
+    p = np.array([0., 1., 2., 5., 0.5])
+    prob, alias = make_alias_table(p)
+    samples = alias_sample(prob, alias, 100000)
+    assert samples.dtype == np.int32
+    frequencies = np.bincount(samples, minlength=len(p)) / 100000.
+    assert_allclose(frequencies, p / p.sum(), atol=0.01)
+
+
+def test_skipgram_batches():
+    np.random.seed(1337)
+    # words are their position + 1, so that couples can be checked
+    sequences = [np.arange(1, 11), np.arange(11, 16), [], [0, 16, 17]]
+    generator = skipgram_batches(sequences, vocabulary_size=18, batch_size=16,
+                                 window_size=2, chunk_size=8)
+    nb_positive = 0
+    for _ in range(20):
+        (words, contexts), labels = next(generator)
+        for x in (words, contexts, labels):
+            assert x.shape == (16,)
+            assert x.dtype == np.int32
+        positive = labels == 1
+        nb_positive += positive.sum()
+        distance = np.abs(words - contexts)[positive]
+        assert np.all((distance >= 1) & (distance <= 2))
+        # couples don't cross sequences
+        assert np.all((words[positive] <= 10) == (contexts[positive] <= 10))
+        assert np.all((words[positive] <= 15) == (contexts[positive] <= 15))
+        assert np.all(words != 0) and np.all(contexts != 0)
+    assert 100 < nb_positive < 220
+
+    # subsampling: words with a sampling probability of 0 are never centers
+    sampling_table = np.ones((18,))
+    sampling_table[1:11] = 0
+    generator = skipgram_batches(sequences, vocabulary_size=18, batch_size=16,
+                                 negative_samples=0., sampling_table=sampling_table)
+    (words, contexts), labels = next(generator)
+    assert np.all(words > 10)
+    assert np.all(labels == 1)
+
+    # a corpus that can't fill a batch raises instead of looping forever
+    generator = skipgram_batches(sequences, vocabulary_size=18, batch_size=16,
+                                 sampling_table=np.zeros((18,)))
+    with pytest.raises(Exception):
+        next(generator)
+    generator = skipgram_batches([[1, 2]], vocabulary_size=18, batch_size=16)
+    with pytest.raises(Exception):
+        next(generator)
+
+
 if __name__ == '__main__':
     pytest.main([__file__])
@@ -30,5 +30,134 @@ def test_tokenizer():
         matrix = tokenizer.texts_to_matrix(texts, mode)
 
 
+def test_sequences_to_matrix():
+    sequences = [[1, 2, 2, 5], [], [3, 3, 3, 12], [4, 1]]
+    tokenizer = Tokenizer(nb_words=6)
+    tokenizer.fit_on_sequences(sequences)
+
+    for mode in ['binary', 'count', 'tfidf', 'freq']:
+        expected = np.zeros((len(sequences), 6))
+        for i, seq in enumerate(sequences):
+            for j in set(seq):
+                if j >= 6:
+                    continue
+                c = float(seq.count(j))
+                if mode == 'count':
+                    expected[i, j] = c
+                elif mode == 'freq':
+                    expected[i, j] = c / len(seq)
+                elif mode == 'binary':
+                    expected[i, j] = 1
+                else:
+                    tf = np.log(c / len(seq))
+                    df = 1 + np.log(1 + tokenizer.index_docs[j] / (1. + len(sequences)))
+                    expected[i, j] = tf / df
+        matrix = tokenizer.sequences_to_matrix(sequences, mode)
+        assert matrix.dtype == np.float64
+        assert np.allclose(matrix, expected)
+        matrix = tokenizer.sequences_to_matrix(sequences, mode, output='csr', dtype='float32')
+        assert matrix.dtype == np.float32
+        assert np.allclose(matrix.toarray(), expected)
+
+    with pytest.raises(Exception):
+        tokenizer.sequences_to_matrix(sequences, 'foo')
+
+
+def test_tokenizer_incremental_fit():
+    texts = ['The cat sat on the mat.',
+             'The dog sat on the log.',
+             'Dogs and cats living together.'] * 5
+    tokenizer = Tokenizer()
+    tokenizer.fit_on_texts(texts)
+
+    incremental = Tokenizer()
+    for i in range(0, len(texts), 4):
+        incremental.fit_on_texts(iter(texts[i:i + 4]))
+    assert incremental.document_count == tokenizer.document_count == len(texts)
+    assert incremental.word_counts == tokenizer.word_counts
+    assert incremental.word_docs == tokenizer.word_docs
+    assert incremental.texts_to_sequences(texts) == tokenizer.texts_to_sequences(texts)
+
+    parallel = Tokenizer()
+    parallel.fit_on_texts(texts, nb_worker=2, chunk_size=2)
+    assert parallel.word_counts == tokenizer.word_counts
+    assert parallel.word_docs == tokenizer.word_docs
+    assert parallel.document_count == len(texts)
+
+    pruned = Tokenizer(min_count=10)
+    pruned.fit_on_texts(texts)
+    assert sorted(pruned.word_index.keys()) == ['on', 'sat', 'the']
+
+    bounded = Tokenizer(max_vocab_size=5)
+    bounded.fit_on_texts(texts, chunk_size=3)
+    assert len(bounded.word_counts) <= 5
+    assert 'the' in bounded.word_index
+
+
+def test_tokenizer_save_load(tmpdir):
+    texts = ['The cat sat on the mat.',
+             'The dog sat on the log.',
+             u'Dogs and cats living together, \xe9t\xe9.']
+    tokenizer = Tokenizer(nb_words=8)
+    tokenizer.fit_on_texts(texts)
+    path = str(tmpdir.join('tokenizer'))
+    tokenizer.save(path)
+
+    for mmap in [True, False]:
+        loaded = Tokenizer.load(path, mmap=mmap)
+        assert loaded.nb_words == 8
+        assert loaded.document_count == 3
+        assert dict(loaded.word_index.items()) == tokenizer.word_index
+        assert dict(loaded.word_counts.items()) == tokenizer.word_counts
+        assert dict(loaded.word_docs.items()) == tokenizer.word_docs
+        assert dict(loaded.index_docs.items()) == tokenizer.index_docs
+        assert loaded.word_index['the'] == tokenizer.word_index['the']
+        assert 'unknown' not in loaded.word_index
+        assert loaded.texts_to_sequences(texts) == tokenizer.texts_to_sequences(texts)
+        assert np.allclose(loaded.texts_to_matrix(texts, 'tfidf'),
+                           tokenizer.texts_to_matrix(texts, 'tfidf'))
+
+    loaded.fit_on_texts(texts)
+    tokenizer.fit_on_texts(texts)
+    assert loaded.word_counts == tokenizer.word_counts
+
+
+def test_texts_to_sequences_batch():
+    texts = ['The cat sat on the mat.',
+             '',
+             'The dog sat on the log.',
+             'Dogs and cats living together.',
+             'A cat\x00dog and a\x01log.']
+    for kwargs in [{}, {'nb_words': 6}, {'char_level': True},
+                   {'hashing': True, 'nb_words': 20}]:
+        tokenizer = Tokenizer(**kwargs)
+        tokenizer.fit_on_texts(texts)
+        sequences = tokenizer.texts_to_sequences(texts)
+        ragged = tokenizer.texts_to_sequences_batch(texts, chunk_size=3)
+        assert ragged.values.dtype == np.int32
+        assert ragged.offsets.dtype == np.int64
+        assert len(ragged) == len(texts)
+        assert ragged.tolist() == sequences
+
+        parallel = tokenizer.texts_to_sequences_batch(texts, nb_worker=2, chunk_size=1)
+        assert np.all(parallel.values == ragged.values)
+        assert np.all(parallel.offsets == ragged.offsets)
+
+
+def test_tokenizer_hashing():
+    texts = ['The cat sat on the mat.',
+             'The dog sat on the log.']
+    tokenizer = Tokenizer(nb_words=50, hashing=True)
+    sequences = tokenizer.texts_to_sequences(texts)
+    assert [len(seq) for seq in sequences] == [6, 6]
+    assert sequences[0][0] == sequences[0][4] == sequences[1][0]
+    assert all([0 < i < 50 for seq in sequences for i in seq])
+    assert sequences == Tokenizer(nb_words=50, hashing=True).texts_to_sequences(texts)
+
+    tokenizer.fit_on_texts(texts)
+    matrix = tokenizer.texts_to_matrix(texts, 'tfidf')
+    assert matrix.shape == (2, 50)
+
+
 if __name__ == '__main__':
     pytest.main([__file__])
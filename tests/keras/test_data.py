@@ -0,0 +1,88 @@
+import pytest
+import numpy as np
+from numpy.testing import assert_allclose
+
+from keras.data import ArrayDataset, NPZDataset, HDF5Dataset, window_shuffle
+
+
+def check_dataset(dataset, array):
+    assert len(dataset) == len(array)
+    assert dataset.shape == array.shape
+    assert dataset.ndim == array.ndim
+    assert dataset.dtype == array.dtype
+    assert_allclose(dataset[3], array[3])
+    assert_allclose(dataset[-1], array[-1])
+    assert_allclose(dataset[5:17], array[5:17])
+    assert_allclose(dataset[::7], array[::7])
+    indices = [31, 2, 17, 2, -4]
+    assert_allclose(dataset[indices], array[indices])
+    mask = np.arange(len(array)) % 3 == 0
+    assert_allclose(dataset[mask], array[mask])
+
+    # rows read in the background are returned by the next gather
+    indices = np.random.permutation(len(array))[:10]
+    dataset.prefetch(indices)
+    assert_allclose(dataset[indices.tolist()], array[indices])
+    dataset.prefetch(indices)
+    assert_allclose(dataset[indices[::-1]], array[indices[::-1]])
+
+    subset = dataset.subset(10, 30)
+    assert subset.shape == (20,) + array.shape[1:]
+    assert_allclose(subset[[0, 19, 5]], array[[10, 29, 15]])
+    assert_allclose(subset[-5:], array[25:30])
+
+    mapped = dataset.map(lambda batch: batch.reshape((len(batch), -1)) * 2.)
+    assert mapped.shape == (len(array), int(np.prod(array.shape[1:])))
+    assert_allclose(mapped[[4, 1]], array[[4, 1]].reshape((2, -1)) * 2.)
+
+
+def test_array_dataset(tmpdir):
+    array = np.random.random((50, 3, 2)).astype('float32')
+    check_dataset(ArrayDataset(array), array)
+
+    path = str(tmpdir.join('data.npy'))
+    np.save(path, array)
+    dataset = ArrayDataset(path)
+    assert isinstance(dataset.data, np.memmap)
+    check_dataset(dataset, array)
+
+
+def test_npz_dataset(tmpdir):
+    X = np.random.random((50, 4))
+    y = np.random.randint(0, 10, (50,))
+    path = str(tmpdir.join('data.npz'))
+    np.savez(path, X=X, y=y)
+    check_dataset(NPZDataset(path, 'X'), X)
+    check_dataset(NPZDataset(path, 'y'), y)
+
+    np.savez_compressed(path, X=X)
+    with pytest.raises(Exception):
+        NPZDataset(path, 'X')
+
+
+def test_hdf5_dataset(tmpdir):
+    h5py = pytest.importorskip('h5py')
+    array = np.random.random((50, 3)).astype('float32')
+    path = str(tmpdir.join('data.h5'))
+    with h5py.File(path, 'w') as f:
+        f.create_dataset('X', data=array, chunks=(8, 3))
+    dataset = HDF5Dataset(path, 'X')
+    check_dataset(dataset, array)
+    dataset.close()
+
+
+def test_window_shuffle():
+    index_array = np.arange(1000)
+    shuffled = window_shuffle(index_array, 100)
+    assert_allclose(np.sort(shuffled), index_array)
+    assert not np.array_equal(shuffled, index_array)
+    # each window of the output is a window of the input
+    windows = shuffled.reshape((10, 100)) // 100
+    assert np.all(windows == windows[:, :1])
+
+    shuffled = window_shuffle(np.arange(250), 100)
+    assert_allclose(np.sort(shuffled), np.arange(250))
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -458,6 +458,229 @@ def test_sequential_count_params():
     assert(n == model.count_params())
 
 
+def test_sequential_checkpoint():
+    (X_train, y_train), (X_test, y_test) = _get_test_data()
+
+    def build(checkpoint_every):
+        model = Sequential(checkpoint_every=checkpoint_every)
+        model.add(Dense(nb_hidden, input_shape=(input_dim,)))
+        model.add(Activation('relu'))
+        model.add(Dense(nb_hidden))
+        model.add(Activation('relu'))
+        model.add(Dense(nb_class))
+        model.add(Activation('softmax'))
+        model.compile(loss='categorical_crossentropy', optimizer='sgd')
+        return model
+
+    model = build(None)
+    checkpointed_model = build(2)
+    checkpointed_model.set_weights(model.get_weights())
+    loss = model.train_on_batch(X_train[:batch_size], y_train[:batch_size])
+    checkpointed_loss = checkpointed_model.train_on_batch(X_train[:batch_size],
+                                                          y_train[:batch_size])
+    assert np.allclose(loss, checkpointed_loss)
+    for w, cw in zip(model.get_weights(), checkpointed_model.get_weights()):
+        assert np.allclose(w, cw)
+    # the layer inputs are not left overridden
+    for layer in checkpointed_model.layers:
+        assert 'get_input' not in layer.__dict__
+
+    config = checkpointed_model.get_config()
+    assert config['checkpoint_every'] == 2
+    json_str = checkpointed_model.to_json()
+    model_from_json(json_str)
+
+
+def test_sequential_checkpoint_stochastic():
+    # layers with updates or random draws are run outside of the segments
+    from keras.layers.core import Dropout
+    from keras.layers.normalization import BatchNormalization
+    (X_train, y_train), (X_test, y_test) = _get_test_data()
+
+    model = Sequential(checkpoint_every=2)
+    model.add(Dense(nb_hidden, input_shape=(input_dim,)))
+    model.add(Activation('relu'))
+    model.add(BatchNormalization())
+    model.add(Dense(nb_hidden))
+    model.add(Dropout(0.5))
+    model.add(Activation('relu'))
+    model.add(Dense(nb_class))
+    model.add(Activation('softmax'))
+    model.compile(loss='categorical_crossentropy', optimizer='sgd')
+
+    bn = model.layers[2]
+    running_mean = K.get_value(bn.running_mean)
+    model.train_on_batch(X_train[:batch_size], y_train[:batch_size])
+    assert not np.allclose(running_mean, K.get_value(bn.running_mean))
+
+    # the dropout mask is resampled at each call
+    get_output = K.function([model.get_input(train=True)],
+                            [model.get_output(train=True)])
+    X = X_train[:batch_size]
+    assert not np.allclose(get_output([X])[0], get_output([X])[0])
+
+
+def test_sequential_sparse_input():
+    sparse = pytest.importorskip('scipy.sparse')
+    (X_train, y_train), (X_test, y_test) = _get_test_data()
+    X_train[X_train < 0.5] = 0
+    X_test[X_test < 0.5] = 0
+    X_train_csr = sparse.csr_matrix(X_train)
+    X_test_csr = sparse.csr_matrix(X_test)
+
+    def build(sparse_input):
+        model = Sequential()
+        model.add(Dense(nb_hidden, input_shape=(input_dim,),
+                        sparse_input=sparse_input))
+        model.add(Activation('relu'))
+        model.add(Dense(nb_class))
+        model.add(Activation('softmax'))
+        model.compile(loss='categorical_crossentropy', optimizer='sgd')
+        return model
+
+    model = build(False)
+    sparse_model = build(True)
+    sparse_model.set_weights(model.get_weights())
+
+    loss = model.train_on_batch(X_train[:batch_size], y_train[:batch_size])
+    sparse_loss = sparse_model.train_on_batch(X_train_csr[:batch_size],
+                                              y_train[:batch_size])
+    assert np.allclose(loss, sparse_loss)
+
+    sparse_model.fit(X_train_csr, y_train, batch_size=batch_size, nb_epoch=nb_epoch,
+                     show_accuracy=True, verbose=0, shuffle=True,
+                     validation_data=(X_test_csr, y_test))
+    sparse_model.evaluate(X_test_csr, y_test, verbose=0)
+    pred = sparse_model.predict(X_test_csr, verbose=0)
+    assert pred.shape == (X_test.shape[0], nb_class)
+
+    # a dense model can also be fed with sparse matrices, which are densified
+    model.predict(X_test_csr, verbose=0)
+
+    config = sparse_model.get_config()
+    assert config['layers'][0]['sparse_input']
+
+
+def test_dataset_input(tmpdir):
+    from keras.data import ArrayDataset, NPZDataset
+    (X_train, y_train), (X_test, y_test) = _get_test_data()
+    path = str(tmpdir.join('data.npz'))
+    np.savez(path, X_train=X_train, y_train=y_train)
+    X = NPZDataset(path, 'X_train', shuffle_window=500)
+    y = NPZDataset(path, 'y_train')
+    labels = ArrayDataset(y_train.argmax(axis=1))
+
+    model = Sequential()
+    model.add(Dense(nb_hidden, input_shape=(input_dim,)))
+    model.add(Activation('relu'))
+    model.add(Dense(nb_class))
+    model.add(Activation('softmax'))
+    model.compile(loss='categorical_crossentropy', optimizer='sgd')
+
+    model.fit(X, y, batch_size=batch_size, nb_epoch=nb_epoch, verbose=0,
+              validation_data=(ArrayDataset(X_test), ArrayDataset(y_test)))
+    model.fit(X, y, batch_size=batch_size, nb_epoch=nb_epoch, verbose=0,
+              validation_split=0.1, class_weight={0: 1, 1: 2, 2: 1, 3: 1})
+    loss = model.evaluate(X, y, verbose=0)
+    assert np.allclose(loss, model.evaluate(X_train, y_train, verbose=0))
+    assert np.allclose(model.predict(X, verbose=0), model.predict(X_train, verbose=0))
+
+    model = Sequential()
+    model.add(Dense(1, input_shape=(input_dim,)))
+    model.compile(loss='mse', optimizer='sgd')
+    model.fit(X, labels, batch_size=batch_size, nb_epoch=nb_epoch, verbose=0)
+
+    graph = Graph()
+    graph.add_input(name='input1', input_shape=(input_dim,))
+    graph.add_node(Dense(nb_class), name='dense1', input='input1')
+    graph.add_output(name='output1', input='dense1')
+    graph.compile('rmsprop', {'output1': 'mse'})
+    graph.fit({'input1': X, 'output1': y}, batch_size=batch_size,
+              nb_epoch=nb_epoch, verbose=0, validation_split=0.1)
+    out = graph.predict({'input1': X}, verbose=0)
+    assert out['output1'].shape == (len(X), nb_class)
+
+
+def test_uint8_input():
+    from keras.layers.core import Rescale
+    (X_train, y_train), (X_test, y_test) = _get_test_data()
+    X_train = np.random.randint(0, 256, X_train.shape).astype('uint8')
+
+    model = Sequential()
+    model.add(Rescale(1. / 255, input_shape=(input_dim,), input_dtype='uint8'))
+    model.add(Dense(nb_class))
+    model.add(Activation('softmax'))
+    model.compile(loss='categorical_crossentropy', optimizer='sgd')
+    model.fit(X_train, y_train, batch_size=batch_size, nb_epoch=nb_epoch, verbose=0)
+    assert model.predict(X_train[:10]).shape == (10, nb_class)
+
+    json_str = model.to_json()
+    model_from_json(json_str)
+
+    graph = Graph()
+    graph.add_input(name='input1', input_shape=(input_dim,), dtype='uint8')
+    graph.add_node(Rescale(1. / 255), name='rescale', input='input1')
+    graph.add_node(Dense(nb_class), name='dense1', input='rescale')
+    graph.add_output(name='output1', input='dense1')
+    graph.compile('rmsprop', {'output1': 'mse'})
+    graph.fit({'input1': X_train, 'output1': y_train}, batch_size=batch_size,
+              nb_epoch=nb_epoch, verbose=0)
+
+
+def test_bucket_by_length():
+    from keras.layers.embeddings import Embedding
+    from keras.layers.recurrent import LSTM
+    np.random.seed(1337)
+    sequences = [np.random.randint(1, 10, np.random.randint(1, 20))
+                 for _ in range(100)]
+    y = np_utils.to_categorical(np.random.randint(0, nb_class, 100))
+
+    model = Sequential()
+    model.add(Embedding(10, 8, mask_zero=True))
+    model.add(LSTM(nb_hidden))
+    model.add(Dense(nb_class))
+    model.add(Activation('softmax'))
+    model.compile(loss='categorical_crossentropy', optimizer='sgd')
+    history = model.fit(sequences, y, batch_size=batch_size, nb_epoch=2,
+                        verbose=0, bucket_by_length=True)
+    assert len(history.history['loss']) == 2
+    with pytest.raises(Exception):
+        model.fit(sequences, y, validation_split=0.1, bucket_by_length=True)
+
+
+def test_standardize_dtypes():
+    from keras.models import standardize_dtypes
+    placeholders = [K.placeholder(ndim=2), K.placeholder(ndim=2, dtype='uint8')]
+    X = np.random.random((10, 3))
+    X_int = np.random.randint(0, 256, (10, 3))
+    X_std, X_int_std = standardize_dtypes([X, X_int], placeholders)
+    assert X_std.dtype == K.floatx()
+    assert X_int_std.dtype == 'uint8'
+    np.testing.assert_allclose(X_std, X, rtol=1e-6)
+    np.testing.assert_array_equal(X_int_std, X_int)
+
+    # arrays of the right dtype are not copied
+    ins = standardize_dtypes([X_std, X_int_std], placeholders)
+    assert ins[0] is X_std and ins[1] is X_int_std
+
+    # lossy conversions are rejected
+    with pytest.raises(Exception):
+        standardize_dtypes([X, X], placeholders)
+    with pytest.raises(Exception):
+        standardize_dtypes([X, X_int + 256], placeholders)
+
+    # training data is converted once, and predictions are floatX
+    (X_train, y_train), (X_test, y_test) = _get_test_data()
+    model = Sequential()
+    model.add(Dense(nb_class, input_shape=(input_dim,)))
+    model.add(Activation('softmax'))
+    model.compile(loss='categorical_crossentropy', optimizer='sgd')
+    model.fit(X_train.astype('float64'), y_train.astype('int32'),
+              batch_size=batch_size, nb_epoch=nb_epoch, verbose=0)
+    assert all(x.dtype == K.floatx() for x in model.training_data)
+    assert model.predict(X_test.astype('float64')).dtype == K.floatx()
+
+
 def test_siamese_1():
     (X_train, y_train), (X_test, y_test) = _get_test_data()
     left = Sequential()
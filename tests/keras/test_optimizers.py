@@ -1,11 +1,14 @@
 from __future__ import print_function
 import pytest
 
+import numpy as np
+
 from keras.utils.test_utils import get_test_data
 from keras.optimizers import SGD, RMSprop, Adagrad, Adadelta, Adam, Adamax
 from keras.models import Sequential
 from keras.layers.core import Dense, Activation
 from keras.utils.np_utils import to_categorical
+from keras import backend as K
 
 
 (X_train, y_train), (X_test, y_test) = get_test_data(nb_train=1000,
@@ -26,9 +29,10 @@ def get_model(input_dim, nb_hidden, output_dim):
     return model
 
 
-def _test_optimizer(optimizer, target=0.9):
+def _test_optimizer(optimizer, target=0.9, accumulate_steps=1):
     model = get_model(X_train.shape[1], 10, y_train.shape[1])
-    model.compile(loss='categorical_crossentropy', optimizer=optimizer)
+    model.compile(loss='categorical_crossentropy', optimizer=optimizer,
+                  accumulate_steps=accumulate_steps)
     history = model.fit(X_train, y_train, nb_epoch=12, batch_size=16,
                         validation_data=(X_test, y_test),
                         show_accuracy=True, verbose=2)
@@ -62,5 +66,36 @@ def test_adamax():
     _test_optimizer(Adamax())
 
 
+def test_accumulate_steps():
+    model = get_model(X_train.shape[1], 10, y_train.shape[1])
+    model.compile(loss='categorical_crossentropy', optimizer=SGD(lr=0.1),
+                  accumulate_steps=2)
+    weights = model.get_weights()
+    model.train_on_batch(X_train[:16], y_train[:16])
+    for w, new_w in zip(weights, model.get_weights()):
+        assert np.allclose(w, new_w)
+    model.train_on_batch(X_train[16:32], y_train[16:32])
+    assert any([not np.allclose(w, new_w)
+                for w, new_w in zip(weights, model.get_weights())])
+
+    # the update is the step of the averaged gradient, i.e. a single
+    # step on the concatenated batch
+    reference = get_model(X_train.shape[1], 10, y_train.shape[1])
+    reference.compile(loss='categorical_crossentropy', optimizer=SGD(lr=0.1))
+    reference.set_weights(weights)
+    reference.train_on_batch(X_train[:32], y_train[:32])
+    for w, ref_w in zip(model.get_weights(), reference.get_weights()):
+        assert np.allclose(w, ref_w, atol=1e-6)
+    _test_optimizer(SGD(lr=0.02, momentum=0.9), accumulate_steps=2)
+
+    # the last, partial group of an epoch is discarded
+    model.set_weights(weights)
+    model.fit(X_train[:48], y_train[:48], batch_size=16, nb_epoch=1,
+              shuffle=False, verbose=0)
+    for w, ref_w in zip(model.get_weights(), reference.get_weights()):
+        assert np.allclose(w, ref_w, atol=1e-6)
+    assert K.get_value(model.optimizer.accumulated_steps) == 0
+
+
 if __name__ == '__main__':
     pytest.main([__file__])
@@ -0,0 +1,50 @@
+import pytest
+import numpy as np
+from numpy.testing import assert_allclose
+
+h5py = pytest.importorskip('h5py')
+from keras.utils.io_utils import HDF5Matrix
+
+
+def _create_dataset(path, chunks):
+    data = np.random.random((200, 3, 4)).astype('float32')
+    f = h5py.File(path, 'w')
+    f.create_dataset('data', data=data, chunks=chunks)
+    f.close()
+    return data
+
+
+@pytest.mark.parametrize('chunks', [None, (16, 3, 4)])
+def test_hdf5matrix(tmpdir, chunks):
+    path = str(tmpdir.join('test.h5'))
+    data = _create_dataset(path, chunks)
+
+    X = HDF5Matrix(path, 'data', 20, 180, cache_size=4 * 16 * 48)
+    assert len(X) == 160
+    assert X.shape == (160, 3, 4)
+    assert_allclose(X[5], data[25])
+    assert_allclose(X[-1], data[179])
+    assert_allclose(X[10:30], data[30:50])
+
+    # unsorted indices, with duplicates
+    indices = np.random.permutation(160)[:50]
+    indices[1] = indices[0]
+    assert_allclose(X[indices], data[20 + indices])
+    assert_allclose(X[indices.tolist()], data[20 + indices])
+    X.prefetch(indices)
+    assert_allclose(X[indices], data[20 + indices])
+    with pytest.raises(IndexError):
+        X[[0, 160]]
+
+    normalized = HDF5Matrix(path, 'data', normalizer=lambda x: x * 2)
+    assert normalized.shape == (200, 3, 4)
+    assert_allclose(normalized[[3, 1]], data[[3, 1]] * 2)
+
+    X.close()
+    assert HDF5Matrix.refs[path] == 1
+    normalized.close()
+    assert path not in HDF5Matrix.files
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])